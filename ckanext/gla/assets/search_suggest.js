@@ -0,0 +1,56 @@
+// Suggest datasets, organisations and projects as the user types in
+// the search box, and go straight to one when it's picked.
+(function() {
+    var input = document.getElementById('field-giant-search');
+    var list = document.getElementById('search-suggestions');
+    if (!input || !list) {
+        return;
+    }
+
+    var urls = {};
+    var timer = null;
+    var latest = 0;
+
+    function showSuggestions(suggestions) {
+        urls = {};
+        list.innerHTML = '';
+        suggestions.forEach(function(suggestion) {
+            var option = document.createElement('option');
+            option.value = suggestion.title;
+            option.label = suggestion.kind === 'dataset' ? '' : suggestion.kind;
+            urls[suggestion.title] = suggestion.url;
+            list.appendChild(option);
+        });
+    }
+
+    function fetchSuggestions() {
+        var q = input.value.trim();
+        if (q.length < 2) {
+            showSuggestions([]);
+            return;
+        }
+        var request = ++latest;
+        var xhr = new XMLHttpRequest();
+        xhr.open('GET', input.dataset.suggestUrl + '?q=' + encodeURIComponent(q), true);
+        xhr.onload = function() {
+            // Ignore responses to earlier keystrokes that arrive late
+            if (xhr.status === 200 && request === latest) {
+                showSuggestions(JSON.parse(xhr.responseText).suggestions);
+            }
+        };
+        xhr.send();
+    }
+
+    input.addEventListener('input', function(event) {
+        // Picking a suggestion from the list replaces the whole value:
+        // Chrome fires a plain Event, Firefox an InputEvent with this
+        // inputType
+        var typed = event instanceof InputEvent && event.inputType !== 'insertReplacementText';
+        if (!typed && urls[input.value]) {
+            window.location.href = urls[input.value];
+            return;
+        }
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, 100);
+    });
+})();
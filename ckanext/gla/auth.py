@@ -2,9 +2,10 @@ import logging
 import os
 import re
 import string
-from typing import Any
+from typing import Any, Optional
 
 from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import case, func, or_
 from sqlalchemy.orm.attributes import flag_modified
 
 import ckan.lib.navl.dictization_functions as df
@@ -12,19 +13,87 @@ from ckan import authz, model
 from ckan.common import _
 from ckan.types import Context, FlattenDataDict, FlattenErrorDict, FlattenKey
 
+from . import request_cache
+
 logger = logging.getLogger(__name__)
 
 
 SECRET_KEY = os.environ.get("SECURE_TOKEN_GENERATION_SECURITY_KEY")
 
+def get_user_by_login(login: str) -> Optional[model.User]:
+    """Find a user by username or email address, ignoring case.
+
+    Both columns are checked in a single query, which is served by the
+    ``lower(name)`` and ``lower(email)`` indexes added by this
+    extension's migrations (``ckan db upgrade -p gla``). A username
+    match is preferred over an email match, as in CKAN's own
+    authenticator.
+
+    Results are memoised for the rest of the request so the login,
+    MFA, verification and registration flows only hit the database
+    once per address.
+    """
+    if not login:
+        return None
+
+    login = login.lower()
+
+    def _query():
+        name_match = func.lower(model.User.name) == login
+        return (
+            model.Session.query(model.User)
+            .filter(or_(name_match, func.lower(model.User.email) == login))
+            .order_by(case([(name_match, 0)], else_=1))
+            .first()
+        )
+
+    return request_cache.memoise("user_by_login", login, _query)
+
+
+def is_sysadmin(user_name: Optional[str]) -> bool:
+    """``authz.is_sysadmin``, memoised for the rest of the request."""
+    return request_cache.memoise(
+        "is_sysadmin", user_name, lambda: authz.is_sysadmin(user_name), cache_none=True
+    )
+
+
+def is_manager(user_name: Optional[str]) -> bool:
+    """Whether the user can manage at least one organisation, memoised
+    for the rest of the request."""
+    return request_cache.memoise(
+        "is_manager",
+        user_name,
+        lambda: authz.has_user_permission_for_some_org(user_name, "manage_group"),
+        cache_none=True,
+    )
+
+
+def permission_class(user_name: Optional[str]) -> str:
+    """A coarse grouping of users by what they may see and do, for
+    keying shared caches: ``anonymous``, ``user``, ``manager`` or
+    ``sysadmin``."""
+    if not user_name:
+        return "anonymous"
+    if is_sysadmin(user_name):
+        return "sysadmin"
+    if is_manager(user_name):
+        return "manager"
+    return "user"
+
+
+def get_user(id: str) -> Optional[model.User]:
+    """``model.User.get``, memoised for the rest of the request."""
+    return request_cache.memoise("user", id, lambda: model.User.get(id))
+
+
 def _requester_is_sysadmin(context):
     requester = context.get("user", None)
-    return authz.is_sysadmin(requester)
+    return is_sysadmin(requester)
 
 
 def _requester_is_manager(context):
     requester = context.get("user", None)
-    return authz.has_user_permission_for_some_org(requester, "manage_group")
+    return is_manager(requester)
 
 
 def user_list(context, data_dict=None):
@@ -33,6 +102,11 @@ def user_list(context, data_dict=None):
         "success": _requester_is_sysadmin(context) or _requester_is_manager(context)
     }
 
+def bulk_update_boost(context, data_dict=None):
+    """Only sysadmins, who skip auth functions, can bulk edit boosts"""
+    return {"success": False}
+
+
 def user_show(context, data_dict=None):
     """sysadmins can view all user profiles.
     If not a sysadmin, a user can only view their own profile.
@@ -43,7 +117,7 @@ def user_show(context, data_dict=None):
     requester = context.get("user")
     id = data_dict.get("id", None)
     if id:
-        user_obj = model.User.get(id)
+        user_obj = get_user(id)
     else:
         user_obj = data_dict.get("user_obj", None)
     if user_obj:
@@ -141,10 +215,19 @@ def read_email_from_token(token,max_age=None):
     email = serializer.loads(token, salt="email-verification-token", max_age=max_age)
     return email
 
+def generate_profiling_token(user_name):
+    serializer = URLSafeTimedSerializer(SECRET_KEY)
+    return serializer.dumps(user_name, salt="profiling-token")
+
+def read_profiling_token(token,max_age=None):
+    serializer = URLSafeTimedSerializer(SECRET_KEY)
+    user_name = serializer.loads(token, salt="profiling-token", max_age=max_age)
+    return user_name
+
 def verify_user(token, expiration=86400) -> str:
     email = read_email_from_token(token, max_age=expiration)
 
-    user_obj = model.User.by_email(email.lower())
+    user_obj = get_user_by_login(email)
 
     if not user_obj:
         raise Exception("User not found")
@@ -0,0 +1,172 @@
+"""
+Bulk editing of the ranking fields, ``dataset_boost`` and
+``data_quality``.
+
+Changing them through package_update costs a full validation and
+reindex per dataset. ``bulk_update_boost`` instead writes the extras of
+every dataset in one database transaction, with plain SQL so no
+per-dataset reindex is triggered, then sends the new values to Solr
+as a single atomic update (see index_updates.py). The copy_* fields
+that ``search.add_quality_to_search`` boosts on are recomputed by Solr
+from the updated extras.
+"""
+import json
+import logging
+from typing import Any
+
+import ckan.plugins.toolkit as toolkit
+import pysolr
+from ckan import model
+from ckan.lib import search
+from ckan.lib.navl.dictization_functions import Invalid
+from ckan.logic import ValidationError
+from ckan.logic.action.get import _check_access
+from ckan.model.types import make_uuid
+from ckan.types import Context, DataDict
+from sqlalchemy import and_, bindparam, or_
+
+from . import index_generation, index_updates
+from .custom_fields import data_quality_validator, float_validator
+
+log = logging.getLogger(__name__)
+
+FIELDS = {
+    "dataset_boost": float_validator,
+    "data_quality": data_quality_validator,
+}
+
+
+def _validate(datasets: Any) -> dict[str, dict[str, Any]]:
+    """Return the new values keyed by dataset id."""
+    if not datasets or not isinstance(datasets, list):
+        raise ValidationError({"datasets": [toolkit._("Missing value")]})
+
+    references = [d.get("id") for d in datasets if isinstance(d, dict) and isinstance(d.get("id"), str)]
+    packages = dict(
+        model.Session.query(model.Package.name, model.Package.id)
+        .filter(or_(model.Package.id.in_(references), model.Package.name.in_(references)))
+        .all()
+    )
+    packages.update((id_, id_) for id_ in packages.values())
+
+    updates: dict[str, dict[str, Any]] = {}
+    errors: dict[str, list[str]] = {}
+    for i, dataset in enumerate(datasets):
+        if isinstance(dataset, dict) and not isinstance(dataset.get("id"), str):
+            errors[f"{i}.id"] = [toolkit._("Must be a string")]
+            continue
+        if not isinstance(dataset, dict) or dataset["id"] not in packages:
+            errors[str(i)] = [toolkit._("Dataset not found")]
+            continue
+        values = {}
+        for field, validator in FIELDS.items():
+            if field in dataset:
+                try:
+                    values[field] = validator(dataset[field])
+                except Invalid as e:
+                    errors[f"{i}.{field}"] = [e.error]
+        if not values:
+            errors.setdefault(str(i), [toolkit._("Nothing to update")])
+        updates.setdefault(packages[dataset["id"]], {}).update(values)
+
+    if errors:
+        raise ValidationError({"datasets": errors})
+    return updates
+
+
+def _save_extras(updates: dict[str, dict[str, Any]]) -> None:
+    table = model.package_extra_table
+    existing = {
+        (package_id, key)
+        for package_id, key in model.Session.query(
+            model.PackageExtra.package_id, model.PackageExtra.key
+        ).filter(
+            model.PackageExtra.package_id.in_(updates),
+            model.PackageExtra.key.in_(FIELDS),
+        )
+    }
+    rows = [
+        {"p_id": package_id, "p_key": key, "new_value": str(value)}
+        for package_id, values in updates.items()
+        for key, value in values.items()
+    ]
+    to_update = [r for r in rows if (r["p_id"], r["p_key"]) in existing]
+    to_insert = [
+        {"id": make_uuid(), "package_id": r["p_id"], "key": r["p_key"],
+         "value": r["new_value"], "state": "active"}
+        for r in rows if (r["p_id"], r["p_key"]) not in existing
+    ]
+
+    if to_update:
+        model.Session.execute(
+            table.update()
+            .where(and_(table.c.package_id == bindparam("p_id"), table.c.key == bindparam("p_key")))
+            .values(value=bindparam("new_value"), state="active"),
+            to_update,
+        )
+    if to_insert:
+        model.Session.execute(table.insert(), to_insert)
+    model.Session.commit()
+
+
+def _update_index(updates: dict[str, dict[str, Any]]) -> list[str]:
+    """Atomically update the indexed datasets, returning the ids of any
+    that need a full reindex instead."""
+    docs = index_updates.fetch(
+        updates, fl="index_id id _version_ validated_data_dict data_dict"
+    )
+
+    solr_docs = []
+    for package_id, doc in docs.items():
+        values = updates[package_id]
+        validated_data_dict = json.loads(doc["validated_data_dict"])
+        validated_data_dict.update(values)
+        data_dict = json.loads(doc["data_dict"])
+        extras = {e["key"]: e for e in data_dict.get("extras", [])}
+        for key, value in values.items():
+            extras.setdefault(key, {"key": key})["value"] = str(value)
+        data_dict["extras"] = list(extras.values())
+
+        solr_doc = {
+            "index_id": doc["index_id"],
+            # Solr rejects the update if the dataset was reindexed since
+            "_version_": doc["_version_"],
+            "validated_data_dict": json.dumps(validated_data_dict),
+            "data_dict": json.dumps(data_dict),
+        }
+        for field in FIELDS:
+            solr_doc[f"extras_{field}"] = str(validated_data_dict.get(field, ""))
+        solr_docs.append(solr_doc)
+
+    index_updates.atomic_set(solr_docs)
+    for package_id in docs:
+        index_generation.bump(package_id)
+    return [package_id for package_id in updates if package_id not in docs]
+
+
+def bulk_update_boost(context: Context, data_dict: DataDict) -> dict[str, int]:
+    """Set the ``dataset_boost`` and/or ``data_quality`` of many datasets
+    at once, without reindexing them. Sysadmins only.
+
+    :param datasets: dicts with the dataset ``id`` (or name) and the new
+        ``dataset_boost`` and/or ``data_quality``
+    :type datasets: list of dicts
+
+    Returns the number of datasets ``updated``, and how many of them had
+    to be ``reindexed`` in full because they weren't in the index or the
+    atomic update failed.
+    """
+    _check_access("bulk_update_boost", context, data_dict)
+    updates = _validate(data_dict.get("datasets"))
+    _save_extras(updates)
+
+    try:
+        reindex = _update_index(updates)
+    except pysolr.SolrError:
+        log.exception("Atomic update of boosts failed, reindexing instead")
+        reindex = list(updates)
+    if reindex:
+        search.rebuild(package_ids=reindex, defer_commit=False)
+        index_generation.committed()
+
+    return {"updated": len(updates), "reindexed": len(reindex)}
@@ -0,0 +1,90 @@
+"""
+Bounded in-process caches.
+
+Every cache the extension keeps in worker memory should be a
+BoundedCache, so it is limited in size, reports hits and misses to
+Prometheus and can be listed through ``caches()``.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from .metrics import CACHE_REQUESTS
+
+_MISSING = object()
+
+_caches: dict[str, "BoundedCache"] = {}
+
+
+class BoundedCache:
+    """A thread safe LRU cache bounded by number of entries and,
+    optionally, by the total size of its values in bytes."""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        _caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                self._entries.move_to_end(key)
+        CACHE_REQUESTS.labels(
+            cache=self.name, result="miss" if entry is _MISSING else "hit"
+        ).inc()
+        return default if entry is _MISSING else entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                _key, (_value, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes if self.max_bytes is not None else None,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def caches() -> dict[str, BoundedCache]:
+    return dict(_caches)
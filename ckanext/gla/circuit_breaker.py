@@ -0,0 +1,164 @@
+"""
+A circuit breaker around Solr.
+
+When Solr is slow or down, every search would otherwise block a worker
+until the HTTP timeout and take the whole site down with it. Each
+worker instead counts consecutive Solr failures; after
+``dfl.search.circuit-breaker-failures`` of them the circuit opens and
+searches fail at once (and are answered from the last known good
+responses where possible, see PatchedPackageSearchQuery._search). After
+``dfl.search.circuit-breaker-reset`` seconds a single probe query is let
+through (half-open), and the circuit closes again if it succeeds.
+
+Solr queries made while handling a request also share a deadline of
+``dfl.search.deadline`` milliseconds, counted from the first query. The
+time remaining is passed to Solr as ``timeAllowed`` and used as the
+HTTP timeout, so a slow Solr can't hold a request for longer than that.
+
+Pages of a cursor walk (see export.py) are the exception. Solr rejects
+``timeAllowed`` with ``cursorMark``, and a streamed export makes as many
+queries as it needs, so each page just gets ``dfl.search.deadline`` as
+its HTTP timeout.
+"""
+import re
+import threading
+import time
+
+import pysolr
+from ckan.common import config
+from flask import g, has_request_context
+
+from .metrics import SOLR_CIRCUIT_TRANSITIONS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Headroom left between Solr giving up on timeAllowed and us giving up
+# on the HTTP request, so Solr can still return its partial results.
+HTTP_TIMEOUT_GRACE = 1.0
+
+
+class SolrUnavailable(pysolr.SolrError):
+    """Raised instead of querying Solr while the circuit is open or the
+    request's deadline has passed."""
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            SOLR_CIRCUIT_TRANSITIONS.labels(state=state).inc()
+
+    def _probe_due(self) -> bool:
+        return time.monotonic() - self.opened_at >= config.get(
+            "dfl.search.circuit-breaker-reset"
+        )
+
+    def rejecting(self) -> bool:
+        """Whether calls would currently be turned away, without taking
+        the half-open probe."""
+        with self._lock:
+            if self.state == OPEN:
+                return not self._probe_due()
+            return self.state == HALF_OPEN and self._probing
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead. In the half-open state only one
+        call at a time is allowed through, as the probe."""
+        with self._lock:
+            if self.state == OPEN and self._probe_due():
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= config.get(
+                "dfl.search.circuit-breaker-failures"
+            ):
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self) -> None:
+        """End a call that neither succeeded nor failed (e.g. a bad
+        query), freeing the half-open probe."""
+        with self._lock:
+            self._probing = False
+
+
+solr = CircuitBreaker()
+
+
+def is_failure(error: Exception) -> bool:
+    """Whether a Solr error means Solr is unhealthy, rather than that the
+    query was bad (a 4xx response, e.g. an invalid sort)."""
+    return not re.search(r"\(HTTP 4\d\d\)", str(error))
+
+
+def remaining_seconds() -> float:
+    """Time left before this request's Solr deadline."""
+    budget = config.get("dfl.search.deadline") / 1000
+    if not has_request_context():
+        return budget
+    deadline = getattr(g, "_gla_solr_deadline", None)
+    if deadline is None:
+        deadline = g._gla_solr_deadline = time.monotonic() + budget
+    return deadline - time.monotonic()
+
+
+def _limit_time(conn: pysolr.Solr, query: dict) -> dict:
+    """The query to send, limited to the time left."""
+    if "cursorMark" in query:
+        conn.timeout = config.get("dfl.search.deadline") / 1000
+        return query
+
+    remaining = remaining_seconds()
+    if remaining <= 0:
+        raise SolrUnavailable("Search deadline exceeded")
+    time_allowed = int(remaining * 1000)
+    if "timeAllowed" in query:
+        time_allowed = min(time_allowed, int(query["timeAllowed"]))
+    conn.timeout = time_allowed / 1000 + HTTP_TIMEOUT_GRACE
+    return dict(query, timeAllowed=time_allowed)
+
+
+def call(conn: pysolr.Solr, query: dict, fn):
+    """Send ``query`` to Solr with ``fn(query)`` through the breaker,
+    within the request's deadline."""
+    query = _limit_time(conn, query)
+    if not solr.allow():
+        raise SolrUnavailable("Search is temporarily unavailable")
+
+    try:
+        result = fn(query)
+    except pysolr.SolrError as e:
+        if is_failure(e):
+            solr.record_failure()
+        else:
+            solr.release()
+        raise
+    except Exception:
+        solr.record_failure()
+        raise
+    solr.record_success()
+    return result
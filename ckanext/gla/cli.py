@@ -0,0 +1,115 @@
+import click
+import ckan.plugins.toolkit as toolkit
+from ckan import model
+from ckan.lib.search import query_for
+
+from . import formats, popularity, reindex_queue, search, warm
+from .loadtest import LoadTest
+
+
+@click.group(short_help="Data for London commands.")
+def gla():
+    pass
+
+
+@gla.command()
+@click.option("--log-file", default=search.logfile, show_default=True, help="Search log to replay.")
+@click.option("--rate", default=5.0, show_default=True, help="Searches started per second.")
+@click.option("--concurrency", default=8, show_default=True, help="Maximum searches in flight.")
+@click.option("--requests", "total", default=500, show_default=True, help="Number of searches to run.")
+@click.option("--url", default=None, help="Search this site over HTTP (e.g. http://localhost:5000) "
+              "instead of calling package_search in-process.")
+@click.pass_context
+def loadtest(ctx, log_file, rate, concurrency, total, url):
+    """Replay logged searches against package_search and report
+    latency, throughput and error rates per query class."""
+    try:
+        searches = list(search.read_logged_searches(log_file))
+    except FileNotFoundError:
+        raise click.ClickException(f"Search log {log_file} not found")
+    if not searches:
+        raise click.ClickException(f"No searches found in {log_file}")
+
+    test = LoadTest(
+        searches,
+        rate=rate,
+        concurrency=concurrency,
+        total=total,
+        app=ctx.meta["flask_app"],
+        base_url=url,
+    )
+    click.echo(f"Replaying {total} searches from {len(searches)} logged searches at {rate}/s...")
+    test.run()
+
+    click.echo(f"{'class':<16}{'requests':>10}{'req/s':>9}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in test.report():
+        click.echo(
+            f"{row['class']:<16}{row['requests']:>10}{row['throughput']:>9.1f}{row['error_rate']:>9.1%}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+        )
+
+
+@gla.command("formats-report")
+@click.option("--all", "show_all", is_flag=True, help="List mapped formats too.")
+def formats_report(show_all):
+    """List the resource formats in the search index that don't belong
+    to any group of the Format facet, most used first."""
+    query = query_for(model.Package)
+    query.run(
+        {"q": "*:*", "rows": 0, "facet.field": ["res_format"], "facet.limit": -1},
+        permission_labels=None,
+    )
+    registry = formats.registry()
+
+    click.echo(f"{'format':<30}{'canonical':<20}{'group':<12}{'datasets':>10}")
+    counts = sorted(query.facets.get("res_format", {}).items(), key=lambda i: -i[1])
+    for raw, count in counts:
+        found = registry.lookup(raw)
+        if found.group is None or show_all:
+            click.echo(f"{raw:<30}{found.name:<20}{found.group or '-':<12}{count:>10}")
+
+
+@gla.command("reindex-flush")
+@click.pass_context
+def reindex_flush(ctx):
+    """Reindex every dataset waiting in the reindex queue now."""
+    with ctx.meta["flask_app"].test_request_context():
+        count = reindex_queue.flush()
+    click.echo(f"Reindexed {count} datasets")
+
+
+@gla.command("warm")
+@click.option("--top", default=None, type=int, help="Number of searches to replay "
+              "(default: dfl.search.warm-queries).")
+@click.option("--concurrency", default=None, type=int, help="Maximum searches in flight "
+              "(default: dfl.search.warm-concurrency).")
+@click.pass_context
+def warm_caches(ctx, top, concurrency):
+    """Replay the most frequent logged searches to warm Solr's caches."""
+    app = ctx.meta["flask_app"]
+    with app.test_request_context():
+        if not (top or toolkit.config.get("dfl.search.warm-queries")):
+            raise click.ClickException("Pass --top or set dfl.search.warm-queries")
+        count = warm.warm(app, top, concurrency)
+    click.echo(f"Warmed {count} searches")
+
+
+@gla.command("popularity-update")
+def popularity_update():
+    """Add the clicks logged since the last run to the popularity
+    scores, and index the scores that changed."""
+    state = popularity.load_state()
+    changed = popularity.fold(state)
+    popularity.prune(state)
+    # Saved before indexing, so a failure doesn't fold the same clicks
+    # again; the datasets are indexed on the next run instead
+    state.pending = sorted(changed.union(state.pending))
+    popularity.save_state(state)
+    indexed = popularity.update_index(state, state.pending)
+    state.pending = []
+    popularity.save_state(state)
+    click.echo(f"Updated the popularity of {len(changed)} datasets, {indexed} of them indexed")
+
+
+def get_commands():
+    return [gla]
@@ -0,0 +1,143 @@
+"""
+HTTP conditional requests for dataset pages and the search API.
+
+Dataset read pages get an ETag derived from the dataset's
+``metadata_modified`` (kept up to date with its resources by
+timestamps.py) and the time it was last indexed, which catches the
+edits that don't change ``metadata_modified``. ``package_search`` API
+responses get one derived from the index generation (see
+index_generation.py). Both also depend on who is asking, since what a
+user sees depends on their permissions.
+
+A request whose ``If-None-Match`` (or, for anonymous dataset pages,
+``If-Modified-Since``) still matches gets a ``304 Not Modified``
+before any template rendering or Solr work happens.
+
+Responses also carry a ``Surrogate-Key`` header naming the dataset and
+organisation they show, so a CDN can purge exactly the affected pages
+when a dataset changes. Cache-Control is left to CKAN
+(``ckan.cache_enabled`` / ``ckan.cache_expires``).
+"""
+import hashlib
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from ckan import authz, model
+from ckan.common import config, current_user
+from ckan.lib.plugins import get_permission_labels
+from flask import Response, g, request, session
+
+from . import auth, index_generation
+
+
+class Validators(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[datetime]
+    surrogate_keys: list[str]
+
+
+def _etag(*parts: object) -> str:
+    value = "\0".join(str(p) for p in (config.get("dfl.etag-salt"),) + parts)
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def _labels() -> str:
+    user_obj = None if current_user.is_anonymous else current_user
+    return ",".join(sorted(get_permission_labels().get_user_dataset_labels(user_obj)))
+
+
+def _dataset(reference: str) -> Optional[Validators]:
+    package = model.Package.get(reference)
+    if package is None or package.state != "active":
+        return None
+
+    keys = [f"dataset-{package.id}"]
+    if package.owner_org:
+        keys.append(f"org-{package.owner_org}")
+
+    indexed_at = index_generation.dataset_indexed_at(package.id)
+    if indexed_at is None:
+        return None
+    modified = max(
+        package.metadata_modified.replace(tzinfo=timezone.utc),
+        datetime.fromtimestamp(indexed_at, timezone.utc),
+    )
+    if current_user.is_anonymous:
+        if package.private:
+            return None
+        return Validators(_etag("dataset", package.id, modified, "anonymous"), modified, keys)
+
+    # Logged in users may see edit links, private datasets and their
+    # follow button, so their pages depend on their role and follows too.
+    name = current_user.name
+    identity = (
+        name,
+        auth.is_sysadmin(name),
+        package.owner_org and authz.users_role_for_group_or_org(package.owner_org, name),
+        _labels(),
+        model.UserFollowingDataset.is_following(current_user.id, package.id),
+    )
+    return Validators(_etag("dataset", package.id, modified, *identity), None, keys)
+
+
+def _search() -> Optional[Validators]:
+    generation = index_generation.current()
+    if generation is None:
+        return None
+    identity = "anonymous" if current_user.is_anonymous else current_user.name
+    return Validators(_etag("search", generation, identity, _labels()), None, ["search"])
+
+
+def _validators() -> Optional[Validators]:
+    view_args = request.view_args or {}
+    if request.endpoint == "dataset.read":
+        return _dataset(view_args["id"])
+    if request.endpoint == "api.action" and view_args.get("logic_function") == "package_search":
+        return _search()
+    if request.endpoint == "dataset.search":
+        return Validators(None, None, ["search"])
+    if request.endpoint == "organization.read":
+        group = model.Group.get(view_args["id"])
+        return Validators(None, None, [f"org-{group.id}", "search"]) if group else None
+    return None
+
+
+def _not_modified(validators: Validators) -> bool:
+    if validators.etag and request.if_none_match:
+        return request.if_none_match.contains_weak(validators.etag)
+    if validators.last_modified and request.if_modified_since:
+        return validators.last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def _set_headers(response: Response, validators: Validators) -> None:
+    if validators.etag:
+        response.set_etag(validators.etag, weak=True)
+    if validators.last_modified:
+        response.last_modified = validators.last_modified
+    if validators.surrogate_keys:
+        response.headers["Surrogate-Key"] = " ".join(validators.surrogate_keys)
+
+
+def check() -> Optional[Response]:
+    """before_request: answer 304 if the client's copy is current."""
+    if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+        return None
+    validators = _validators()
+    if validators is None:
+        return None
+
+    g._gla_conditional = validators
+    if _not_modified(validators):
+        response = Response(status=304)
+        _set_headers(response, validators)
+        return response
+    return None
+
+
+def add_headers(response: Response) -> Response:
+    """after_request: add the validators to successful responses."""
+    validators = getattr(g, "_gla_conditional", None)
+    if validators is not None and response.status_code == 200:
+        _set_headers(response, validators)
+    return response
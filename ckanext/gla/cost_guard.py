@@ -0,0 +1,226 @@
+"""
+A cost guard for package_search API calls.
+
+The API passes almost any search through to Solr: up to
+``ckan.search.rows_max`` rows, each highlighted and decoded, deep
+``start`` offsets, leading wildcards and every value of many facets.
+A few clients making such calls can slow search down for everyone.
+
+Each package_search made through ``/api/`` is scored from the rows it
+returns, its offset, its wildcards, its facets and whether it is
+highlighted, with the weights below. The limits are set per permission
+class (see auth.permission_class) by ``dfl.search.cost-downgrade`` and
+``dfl.search.cost-reject``, as ``class:score`` pairs. A search scoring
+over the downgrade limit is made cheaper, step by step, until it fits:
+highlighting is dropped, then facets are cut to ``search.facets.limit``
+values. The rows asked for are never changed, as a client paging with
+``start`` would silently skip results. A search still over the reject
+limit, e.g. because of its rows, offset or wildcards, is rejected.
+Classes without a limit are never downgraded or rejected.
+
+Downgraded searches say what was changed, and all limited searches
+suggest ``package_search_cursor`` (see export.py), which pages through
+any number of results cheaply.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from ckan.common import _, config, current_user, g, request
+from ckan.lib.search.common import SearchQueryError
+from flask import has_request_context
+
+from . import auth
+from .metrics import SEARCH_COST_DECISIONS
+
+log = logging.getLogger(__name__)
+
+# The cost of each row returned, and each row highlighted
+ROW_COST = 0.1
+HIGHLIGHT_ROW_COST = 0.2
+# The cost of each result skipped by ``start``
+OFFSET_COST = 0.01
+# The cost of each wildcard term, and each with a leading wildcard,
+# which has to scan the whole term dictionary
+WILDCARD_COST = 10.0
+LEADING_WILDCARD_COST = 100.0
+# The cost of each facet field, and each facet value asked for
+FACET_FIELD_COST = 1.0
+FACET_VALUE_COST = 0.01
+# ``facet.limit=-1`` asks for every value
+UNLIMITED_FACET_VALUES = 10000
+
+HINT = (
+    "Use the package_search_cursor action, or /export/datasets.jsonl, "
+    "to page through large numbers of results"
+)
+
+# A term starting with a wildcard, after a space, bracket or field name,
+# but not ``*:*``
+_LEADING_WILDCARD = re.compile(r"(?:^|[\s(:])[*?](?![*?:\s)]|$)")
+_WILDCARD = re.compile(r"[^\s(:*?][*?]")
+# Ranges, whose ``*`` means unbounded, and local parameters
+_RANGES = re.compile(r"\[[^\]]*\]|\{[^}]*\}")
+
+
+@dataclass
+class Decision:
+    permission_class: str
+    score: float
+    changes: list[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "permission_class": self.permission_class,
+            "score": round(self.score, 1),
+            "changes": self.changes,
+            "hint": HINT,
+        }
+
+
+def _limits(key: str) -> dict[str, float]:
+    limits = {}
+    for pair in config.get(key):
+        permission_class, _sep, score = pair.partition(":")
+        try:
+            limits[permission_class] = float(score)
+        except ValueError:
+            log.warning("Ignoring the invalid %s limit %r", key, pair)
+    return limits
+
+
+def _int(value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _rows(search_params: dict[str, Any]) -> int:
+    return max(_int(search_params.get("rows"), 10), 0)
+
+
+def _highlighted(search_params: dict[str, Any]) -> bool:
+    return str(search_params.get("hl", "")).lower() in ("on", "true")
+
+
+def _facet_fields(search_params: dict[str, Any]) -> list[str]:
+    facet_fields = search_params.get("facet.field") or []
+    if str(search_params.get("facet", "true")).lower() == "false":
+        return []
+    return [facet_fields] if isinstance(facet_fields, str) else list(facet_fields)
+
+
+def _query_text(search_params: dict[str, Any]) -> str:
+    """The query syntax sent by the client. Filters are always parsed by
+    the standard query parser, but the query only when it has a field
+    name in it or uses edismax, as dismax ignores wildcards."""
+    text = [str(search_params.get("fq") or "")]
+    q = str(search_params.get("q") or "")
+    if ":" in q or search_params.get("defType") == "edismax":
+        text.append(q)
+    return _RANGES.sub(" ", " ".join(text))
+
+
+def score(search_params: dict[str, Any]) -> float:
+    """The estimated cost of a search, from its package_search
+    parameters."""
+    rows = _rows(search_params)
+    cost = rows * ROW_COST
+    if _highlighted(search_params):
+        cost += rows * HIGHLIGHT_ROW_COST
+    cost += max(_int(search_params.get("start"), 0), 0) * OFFSET_COST
+
+    text = _query_text(search_params)
+    cost += len(_LEADING_WILDCARD.findall(text)) * LEADING_WILDCARD_COST
+    cost += len(_WILDCARD.findall(text)) * WILDCARD_COST
+
+    facet_limit = _int(search_params.get("facet.limit"), config.get("search.facets.limit"))
+    if facet_limit < 0:
+        facet_limit = UNLIMITED_FACET_VALUES
+    cost += len(_facet_fields(search_params)) * (FACET_FIELD_COST + facet_limit * FACET_VALUE_COST)
+    return cost
+
+
+def _drop_highlighting(search_params: dict[str, Any]) -> Optional[str]:
+    if not _highlighted(search_params):
+        return None
+    for key in [key for key in search_params if key == "hl" or key.startswith("hl.") or ".hl." in key]:
+        del search_params[key]
+    return "highlighting dropped"
+
+
+def _cap_facets(search_params: dict[str, Any]) -> Optional[str]:
+    default_limit = config.get("search.facets.limit")
+    facet_limit = _int(search_params.get("facet.limit"), default_limit)
+    if not _facet_fields(search_params) or 0 <= facet_limit <= default_limit:
+        return None
+    search_params["facet.limit"] = default_limit
+    return f"facet.limit capped to {default_limit}"
+
+
+def make_cheaper(search_params: dict[str, Any], limit: float) -> list[str]:
+    """Downgrade the search until it costs at most ``limit``, or can't
+    be made any cheaper, returning the changes made."""
+    changes = []
+    for downgrade in (_drop_highlighting, _cap_facets):
+        if score(search_params) <= limit:
+            break
+        change = downgrade(search_params)
+        if change:
+            changes.append(change)
+    return changes
+
+
+def _is_api_request() -> bool:
+    return has_request_context() and request.path.startswith("/api/")
+
+
+def apply(search_params: dict[str, Any]) -> dict[str, Any]:
+    """Downgrade or reject the search if it costs more than the user's
+    permission class allows. Only API requests are limited; called from
+    before_dataset_search, after the extension's own parameters are
+    added.
+
+    Raises SearchQueryError if the search is rejected.
+    """
+    if not _is_api_request():
+        return search_params
+    user_name = None if current_user.is_anonymous else current_user.name
+    permission_class = auth.permission_class(user_name)
+    downgrade_limit = _limits("dfl.search.cost-downgrade").get(permission_class)
+    reject_limit = _limits("dfl.search.cost-reject").get(permission_class)
+    decision = Decision(permission_class, score(search_params))
+
+    if downgrade_limit is not None:
+        decision.changes = make_cheaper(search_params, downgrade_limit)
+
+    final_score = score(search_params)
+    if reject_limit is not None and final_score > reject_limit:
+        SEARCH_COST_DECISIONS.labels(decision="rejected", permission_class=permission_class).inc()
+        log.info("Rejected a search costing %.1f from a %s user: %r", final_score, permission_class, search_params)
+        raise SearchQueryError(
+            _("This search is too expensive (cost {score:.0f}, limit {limit:.0f}). {hint}").format(
+                score=final_score, limit=reject_limit, hint=_(HINT)
+            )
+        )
+
+    if decision.changes:
+        SEARCH_COST_DECISIONS.labels(decision="downgraded", permission_class=permission_class).inc()
+        g._gla_cost_guard = decision
+    else:
+        SEARCH_COST_DECISIONS.labels(decision="allowed", permission_class=permission_class).inc()
+    return search_params
+
+
+def annotate(search_results: dict[str, Any]) -> dict[str, Any]:
+    """Tell the client how its search was downgraded, if it was. Called
+    from after_dataset_search."""
+    if not has_request_context():
+        return search_results
+    decision: Optional[Decision] = getattr(g, "_gla_cost_guard", None)
+    if decision is not None:
+        g._gla_cost_guard = None
+        search_results["cost_guard"] = decision.as_dict()
+    return search_results
@@ -4,6 +4,9 @@ import requests
 import json
 import os
 
+from . import ranges
+from .search_highlight import fields as highlight_fields
+
 
 solr_endpoint = os.getenv("CKAN_SOLR_URL")
 
@@ -58,9 +61,12 @@ custom_dataset_fields = {
 }
 
 
+# NOTE copy field destinations must not be stored, or atomic updates
+# (see index_updates.py) would copy into them a second time. The
+# numeric ones used in bf boosts are read from docValues instead.
 fields_to_copy = {
-    "extras_data_quality": {"type": "int", "name": "copy_data_quality"},
-    "extras_dataset_boost": {"type": "double", "name": "copy_dataset_boost"},
+    "extras_data_quality": {"type": "int", "name": "copy_data_quality", "docValues": True},
+    "extras_dataset_boost": {"type": "double", "name": "copy_dataset_boost", "docValues": True},
     "title": {"type": "text_phrase_query", "name": "title_phrase"},
     "search_description": {"type": "text_phrase_query", "name": "search_description_phrase"},
     "notes": {"type": "text_phrase_query", "name": "notes_phrase"}
@@ -77,6 +83,16 @@ def field_exists(field_name):
     else:
         raise Exception("An error occurred while checking the field.")
 
+def get_field(field_name):
+    api_url = f"{solr_endpoint}/schema/fields/{field_name}?showDefaults=true"
+    response = requests.get(api_url)
+    if response.status_code == 200:
+        return response.json()["field"]
+    elif response.status_code == 404:
+        return None
+    else:
+        raise Exception("An error occurred while checking the field.")
+
 def field_type_exists(field_type_name):
     api_url = f"{solr_endpoint}/schema/fieldtypes/{field_type_name}"
     response = requests.head(api_url)
@@ -88,14 +104,15 @@ def field_type_exists(field_type_name):
         raise Exception("An error occurred while checking the field.")
     
     
-def add_field(field_name, field_type):
+def add_field(field_name, field_type, stored=True, **properties):
     api_url = f"{solr_endpoint}/schema/fields"
     field_config = {
         "add-field": {
             "name": field_name,
             "type": field_type,
-            "stored": "true",
-            "indexed": "true"
+            "stored": stored,
+            "indexed": True,
+            **properties
         }
     }
     response = requests.post(api_url, json=field_config)
@@ -126,12 +143,23 @@ def add_copy_field(from_field, to_field):
         raise Exception("Failed to add copy field", {"config": copy_field_config,
                                                      "error": response_json})
 
+def unstore_field(field_name, **properties):
+    """Stop storing a copy field destination created before they had to
+    be unstored, keeping the rest of its definition. Needs a reindex to
+    take effect."""
+    field = get_field(field_name)
+    if field is not None and field.get("stored"):
+        add_schema({"replace-field": {**field, "stored": False, **properties}})
+
 def add_copy_fields():
     for field, new_field_conf in fields_to_copy.items():
         new_field = new_field_conf["name"]
+        properties = {k: v for k, v in new_field_conf.items() if k not in ("name", "type")}
         if not field_exists(new_field):
-            add_field(new_field, new_field_conf["type"])
+            add_field(new_field, new_field_conf["type"], stored=False, **properties)
             add_copy_field(field, new_field)
+        else:
+            unstore_field(new_field, **properties)
 
 def add_solr_config():
     # NOTE if you change anything in this function you will likely
@@ -332,12 +360,36 @@ def add_solr_config():
         }})
 
         add_schema(
-            {"add-field": {"name": "dfl_title_sort", "type": "dfl_sortable_text_field"}}
+            {"add-field": {"name": "dfl_title_sort", "type": "dfl_sortable_text_field", "stored": False}}
         )
         add_schema({"add-copy-field": {"source": "title", "dest": ["dfl_title_sort"]}})
         add_schema({"add-field": {"name": "frequency", "type": "text"}})
     
+    else:
+        unstore_field("dfl_title_sort")
+
     if not field_exists("notes_with_markup"):
         add_schema({"add-field": {"name": "notes_with_markup", "type": "text"}})
 
+    for copies in highlight_fields.FIELDS.values():
+        # Offsets in the postings let the unified highlighter skip
+        # re-analysing the text (see search_highlight/fields.py)
+        for copy in copies:
+            if not field_exists(copy):
+                add_field(copy, highlight_fields.field_type(copy), storeOffsetsWithPositions=True)
+
+    # Range filters and sorting (see ranges.py)
+    for name, field_type in (
+        (ranges.COVERAGE_FROM, "date"),
+        (ranges.COVERAGE_TO, "date"),
+        (ranges.TOTAL_SIZE, "long"),
+    ):
+        if not field_exists(name):
+            add_field(name, field_type, docValues=True)
+
+    if not field_exists("dfl_popularity"):
+        # Neither indexed nor stored, so Solr can update the click
+        # popularity scores in place (see popularity.py)
+        add_field("dfl_popularity", "double", stored=False, indexed=False, docValues=True)
+
     add_copy_fields()
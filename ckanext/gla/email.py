@@ -4,7 +4,14 @@ from ckan.common import config
 from ckan.lib.base import render
 from ckan.lib.helpers import url_for
 
-from . import auth
+from . import auth, metrics
+
+
+def _mail_user(kind: str, **kwargs) -> None:
+    with metrics.MAIL_SECONDS.labels(kind=kind).time(), metrics.count_outcome(
+        metrics.MAILS, kind=kind
+    ):
+        Mailer.mail_user(**kwargs)
 
 
 def get_reset_link_html_body(user: model.User) -> str:
@@ -29,7 +36,7 @@ def send_reset_link(user: model.User) -> None:
     # Make sure we only use the first line
     subject = subject.split("\n")[0]
 
-    Mailer.mail_user(user, subject, body, body_html)
+    _mail_user("reset_password", recipient=user, subject=subject, body=body, body_html=body_html)
 
 
 def send_email_verification_link(user_obj) -> None:
@@ -44,7 +51,8 @@ def send_email_verification_link(user_obj) -> None:
     }
     body = render("emails/verify_email.html", extra_vars)
 
-    Mailer.mail_user(
+    _mail_user(
+        "verify_email",
         recipient=user_obj,
         subject="Greater London Authority Datastore: Verify email",
         body=body,
@@ -63,7 +71,8 @@ def send_mfa_login_link(user_obj: model.User) -> None:
         "user_name": user_obj.name,
     }
     body = render("emails/login_link_email.html", extra_vars)
-    Mailer.mail_user(
+    _mail_user(
+        "login_link",
         recipient=user_obj,
         subject="Greater London Authority Datastore: Login link",
         body=body,
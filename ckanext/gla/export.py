@@ -0,0 +1,152 @@
+"""
+Walking the whole catalogue with Solr cursors.
+
+Paging through package_search with ever larger ``start`` offsets makes
+Solr collect and discard every earlier row on each request. A
+``cursorMark`` walk instead resumes from the last sort value seen, so
+every page costs the same and memory use is bounded by the page size,
+however large the catalogue is.
+"""
+import csv
+import io
+import json
+from typing import Any, Iterator
+
+import ckan.plugins.toolkit as toolkit
+from ckan.common import asbool, config
+from ckan.lib import search
+from ckan.logic.action.get import _check_access
+from ckan.types import Context, DataDict
+
+from ckan import model
+
+from .search_highlight.action import permission_labels
+
+# The index's unique key, appended to every sort so the walk order is
+# total, as cursors require.
+TIEBREAK_SORT = "index_id asc"
+
+CSV_FIELDS = [
+    "id", "name", "title", "organization", "private", "state", "license_id",
+    "metadata_created", "metadata_modified", "num_resources", "formats", "url",
+]
+
+
+def _sort(sort: str) -> str:
+    if "index_id" in sort:
+        return sort
+    return f"{sort}, {TIEBREAK_SORT}" if sort else TIEBREAK_SORT
+
+
+@toolkit.side_effect_free
+def package_search_cursor(context: Context, data_dict: DataDict) -> dict[str, Any]:
+    """Return one page of datasets from a cursor walk of the index.
+
+    :param q: the solr query (optional, default: ``"*:*"``)
+    :param fq: any filter queries to apply (optional)
+    :param sort: sorting of the walk; the index id is always appended
+        as a tie break (optional, default: ``"index_id asc"``)
+    :param rows: page size, at most ``dfl.export.page-size`` (the
+        default)
+    :param cursor: the ``next_cursor`` of the previous page, or ``"*"``
+        (the default) to start a new walk
+    :param include_private, include_drafts, include_deleted: as for
+        package_search
+
+    Returns ``results``, ``count`` and ``next_cursor``. The walk is
+    complete when ``next_cursor`` equals the cursor that was passed in.
+    """
+    _check_access("package_search", context, data_dict)
+
+    max_rows = config.get("dfl.export.page-size")
+    try:
+        rows = int(data_dict.get("rows", max_rows))
+    except (TypeError, ValueError):
+        rows = 0
+    if rows < 1:
+        raise toolkit.ValidationError({"rows": [toolkit._("Must be a positive integer")]})
+    rows = min(rows, max_rows)
+    cursor = data_dict.get("cursor") or "*"
+
+    fq = data_dict.get("fq", "")
+    if not asbool(data_dict.get("include_private", False)):
+        fq = "+capacity:public " + fq
+    if "+state" not in fq:
+        states = ["active"]
+        if asbool(data_dict.get("include_drafts", False)):
+            states.append("draft")
+        if asbool(data_dict.get("include_deleted", False)):
+            states.append("deleted")
+        fq += " +state:({})".format(" OR ".join(states))
+
+    query = search.query_for(model.Package)
+    query.run(
+        {
+            "q": data_dict.get("q", ""),
+            "fq": fq,
+            "sort": _sort(data_dict.get("sort", "")),
+            "rows": rows,
+            "cursorMark": cursor,
+            "fl": "id validated_data_dict",
+            "facet": "false",
+        },
+        permission_labels=permission_labels(context),
+    )
+
+    return {
+        "count": query.count,
+        "results": [json.loads(r["validated_data_dict"]) for r in query.results],
+        "next_cursor": query.next_cursor_mark,
+    }
+
+
+def iter_datasets(context: Context, data_dict: DataDict) -> Iterator[dict[str, Any]]:
+    """Yield every dataset matching the search, one page at a time."""
+    data_dict = dict(data_dict, cursor="*")
+    while True:
+        page = toolkit.get_action("package_search_cursor")(dict(context), data_dict)
+        yield from page["results"]
+        if not page["results"] or page["next_cursor"] == data_dict["cursor"]:
+            return
+        data_dict["cursor"] = page["next_cursor"]
+
+
+def iter_jsonl(datasets: Iterator[dict[str, Any]]) -> Iterator[str]:
+    for dataset in datasets:
+        yield json.dumps(dataset) + "\n"
+
+
+def _csv_row(dataset: dict[str, Any]) -> list[Any]:
+    formats = sorted({r.get("format") for r in dataset.get("resources", []) if r.get("format")})
+    site_url = config.get("ckan.site_url")
+    return [
+        dataset.get("id"),
+        dataset.get("name"),
+        dataset.get("title"),
+        (dataset.get("organization") or {}).get("name"),
+        dataset.get("private"),
+        dataset.get("state"),
+        dataset.get("license_id"),
+        dataset.get("metadata_created"),
+        dataset.get("metadata_modified"),
+        dataset.get("num_resources"),
+        " ".join(formats),
+        f"{site_url}/dataset/{dataset.get('name')}",
+    ]
+
+
+def iter_csv(datasets: Iterator[dict[str, Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def _flush() -> str:
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(CSV_FIELDS)
+    yield _flush()
+    for dataset in datasets:
+        writer.writerow(_csv_row(dataset))
+        yield _flush()
@@ -0,0 +1,142 @@
+"""
+Precomputed facet counts for anonymous landing pages.
+
+The unfiltered ``/dataset`` and organisation pages ask Solr to count
+every GLA facet on every anonymous hit, though the counts only change
+when datasets are (re)indexed. For searches with no query, no facet
+selections and anonymous permissions we keep the facet counts of the
+first search as a snapshot, tagged with the index generation (see
+index_generation.py). Later searches send Solr only the cheap
+results-only query and take their facets from the snapshot.
+
+Once the index generation moves on, or the snapshot is older than
+``dfl.search.facet-snapshot-max-age``, the stale snapshot is still
+served while a background thread recounts the facets
+(stale-while-revalidate).
+"""
+import copy
+import logging
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+
+from ckan.common import asbool, config
+from ckan.lib.plugins import get_permission_labels
+from ckan.lib.search.common import make_connection
+
+from . import circuit_breaker, index_generation
+from .cache import BoundedCache
+from .metrics import FACET_SNAPSHOT_REFRESHES, count_outcome
+from .singleflight import query_key
+
+log = logging.getLogger(__name__)
+
+
+class Snapshot(NamedTuple):
+    facets: dict[str, dict[str, int]]
+    generation: Optional[int]
+    computed_at: float
+
+
+_snapshots = BoundedCache("facet_snapshots", max_entries=256)
+_refreshing: set[str] = set()
+_lock = threading.Lock()
+
+
+def facet_dicts(facet_fields: dict[str, list[Any]]) -> dict[str, dict[str, int]]:
+    """Convert Solr's flat [value, count, ...] facet lists to dicts."""
+    return {
+        field: dict(zip(values[0::2], values[1::2]))
+        for field, values in facet_fields.items()
+    }
+
+
+class Lookup:
+    """The snapshot state of one eligible search."""
+
+    def __init__(self, key: str, query: dict[str, Any]):
+        self.key = key
+        self.generation = index_generation.current()
+        self.facets: Optional[dict[str, dict[str, int]]] = None
+
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            return
+        self.facets = copy.deepcopy(snapshot.facets)
+
+        max_age = config.get("dfl.search.facet-snapshot-max-age")
+        if (
+            self.generation is None
+            or snapshot.generation != self.generation
+            or time.time() - snapshot.computed_at > max_age
+        ):
+            _refresh_in_background(key, query)
+
+    def store(self, facets: dict[str, dict[str, int]]) -> None:
+        """Keep the facets counted by a full search as the snapshot."""
+        if self.generation is not None:
+            _snapshots.set(
+                self.key, Snapshot(copy.deepcopy(facets), self.generation, time.time())
+            )
+
+
+def lookup(query: dict[str, Any], permission_labels: Optional[list[str]]) -> Optional[Lookup]:
+    """Return the snapshot lookup for a search, or None if its facets
+    can't be served from a snapshot.
+
+    ``query`` must be the final Solr parameters, as built by
+    PatchedPackageSearchQuery.run.
+    """
+    if not config.get("dfl.search.facet-snapshot"):
+        return None
+    if query.get("q") != "*:*" or not asbool(query.get("facet")) or "cursorMark" in query:
+        return None
+    if permission_labels is None or sorted(permission_labels) != sorted(
+        get_permission_labels().get_user_dataset_labels(None)
+    ):
+        return None
+    # Multi-select facet selections are tagged filters (see
+    # GlaPlugin.before_dataset_search), so their counts depend on the
+    # selection.
+    if any("{!tag=" in fq for fq in query.get("fq", [])):
+        return None
+
+    facet_params = {k: v for k, v in query.items() if k == "fq" or k.startswith("facet")}
+    return Lookup(query_key(facet_params), query)
+
+
+def _refresh_in_background(key: str, query: dict[str, Any]) -> None:
+    if circuit_breaker.solr.rejecting():
+        return
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    params = dict(query, rows=0, start=0, hl="false")
+    threading.Thread(
+        target=_refresh, args=(key, params), name="gla-facet-snapshot", daemon=True
+    ).start()
+
+
+def _refresh(key: str, params: dict[str, Any]) -> None:
+    try:
+        generation = index_generation.current()
+        with count_outcome(FACET_SNAPSHOT_REFRESHES):
+            response = make_connection(decode_dates=False).search(**params)
+        # Only keep the counts if nothing was indexed while we were
+        # counting; otherwise the next search triggers another recount.
+        if generation is not None and generation == index_generation.current():
+            _snapshots.set(
+                key,
+                Snapshot(
+                    facet_dicts(response.facets.get("facet_fields", {})),
+                    generation,
+                    time.time(),
+                ),
+            )
+    except Exception:
+        log.warning("Could not refresh facet snapshot", exc_info=True)
+    finally:
+        with _lock:
+            _refreshing.discard(key)
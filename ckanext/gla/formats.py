@@ -0,0 +1,88 @@
+"""
+The file format taxonomy, shared by indexing and display.
+
+Resources describe their format in many ways: ``CSV``, ``.csv``,
+``text/csv``, ``Spreadsheet``... The registry normalises all of these
+to one canonical format name, and maps canonical formats to the groups
+of the "Format" facet (``dfl_res_format_group``) configured with
+``ckan.harvesters.table_formats``, ``ckan.harvesters.report_formats``
+and ``ckan.harvesters.geospatial_formats``.
+
+It is built once from the config; lookups are a dict access.
+"""
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+from ckan.common import config
+
+GROUPS = {
+    "Tables": "ckan.harvesters.table_formats",
+    "Reports": "ckan.harvesters.report_formats",
+    "Geospatial": "ckan.harvesters.geospatial_formats",
+}
+
+# Other names, mimetypes and extensions for canonical formats
+ALIASES = {
+    "spreadsheet": "xls",
+    "image": "png",
+    "jpeg": "jpg",
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/vnd.ms-excel": "xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "application/vnd.oasis.opendocument.spreadsheet": "ods",
+    "application/json": "json",
+    "application/geo+json": "geojson",
+    "application/vnd.geo+json": "geojson",
+    "application/vnd.google-earth.kml+xml": "kml",
+    "application/vnd.google-earth.kmz": "kmz",
+    "application/pdf": "pdf",
+    "application/msword": "doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/zip": "zip",
+    "application/xml": "xml",
+    "text/xml": "xml",
+    "text/html": "html",
+    "text/plain": "txt",
+    "image/png": "png",
+    "image/jpeg": "jpg",
+}
+
+
+class Format(NamedTuple):
+    name: str
+    group: Optional[str]
+
+
+def normalise(raw: str) -> str:
+    """The canonical name of a format, mimetype or file extension."""
+    name = raw.split(";")[0].strip().lower().lstrip(".")
+    return ALIASES.get(name, name)
+
+
+class FormatRegistry:
+    def __init__(self, groups: dict[str, Iterable[str]]):
+        self._groups: dict[str, str] = {}
+        for group, formats in groups.items():
+            for name in formats:
+                # The first group listing a format wins, as before
+                self._groups.setdefault(normalise(name), group)
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    def _lookup(self, raw: str) -> Format:
+        name = normalise(raw)
+        return Format(name, self._groups.get(name))
+
+    def groups(self, raw_formats: Iterable[str]) -> list[str]:
+        """The groups of the given formats, without duplicates, in order
+        of first appearance."""
+        groups = (self.lookup(raw).group for raw in raw_formats if raw)
+        return list(dict.fromkeys(g for g in groups if g))
+
+
+@lru_cache(maxsize=None)
+def registry() -> FormatRegistry:
+    return FormatRegistry(
+        # The options are declared as lists, so CKAN has already split them
+        {group: list(config.get(key) or []) for group, key in GROUPS.items()}
+    )
@@ -0,0 +1,85 @@
+"""
+A ``{% cache %}`` Jinja tag for caching rendered template fragments.
+
+Resource rows and showcase items call several helpers per row
+(``resource_display_name``, ``humanise_file_size``, date formatting
+snippets...) on every page view, though their output only changes
+with the dataset. Wrapping them::
+
+    {% cache pkg.id, pkg.metadata_modified, res %}
+      ...
+    {% endcache %}
+
+renders the body once and then serves it from worker memory. The key
+is made of the values given to the tag, which should include
+everything the body renders, plus the template and line of the tag,
+the language and the user's permission class (see
+auth.permission_class). Dicts are keyed on their whole content, so an
+edit that doesn't change ``metadata_modified`` still misses.
+
+Fragments are kept in a BoundedCache of
+``dfl.fragment-cache.max-bytes``; ``0`` disables the cache.
+"""
+import hashlib
+import json
+from typing import Any, Callable, Optional
+
+from ckan.common import config, current_user
+from ckan.lib.i18n import get_lang
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from . import auth
+from .cache import BoundedCache
+
+_fragments: Optional[BoundedCache] = None
+
+
+def fragments() -> BoundedCache:
+    global _fragments
+    if _fragments is None:
+        _fragments = BoundedCache(
+            "fragments",
+            max_entries=100000,
+            max_bytes=config.get("dfl.fragment-cache.max-bytes"),
+            sizeof=len,
+        )
+    return _fragments
+
+
+def fragment_key(location: str, parts: list[Any]) -> str:
+    user_name = None if current_user.is_anonymous else current_user.name
+    key = json.dumps(
+        [location, get_lang(), auth.permission_class(user_name), parts],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+
+        location = nodes.Const(f"{parser.name}:{lineno}")
+        return nodes.CallBlock(
+            self.call_method("_cached", [location, nodes.List(parts)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cached(self, location: str, parts: list[Any], caller: Callable[[], str]) -> str:
+        cache = fragments()
+        if not cache.max_bytes:
+            return caller()
+
+        key = fragment_key(location, parts)
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment)
+        return fragment
@@ -19,6 +19,8 @@ from ckan.model.user import AnonymousUser
 from ckan.lib.helpers import get_translated
 from ckan.lib.helpers import render_markdown as original_render_markdown
 
+from . import auth, formats, request_cache
+
 site_title = config.get("ckan.site_title", "Default Site Title")
 
 
@@ -91,15 +93,10 @@ def extract_resource_format(resource):
     is used to set the position of this image containing all the icons so the
     correct one shows:
     https://github.com/ckan/ckan/blob/fd88d1f4c52c8ee247883549ca23500693e2e2a4/ckan/public/base/images/sprite-resource-icons.png
-    """
 
-    resource_type = resource.get("format", "data").lower()
-    if resource_type == "spreadsheet":
-        return "xls"
-    elif resource_type == "image":
-        return "png"
-    else:
-        return resource_type
+    The aliases live in the format registry, see formats.py.
+    """
+    return formats.registry().lookup(resource.get("format", "data")).name
 
 
 def get_site_title(request):
@@ -204,14 +201,16 @@ def orgs_list_for_user(user: str, permission: str = 'read') -> list[dict[str, An
     '''Return a list of organizations that the current user has the specified
     permission for.
     '''
-    context: Context = {'user': user}
-    data_dict = { 'permission': permission}
-    orgs = logic.get_action('organization_list_for_user')(context, data_dict)    
-    return orgs
+    def _orgs_list():
+        context: Context = {'user': user}
+        data_dict = { 'permission': permission}
+        return logic.get_action('organization_list_for_user')(context, data_dict)
+
+    return request_cache.memoise('orgs_list_for_user', (user, permission), _orgs_list)
 
 def is_sysadmin():
-    if not isinstance(current_user, AnonymousUser) and current_user.sysadmin:
-        return True
+    if not isinstance(current_user, AnonymousUser):
+        return auth.is_sysadmin(current_user.name)
     else:
         return False
     
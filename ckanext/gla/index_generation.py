@@ -0,0 +1,109 @@
+"""
+A global counter of changes to the search index.
+
+The counter lives in Redis so every worker sees the same value. It is
+bumped whenever a dataset is indexed or deleted, so anything derived
+from search results can be tagged with the generation it was computed
+at and treated as stale once the generation moves on.
+
+The time each dataset was last indexed is kept alongside, since
+``metadata_modified`` follows the upstream or resource dates (see
+timestamps.py) and so doesn't change on every edit. Recent index times
+are also kept in a sorted set, trimmed to ``CHANGES_RETENTION``, so
+workers can catch up with the datasets indexed since they last looked.
+
+The generation is bumped when a dataset is about to be written to the
+index, and again once the write is committed: a search in between can
+still return the old results, which would otherwise be tagged with the
+new generation until the next change. CKAN writes to the index while
+committing the database session, so datasets noted by ``indexing`` are
+bumped again after the commit; code writing to the index directly
+calls ``committed`` itself.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from ckan.lib.redis import connect_to_redis
+from ckan.model.meta import Session
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+REDIS_KEY = "gla:index_generation"
+DATASETS_REDIS_KEY = "gla:index_generation:datasets"
+CHANGES_REDIS_KEY = "gla:index_generation:changes"
+CHANGES_RETENTION = 3600.0
+
+# The datasets this thread is writing to the index
+_pending = threading.local()
+
+
+def bump(*dataset_ids: Optional[str]) -> None:
+    try:
+        pipeline = connect_to_redis().pipeline()
+        pipeline.incr(REDIS_KEY)
+        now = time.time()
+        changes = {dataset_id: now for dataset_id in dataset_ids if dataset_id}
+        if changes:
+            pipeline.hset(DATASETS_REDIS_KEY, mapping=changes)
+            pipeline.zadd(CHANGES_REDIS_KEY, changes)
+            pipeline.zremrangebyscore(CHANGES_REDIS_KEY, "-inf", now - CHANGES_RETENTION)
+        pipeline.execute()
+    except Exception:
+        log.warning("Could not bump the search index generation", exc_info=True)
+
+
+def indexing(dataset_id: Optional[str]) -> None:
+    """Bump the generation for a dataset about to be written to the
+    index, and again when ``committed`` is next called."""
+    bump(dataset_id)
+    if not hasattr(_pending, "ids"):
+        _pending.ids = set()
+    _pending.ids.add(dataset_id)
+
+
+def committed() -> None:
+    """Bump the generation again for the datasets written to the index
+    by this thread since the last call, now the writes are committed."""
+    ids = getattr(_pending, "ids", None)
+    if ids:
+        _pending.ids = set()
+        bump(*ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session) -> None:
+    committed()
+
+
+def current() -> Optional[int]:
+    """The current generation, or None if it can't be read, in which
+    case callers should assume everything is stale."""
+    try:
+        return int(connect_to_redis().get(REDIS_KEY) or 0)
+    except Exception:
+        log.warning("Could not read the search index generation", exc_info=True)
+        return None
+
+
+def dataset_indexed_at(dataset_id: str) -> Optional[float]:
+    """When the dataset was last indexed as a unix time, 0 if that isn't
+    known, or None if it can't be read."""
+    try:
+        return float(connect_to_redis().hget(DATASETS_REDIS_KEY, dataset_id) or 0)
+    except Exception:
+        log.warning("Could not read the dataset index time", exc_info=True)
+        return None
+
+
+def changed_since(since: float) -> Optional[list[str]]:
+    """The datasets indexed since the unix time ``since``, or None if
+    that is longer ago than index times are kept for."""
+    if time.time() - since > CHANGES_RETENTION:
+        return None
+    return [
+        dataset_id.decode() if isinstance(dataset_id, bytes) else dataset_id
+        for dataset_id in connect_to_redis().zrangebyscore(CHANGES_REDIS_KEY, since, "+inf")
+    ]
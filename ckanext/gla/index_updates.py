@@ -0,0 +1,50 @@
+"""
+Partial updates of documents in the search index.
+
+Solr atomic updates change a few fields of an indexed dataset without
+the cost of package_show, before_dataset_index and a whole document
+reindex. Solr rebuilds the document from its stored fields, so every
+field must be stored (or have docValues) except copyField
+destinations, which must not be stored or they'd be copied into twice
+(see custom_fields.add_copy_fields).
+"""
+from typing import Any, Iterable
+
+from ckan.common import asbool, config
+from ckan.lib.search.common import make_connection
+from ckan.lib.search.query import solr_literal
+
+
+def fetch(package_ids: Iterable[str], fl: str, field: str = "id") -> dict[str, dict[str, Any]]:
+    """The index documents of the given datasets, in any state, keyed
+    by dataset id (or by ``field``, e.g. ``name``, which ``fl`` must
+    then include)."""
+    package_ids = list(package_ids)
+    if not package_ids:
+        return {}
+    response = make_connection(decode_dates=False).search(
+        q="*:*",
+        fq=[
+            "{!terms f=%s}%s" % (field, ",".join(package_ids)),
+            "+site_id:%s" % solr_literal(config.get("ckan.site_id")),
+        ],
+        fl=fl,
+        rows=len(package_ids),
+        wt="json",
+    )
+    return {doc[field]: doc for doc in response.docs}
+
+
+def atomic_set(docs: list[dict[str, Any]]) -> None:
+    """Set the given fields of each document, identified by its
+    ``index_id``. Every document must contain the same fields. A
+    ``_version_`` in the documents makes Solr reject the update if a
+    document has changed since it was read."""
+    if not docs:
+        return
+    fields = [field for field in docs[0] if field not in ("index_id", "_version_")]
+    make_connection().add(
+        docs,
+        fieldUpdates={field: "set" for field in fields},
+        commit=asbool(config.get("ckan.search.solr_commit")),
+    )
@@ -0,0 +1,194 @@
+"""
+Replay the searches recorded in the search log against package_search,
+to measure latency and throughput with our real traffic mix.
+
+Used by the ``ckan gla loadtest`` command (see cli.py).
+"""
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional
+
+import requests
+
+import ckan.model as model
+import ckan.plugins as plugins
+import ckan.plugins.toolkit as toolkit
+from ckan.common import asbool, config, current_user, request
+
+log = logging.getLogger(__name__)
+
+
+def query_class(args: dict[str, str]) -> str:
+    """Bucket a search by shape, so e.g. facet-only browsing can be
+    compared with free text searches."""
+    q = args.get("q", "")
+    filtered = any(k not in ("q", "sort") for k in args)
+    if not q:
+        return "browse+filters" if filtered else "browse"
+    kind = "phrase" if '"' in q else "keyword"
+    return f"{kind}+filters" if filtered else kind
+
+
+def _shows_all_types() -> bool:
+    show_all_types = config.get("ckan.search.show_all_types")
+    try:
+        return asbool(show_all_types)
+    except ValueError:
+        return show_all_types == "dataset"
+
+
+def package_search_data_dict(args: dict[str, str]) -> dict[str, Any]:
+    """Build the package_search data_dict CKAN's dataset search page
+    would send for these request parameters. Must be called in a
+    request context, as the facets depend on the user."""
+    fq = ""
+    extras = {}
+    for param, value in args.items():
+        if param in ("q", "page", "sort") or not value or param.startswith("_"):
+            continue
+        if param.startswith("ext_"):
+            extras[param] = value
+        else:
+            fq += f' {param}:"{value}"'
+    if not _shows_all_types():
+        fq += " +dataset_type:dataset"
+
+    facets: dict[str, str] = OrderedDict()
+    for plugin in plugins.PluginImplementations(plugins.IFacets):
+        facets = plugin.dataset_facets(facets, "dataset")
+
+    rows = config.get("ckan.datasets_per_page")
+    try:
+        page = max(int(args.get("page") or 1), 1)
+    except ValueError:
+        page = 1
+    return {
+        "q": args.get("q", ""),
+        "fq": fq.strip(),
+        "facet.field": list(facets.keys()),
+        "rows": rows,
+        "start": (page - 1) * rows,
+        "sort": args.get("sort"),
+        "extras": extras,
+        "include_private": config.get("ckan.search.default_include_private"),
+    }
+
+
+def search_in_process(app, args: dict[str, str]) -> None:
+    """Run the search the dataset search page would for these request
+    parameters, as an anonymous user. The request context is routed to
+    that page, so before_dataset_search adds the same multi-select
+    filters as it does for a visitor."""
+    with app.test_request_context("/dataset/", query_string=args):
+        if request.endpoint != "dataset.search":
+            raise RuntimeError(f"/dataset/ is routed to {request.endpoint}, not dataset.search")
+        try:
+            toolkit.get_action("package_search")(
+                {"user": current_user.name, "auth_user_obj": current_user},
+                package_search_data_dict(args),
+            )
+        finally:
+            model.Session.remove()
+
+
+@dataclass
+class ClassStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class LoadTest:
+    def __init__(
+        self,
+        searches: Iterable[dict[str, str]],
+        rate: float,
+        concurrency: int,
+        total: int,
+        app=None,
+        base_url: Optional[str] = None,
+    ):
+        """Replay ``total`` searches, cycling through ``searches``, at
+        ``rate`` requests per second with at most ``concurrency`` in
+        flight.
+
+        Searches go through the action API in-process, inside a request
+        context from ``app``, unless ``base_url`` is given, in which
+        case the search page of that site is requested over HTTP.
+        """
+        self.searches = list(searches)
+        if not self.searches:
+            raise ValueError("No searches to replay")
+        self.rate = rate
+        self.concurrency = concurrency
+        self.total = total
+        self.app = app
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.stats: dict[str, ClassStats] = {}
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._http = requests.Session()
+
+    def _search_over_http(self, args: dict[str, str]) -> None:
+        response = self._http.get(f"{self.base_url}/dataset", params=args, timeout=60)
+        response.raise_for_status()
+
+    def _run_one(self, args: dict[str, str]) -> None:
+        start = time.perf_counter()
+        failed = False
+        try:
+            if self.base_url:
+                self._search_over_http(args)
+            else:
+                search_in_process(self.app, args)
+        except Exception:
+            log.debug("Search %r failed", args, exc_info=True)
+            failed = True
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            stats = self.stats.setdefault(query_class(args), ClassStats())
+            stats.latencies.append(latency)
+            stats.errors += failed
+
+    def run(self) -> None:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for i, args in enumerate(itertools.islice(itertools.cycle(self.searches), self.total)):
+                # Open loop: requests are issued on schedule even when
+                # earlier ones are slow, like real users
+                delay = start + i / self.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._run_one, args)
+        self.elapsed = time.perf_counter() - start
+
+    def report(self) -> list[dict[str, Any]]:
+        rows = []
+        all_stats = ClassStats()
+        for name, stats in sorted(self.stats.items()) + [("all", all_stats)]:
+            if name != "all":
+                all_stats.latencies.extend(stats.latencies)
+                all_stats.errors += stats.errors
+            count = len(stats.latencies)
+            rows.append({
+                "class": name,
+                "requests": count,
+                "throughput": count / self.elapsed if self.elapsed else 0.0,
+                "error_rate": stats.errors / count if count else 0.0,
+                "p50_ms": (stats.percentile(50) or 0) * 1000,
+                "p95_ms": (stats.percentile(95) or 0) * 1000,
+                "p99_ms": (stats.percentile(99) or 0) * 1000,
+            })
+        return rows
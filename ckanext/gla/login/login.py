@@ -22,6 +22,7 @@ from ckan.types import Response
 from ckan.views.user import next_page_or_default, rotate_token
 from ckanext.gla import email
 from ckanext.gla import auth
+from ckanext.gla import metrics
 from itsdangerous.exc import SignatureExpired, BadData
 import os
 
@@ -58,6 +59,7 @@ def login() -> Union[Response, str]:
                 return next_page_or_default(next)
             else:
                 email.send_mfa_login_link(user_obj)
+                metrics.MFA_LOGINS.labels(outcome="link_sent").inc()
                 h.flash_success(u"We have emailed you a link to sign in")
                 return base.render("user/login.html", {"display_mfa_token_message":True})
         else:
@@ -69,21 +71,23 @@ def login() -> Union[Response, str]:
         token = request.args.get("token")
         try:
             user_email = auth.read_email_from_login_token(token,max_age=MFA_TOKEN_EXPIRY)
-            user_obj = model.User.by_email(user_email)
+            user_obj = auth.get_user_by_login(user_email)
             next = request.args.get('next', request.args.get('came_from'))
 
             login_user(user_obj, remember=True)
 
             rotate_token()
+            metrics.MFA_LOGINS.labels(outcome="success").inc()
 
             success_msg = _(u"Welcome! You have been authenticated and logged in.")
             h.flash_success(success_msg)
             return next_page_or_default(next)
 
         except SignatureExpired as e:
+            metrics.MFA_LOGINS.labels(outcome="expired").inc()
             user_email = auth.read_email_from_login_token(token,max_age=None)
 
-            user_obj = model.User.by_email(user_email)
+            user_obj = auth.get_user_by_login(user_email)
             if user_obj:
                 message = _(u"Your login link has expired.  Please try logging in again.")
                 h.flash_error(message)
@@ -91,6 +95,7 @@ def login() -> Union[Response, str]:
                 return tk.redirect_to("user.login")
 
         except BadData as ex:
+            metrics.MFA_LOGINS.labels(outcome="invalid").inc()
             err = _(u"Invalid Login Token - Please try logging in again.")
             h.flash_error(err)
             return tk.redirect_to("user.login")
@@ -0,0 +1,277 @@
+"""
+Memory accounting for worker processes.
+
+Sysadmins can see, at ``/memory``, the resident set size and garbage
+collector counts of the worker answering, the size of each cache the
+extension keeps (see cache.py) and of its other in-memory structures,
+and, while tracemalloc is tracing, the source lines that allocated the
+most memory still in use.
+
+Every worker publishes a short report of its memory to Redis at most
+every ``PUBLISH_INTERVAL`` seconds, before a request, so ``/memory``
+also lists the other workers.
+
+With ``dfl.memory.trace-frames`` set, each worker starts tracemalloc,
+keeping that many frames of each allocation's traceback. Tracing slows
+allocation down and takes memory itself, so leave it off unless
+looking for a leak. With ``dfl.memory.snapshot-dir`` also set,
+``POST /memory/snapshots`` saves a heap snapshot of the worker
+answering, and two snapshots can be compared at
+``/memory/snapshots/<first>/diff/<second>`` to see what was allocated
+between them.
+"""
+import gc
+import json
+import logging
+import os
+import re
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from types import FunctionType, ModuleType
+from typing import Any, Callable, Optional
+
+from ckan.common import config
+from ckan.lib.redis import connect_to_redis
+
+from . import cache, formats, popularity, suggest, warm
+
+log = logging.getLogger(__name__)
+
+WORKERS_REDIS_KEY = "gla:memory:workers"
+PUBLISH_INTERVAL = 30.0
+# Reports older than this are from workers that have stopped
+STALE_SECONDS = 300.0
+
+# Stop measuring a structure after this many objects
+MAX_OBJECTS = 1_000_000
+
+SNAPSHOT_NAME = re.compile(r"^[\w.-]+\.snapshot$")
+# Allocations made by tracemalloc and the import system are noise
+_IGNORED_FILES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_published_at = 0.0
+
+# The extension's in-memory structures that aren't BoundedCaches
+_STRUCTURES: dict[str, Callable[[], Any]] = {
+    "suggest_index": lambda: suggest._index,
+    "popularity_state": lambda: popularity._cached[1],
+    "warm_top_searches": lambda: warm._top[1],
+}
+
+
+def rss() -> dict[str, Optional[int]]:
+    """The resident set size of this process, and its peak, in bytes."""
+    sizes: dict[str, Optional[int]] = {"rss_bytes": None, "peak_rss_bytes": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name == "VmRSS":
+                    sizes["rss_bytes"] = int(value.split()[0]) * 1024
+                elif name == "VmHWM":
+                    sizes["peak_rss_bytes"] = int(value.split()[0]) * 1024
+    except OSError:
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        sizes["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return sizes
+
+
+def gc_stats() -> dict[str, Any]:
+    return {
+        "counts": gc.get_count(),
+        "thresholds": gc.get_threshold(),
+        "generations": gc.get_stats(),
+        "garbage": len(gc.garbage),
+    }
+
+
+def deep_sizeof(obj: Any) -> int:
+    """The size in bytes of ``obj`` and everything it refers to, apart
+    from modules, classes and functions, which are shared."""
+    seen: set[int] = set()
+    pending = [obj]
+    size = 0
+    while pending and len(seen) < MAX_OBJECTS:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, (type, ModuleType, FunctionType)):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        pending.extend(gc.get_referents(current))
+    return size
+
+
+def _entries(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, suggest.SuggestIndex):
+        return len(value.prefixes)
+    if isinstance(value, popularity.State):
+        return len(value.scores)
+    return len(value)
+
+
+def cache_sizes(measure: bool = False) -> dict[str, dict[str, Any]]:
+    """The size of each cache and other in-memory structure of this
+    worker. With ``measure``, the memory each takes is measured too,
+    which walks every object in it."""
+    sizes = {}
+    for name, bounded in cache.caches().items():
+        stats = bounded.stats()
+        if measure:
+            stats["deep_bytes"] = deep_sizeof(bounded._entries)
+        sizes[name] = stats
+    for name, structure in _STRUCTURES.items():
+        value = structure()
+        stats = {"entries": _entries(value)}
+        if measure:
+            stats["deep_bytes"] = deep_sizeof(value) if value is not None else 0
+        sizes[name] = stats
+    lookups = formats.registry().lookup.cache_info()
+    sizes["format_lookups"] = {"entries": lookups.currsize, "max_entries": lookups.maxsize}
+    return sizes
+
+
+def tracing() -> bool:
+    return tracemalloc.is_tracing()
+
+
+def start_tracing() -> None:
+    """Start tracemalloc in this worker if ``dfl.memory.trace-frames``
+    is set. Called before each request."""
+    frames = config.get("dfl.memory.trace-frames")
+    if frames and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        log.info("Tracing memory allocations with %d frames", frames)
+
+
+def _stat(stat: Any) -> dict[str, Any]:
+    return {
+        "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size_bytes": stat.size,
+        "count": stat.count,
+    }
+
+
+def _group_by(traceback_limit: int) -> str:
+    # Grouping by traceback only differs from by line with more frames
+    return "traceback" if traceback_limit > 1 else "lineno"
+
+
+def top_allocations(limit: int = 25) -> list[dict[str, Any]]:
+    """The places that allocated the most memory still in use since
+    tracing started, largest first."""
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_FILES)
+    stats = snapshot.statistics(_group_by(snapshot.traceback_limit))
+    return [_stat(stat) for stat in stats[:limit]]
+
+
+def report(measure: bool = False, limit: int = 25) -> dict[str, Any]:
+    """The memory of this worker. With ``measure``, the memory taken by
+    each cache and the top allocations are included, which is slow."""
+    result = {
+        "pid": os.getpid(),
+        "time": time.time(),
+        **rss(),
+        "gc": gc_stats(),
+        "caches": cache_sizes(measure),
+        "tracing": tracing(),
+    }
+    if measure and tracing():
+        traced, peak = tracemalloc.get_traced_memory()
+        result.update(
+            traced_bytes=traced,
+            peak_traced_bytes=peak,
+            top_allocations=top_allocations(limit),
+        )
+    return result
+
+
+def publish() -> None:
+    """Save a short report of this worker's memory in Redis, if the
+    last one is old. Called before each request."""
+    global _published_at
+    now = time.time()
+    if now - _published_at < PUBLISH_INTERVAL:
+        return
+    _published_at = now
+    try:
+        connect_to_redis().hset(WORKERS_REDIS_KEY, str(os.getpid()), json.dumps(report()))
+    except Exception:
+        log.warning("Could not publish the memory report", exc_info=True)
+
+
+def workers() -> list[dict[str, Any]]:
+    """The last reports of the running workers, forgetting workers that
+    have stopped reporting."""
+    redis = connect_to_redis()
+    reports, stale = [], []
+    for pid, value in redis.hgetall(WORKERS_REDIS_KEY).items():
+        worker = json.loads(value)
+        if time.time() - worker["time"] > STALE_SECONDS:
+            stale.append(pid)
+        else:
+            reports.append(worker)
+    if stale:
+        redis.hdel(WORKERS_REDIS_KEY, *stale)
+    return sorted(reports, key=lambda worker: worker["pid"])
+
+
+def snapshots_enabled() -> bool:
+    return bool(config.get("dfl.memory.snapshot-dir"))
+
+
+def take_snapshot() -> Optional[str]:
+    """Save a heap snapshot of this worker, returning its name, or None
+    if tracemalloc isn't tracing."""
+    if not tracemalloc.is_tracing():
+        return None
+    directory = config.get("dfl.memory.snapshot-dir")
+    os.makedirs(directory, exist_ok=True)
+    name = f"{datetime.now():%Y%m%dT%H%M%S%f}-{os.getpid()}.snapshot"
+    tracemalloc.take_snapshot().filter_traces(_IGNORED_FILES).dump(os.path.join(directory, name))
+    return name
+
+
+def snapshots() -> list[str]:
+    """The saved snapshots, newest first."""
+    try:
+        names = os.listdir(config.get("dfl.memory.snapshot-dir"))
+    except FileNotFoundError:
+        return []
+    return sorted((n for n in names if SNAPSHOT_NAME.match(n)), reverse=True)
+
+
+def snapshot_path(name: str) -> Optional[str]:
+    if not SNAPSHOT_NAME.match(name):
+        return None
+    path = os.path.join(config.get("dfl.memory.snapshot-dir"), name)
+    return path if os.path.exists(path) else None
+
+
+def diff(first: str, second: str, limit: int = 25) -> dict[str, Any]:
+    """The places whose memory in use grew most from the snapshot saved
+    at ``first`` to the one at ``second``. Snapshots are only comparable
+    if they were taken by the same worker, whose pid ends their name."""
+    old = tracemalloc.Snapshot.load(first)
+    new = tracemalloc.Snapshot.load(second)
+    stats = new.compare_to(old, _group_by(new.traceback_limit))
+    return {
+        "size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "count_diff": sum(stat.count_diff for stat in stats),
+        "top_differences": [
+            {**_stat(stat), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+            for stat in stats[:limit]
+        ],
+    }
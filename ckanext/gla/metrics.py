@@ -0,0 +1,155 @@
+"""
+Prometheus metrics for the extension.
+
+Metrics are exposed at ``/metrics`` (see views.py) to sysadmins and
+sysadmin API tokens. When CKAN runs under gunicorn with several
+workers, set the ``PROMETHEUS_MULTIPROC_DIR`` environment variable to
+an empty, writable directory before CKAN starts; each worker then
+writes its samples there and every scrape aggregates all workers.
+"""
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Upper bounds in seconds, chosen to cover everything from a cheap
+# python loop to a Solr request that is about to time out.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PACKAGE_SEARCHES = Counter(
+    "gla_package_search_total",
+    "package_search action calls",
+    ["outcome"],
+)
+
+SEARCH_STAGE_SECONDS = Histogram(
+    "gla_search_stage_seconds",
+    "Time spent in each stage of the package_search pipeline",
+    ["stage"],
+    buckets=BUCKETS,
+)
+
+SOLR_QUERIES = Counter(
+    "gla_solr_queries_total",
+    "Queries sent to Solr by PatchedPackageSearchQuery.run",
+    ["outcome"],
+)
+
+INDEX_SECONDS = Histogram(
+    "gla_before_dataset_index_seconds",
+    "Time spent preparing a dataset for the search index",
+    buckets=BUCKETS,
+)
+
+LOGINS = Counter(
+    "gla_login_attempts_total",
+    "Username/password login attempts",
+    ["outcome"],
+)
+
+LOGIN_SECONDS = Histogram(
+    "gla_login_seconds",
+    "Time spent authenticating a username/password login",
+    buckets=BUCKETS,
+)
+
+MFA_LOGINS = Counter(
+    "gla_mfa_logins_total",
+    "Emailed login link events",
+    ["outcome"],
+)
+
+MAILS = Counter(
+    "gla_mail_sent_total",
+    "Emails sent by the extension",
+    ["kind", "outcome"],
+)
+
+MAIL_SECONDS = Histogram(
+    "gla_mail_send_seconds",
+    "Time spent sending emails",
+    ["kind"],
+    buckets=BUCKETS,
+)
+
+COALESCED_QUERIES = Counter(
+    "gla_solr_coalesced_queries_total",
+    "Searches answered by sharing an identical in-flight Solr query",
+    ["scope"],
+)
+
+SOLR_CIRCUIT_TRANSITIONS = Counter(
+    "gla_solr_circuit_transitions_total",
+    "Changes of state of the Solr circuit breaker",
+    ["state"],
+)
+
+STALE_SEARCHES = Counter(
+    "gla_search_stale_responses_total",
+    "Searches answered from the last known good response because Solr was unavailable",
+)
+
+REINDEXES = Counter(
+    "gla_reindex_queue_reindexes_total",
+    "Datasets reindexed by the reindex queue",
+    ["outcome"],
+)
+
+FACET_SNAPSHOT_REFRESHES = Counter(
+    "gla_facet_snapshot_refreshes_total",
+    "Background recounts of the facet snapshots served to anonymous landing pages",
+    ["outcome"],
+)
+
+WARMED_SEARCHES = Counter(
+    "gla_search_warming_searches_total",
+    "Logged searches replayed to warm Solr's caches after index changes",
+    ["outcome"],
+)
+
+SEARCH_COST_DECISIONS = Counter(
+    "gla_search_cost_decisions_total",
+    "API searches allowed, downgraded or rejected by the cost guard",
+    ["decision", "permission_class"],
+)
+
+CACHE_REQUESTS = Counter(
+    "gla_cache_requests_total",
+    "Cache lookups made by the extension",
+    ["cache", "result"],
+)
+
+
+@contextmanager
+def count_outcome(counter: Counter, **labels: str) -> Iterator[None]:
+    """Count the wrapped block as ``outcome="ok"``, or as
+    ``outcome="error"`` if it raises."""
+    try:
+        yield
+    except Exception:
+        counter.labels(outcome="error", **labels).inc()
+        raise
+    counter.labels(outcome="ok", **labels).inc()
+
+
+def _registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def exposition() -> tuple[bytes, str]:
+    """Return the current metrics in the Prometheus text format, along
+    with the content type to serve them with."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
@@ -0,0 +1,35 @@
+"""Add lower(name) and lower(email) indexes to the user table
+
+Revision ID: 3f1c2a9d4b7e
+Revises:
+Create Date: 2026-10-19 09:12:44.271935
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d4b7e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Logins and token flows look users up case-insensitively by name or
+# email (see ckanext.gla.auth.get_user_by_login), which needs
+# functional indexes to avoid sequential scans of the user table.
+def upgrade():
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS idx_gla_user_lower_name '
+        'ON "user" (lower(name))'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS idx_gla_user_lower_email '
+        'ON "user" (lower(email))'
+    )
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS idx_gla_user_lower_email')
+    op.execute('DROP INDEX IF EXISTS idx_gla_user_lower_name')
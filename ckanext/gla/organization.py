@@ -6,7 +6,7 @@ import ckan
 import ckan.model as model
 from ckan.logic import ActionError
 import ckan.plugins.toolkit as tk
-from . import auth, email
+from . import auth, email, export
 import ckan.plugins.toolkit as toolkit
 import csv
 from ckan import authz
@@ -121,13 +121,11 @@ def migrate(context, data_dict={}):
     return "get_migrate_organizations completed"
 
 def get_datasets_by_org(org_name, context):
-    search_result = toolkit.get_action('package_search')(
+    return list(export.iter_datasets(
     context, {
-        'fq': f'organization:{org_name}', 
-        'rows': 1000,
+        'fq': f'organization:{org_name}',
         'include_private': True,
         'include_drafts': True,
         'include_deleted': True
         }
-    )
-    return search_result['results']
+    ))
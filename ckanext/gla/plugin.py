@@ -2,6 +2,7 @@ import datetime
 import json
 import logging
 import re
+from time import perf_counter
 from typing import Any, Mapping, Optional, cast
 
 from markupsafe import Markup
@@ -14,28 +15,25 @@ from ckan.common import _, request
 from ckan.config.declaration import Declaration, Key
 from ckan.lib import signals
 from ckan.lib.helpers import dict_list_reduce, markdown_extract, ungettext
-from ckan.model import User, AnonymousUser, Group
+from ckan.model import User, AnonymousUser, Group, Package
 from ckan.model.meta import Session
 from ckan.types import Schema, Validator
 from ckan.plugins.toolkit import get_action
 from ckan.logic.validators import isodate
 
-from . import auth, custom_fields, helpers, search, timestamps, user, views, organization
+from . import auth, boost, cli, cost_guard, custom_fields, export, formats, fragment_cache, helpers, index_generation, metrics, popularity, ranges, reindex_queue, search, suggest, timestamps, timing, user, views, organization
 from .email import send_email_verification_link, send_reset_link
 from .search_highlight import (  # query is imported for initialisation, though not explicitly used
     action,
     query,
 )
+from .search_highlight import fields as highlight_fields
 from .search_highlight.action import dataset_facets_for_user, GLA_SYSADMIN_FACETS
 
 from .login import ( login )
 
 from flask import has_request_context
 
-TABLE_FORMATS = toolkit.config.get("ckan.harvesters.table_formats").split(" ")
-REPORT_FORMATS = toolkit.config.get("ckan.harvesters.report_formats").split(" ")
-GEOSPATIAL_FORMATS = toolkit.config.get("ckan.harvesters.geospatial_formats").split(" ")
-
 def load_config_as_list(key):
     val = toolkit.config.get(key,'')
     if val:
@@ -138,6 +136,9 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
     plugins.implements(plugins.IFacets)
     plugins.implements(plugins.IValidators)
     plugins.implements(plugins.IPermissionLabels)
+    plugins.implements(plugins.IClick)
+    plugins.implements(plugins.IMiddleware, inherit=True)
+    plugins.implements(plugins.IDomainObjectModification, inherit=True)
 
     def get_validators(self) -> dict[str, Validator]:
         return {"user_password_validator": auth.user_password_validator,
@@ -149,6 +150,38 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
         declaration.declare_list(key.ckan.harvesters.table_formats, [])
         declaration.declare_list(key.ckan.harvesters.report_formats, [])
         declaration.declare_list(key.ckan.harvesters.geospatial_formats, [])
+        declaration.declare_int(Key.from_string("dfl.export.page-size"), 1000)
+        declaration.declare_int(Key.from_string("dfl.package-show-many.max-ids"), 100)
+        declaration.declare_bool(Key.from_string("dfl.search.coalesce"), True)
+        declaration.declare_bool(Key.from_string("dfl.search.coalesce-across-workers"), False)
+        declaration.declare_int(Key.from_string("dfl.search.coalesce-wait"), 10)
+        declaration.declare_bool(Key.from_string("dfl.search.facet-snapshot"), True)
+        declaration.declare_int(Key.from_string("dfl.search.deadline"), 10000)
+        declaration.declare_int(Key.from_string("dfl.search.circuit-breaker-failures"), 5)
+        declaration.declare_int(Key.from_string("dfl.search.circuit-breaker-reset"), 30)
+        declaration.declare_int(Key.from_string("dfl.search.stale-results-max-bytes"), 32 * 1024 * 1024)
+        declaration.declare(Key.from_string("dfl.etag-salt"), "")
+        declaration.declare_int(Key.from_string("dfl.fragment-cache.max-bytes"), 16 * 1024 * 1024)
+        declaration.declare_bool(Key.from_string("dfl.search.reindex-queue"), False)
+        declaration.declare_int(Key.from_string("dfl.search.reindex-delay"), 5)
+        declaration.declare_int(Key.from_string("dfl.search.facet-snapshot-max-age"), 300)
+        declaration.declare_int(Key.from_string("dfl.search.highlight-max-chars"), 20000)
+        declaration.declare_list(Key.from_string("dfl.search.cost-downgrade"), ["anonymous:150", "user:150", "manager:300"])
+        declaration.declare_list(Key.from_string("dfl.search.cost-reject"), ["anonymous:300", "user:300", "manager:600"])
+        declaration.declare(Key.from_string("dfl.profiler.dir"), "")
+        declaration.declare_int(Key.from_string("dfl.profiler.interval-ms"), 5)
+        declaration.declare_int(Key.from_string("dfl.profiler.min-interval"), 60)
+        declaration.declare_int(Key.from_string("dfl.memory.trace-frames"), 0)
+        declaration.declare(Key.from_string("dfl.memory.snapshot-dir"), "")
+        declaration.declare(Key.from_string("dfl.search.slow-log"), "")
+        declaration.declare_int(Key.from_string("dfl.search.slow-log-threshold"), 1000)
+        declaration.declare_int(Key.from_string("dfl.search.slow-log-max-bytes"), 10 * 1024 * 1024)
+        declaration.declare_int(Key.from_string("dfl.search.warm-queries"), 0)
+        declaration.declare_int(Key.from_string("dfl.search.warm-concurrency"), 2)
+        declaration.declare_int(Key.from_string("dfl.search.warm-delay"), 30)
+        declaration.declare(Key.from_string("dfl.popularity.state-file"), "/logs/popularity.json")
+        declaration.declare_int(Key.from_string("dfl.popularity.half-life-days"), 30)
+        declaration.declare(Key.from_string("dfl.popularity.boost"), "0")
 
     # IConfigurer
     def update_config(self, config_):
@@ -159,7 +192,11 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
 
     # IAuthFunctions
     def get_auth_functions(self):
-        auth_functions = {"user_list": auth.user_list, "user_show": auth.user_show}
+        auth_functions = {
+            "bulk_update_boost": auth.bulk_update_boost,
+            "user_list": auth.user_list,
+            "user_show": auth.user_show,
+        }
         return auth_functions
 
     # IPackageController
@@ -167,7 +204,10 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
         # Include showcases *and* datasets in the search results:
         # We only want Showcases to show up when there is a search query
         search_params = search.add_quality_to_search(search_params)
-        
+
+        # Coverage and size range filters, from ext_ parameters
+        range_fqs = ranges.filters(search_params.get("extras") or {})
+
         if is_multi_select_route(request):
             # If we're not an API request or a query running on the
             # harvester extension routes trigger the multi-select
@@ -176,13 +216,14 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
             # As the CKAN API allows API users to set the SOLR fq
             # parameter themselves explicitly, we need to avoid doing
             # this for API requests.
-            multi_select_fqs = build_multi_select_facet_constraints()
+            with timing.span("multi_select_facets"):
+                multi_select_fqs = build_multi_select_facet_constraints()
 
             fq = search_params.get('fq','')
 
             cleaned_fq = cleanup_fq(fq)
             search_params['fq'] = ''
-            multi_select_fqs = [cleaned_fq] + multi_select_fqs
+            multi_select_fqs = [cleaned_fq] + multi_select_fqs + range_fqs
 
             search_params['fq_init_list'] = multi_select_fqs
 
@@ -192,6 +233,8 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
             # fq can be replaced entirely with an empty string as our
             # fq_init_list will later replace it.
             search_params['facet.field'] = [f'{{!ex={item}}}' + item for item in search_params.get('facet.field',[])]
+        elif range_fqs:
+            search_params['fq_list'] = search_params.get('fq_list', []) + range_fqs
 
         search_params.update(
             {
@@ -202,15 +245,18 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
                 "hl.snippets": "1",
                 "hl.fragsize": "200",
                 "hl.bs.type": "SENTENCE",
-                "hl.fl": "title,title_phrase,notes,notes_phrase,search_description,search_description_phrase",
                 "hl.simple.pre": "[[",
                 "hl.simple.post": "]]",
-                "hl.maxAnalyzedChars": "250000",  # only highlight matches occuring in the first 250k characters of a field we increase this from SOLRs default of 51k because some datasets have long descriptions and highlighting wasn't displaying
+                # Highlight the bounded copies of the long text fields,
+                # rather than up to 250k characters of the fields
+                # themselves (see search_highlight/fields.py)
+                **highlight_fields.search_params(),
                 "facet.mincount": 0
             }
         )
 
-        return search_params
+        # Make expensive API searches cheaper, or reject them
+        return cost_guard.apply(search_params)
 
     # IPackageController
     def before_dataset_view(self, package_dict):
@@ -291,16 +337,17 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
                     return extras_dict["value"]
             return ""
 
+        highlight_start = perf_counter()
         for result in search_results["results"]:
             index_id = result.get("index_id", False)
             if index_id and index_id in search_results["highlighting"]:
-                highlighted_title = _get_highlighted_field("title", index_id) or _get_highlighted_field("title_phrase", index_id)
+                highlighted_title = _get_highlighted_field("title", index_id) or _get_highlighted_field("title_phrase_hl", index_id)
                 
-                highlighted_notes = _get_highlighted_field("notes", index_id) or _get_highlighted_field("notes_phrase", index_id)
+                highlighted_notes = _get_highlighted_field("notes_hl", index_id) or _get_highlighted_field("notes_phrase_hl", index_id)
                 highlighted_search_description = _get_highlighted_field(
-                    "search_description", index_id
+                    "search_description_hl", index_id
                 ) or _get_highlighted_field(
-                    "search_description_phrase", index_id
+                    "search_description_phrase_hl", index_id
                 )
                 highlighted_organization_title = _get_highlighted_field(
                     "organization", index_id
@@ -355,6 +402,8 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
                     sanitized_search_description_list
                 )
 
+        timing.record("highlight", perf_counter() - highlight_start)
+
         search_facets = search_results['search_facets']
 
         if 'private' in search_facets:
@@ -364,18 +413,44 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
                 else:
                     i['display_name'] = 'Public'
 
-        return search_results
+        return cost_guard.annotate(search_results)
 
     def after_dataset_create(self, ctx, package):
         timestamps.override(ctx, package)
+        self._queue_reindex(package["id"])
 
     def after_dataset_update(self, ctx, package):
         timestamps.override(ctx, package)
+        self._queue_reindex(package["id"])
 
     def after_resource_delete(self, ctx, resources):
         timestamps.set_to_now(ctx, resources)
+        self._queue_reindex(ctx["package"].id)
+
+    def _queue_reindex(self, package_id):
+        # The timestamps above are written with raw SQL, which the
+        # indexer doesn't see, so make sure the settled dataset is indexed
+        if reindex_queue.enabled():
+            reindex_queue.enqueue(package_id)
+
+    # IDomainObjectModification
+    def notify(self, entity, operation):
+        if isinstance(entity, Package):
+            self._queue_reindex(entity.id)
+
+    def after_dataset_delete(self, ctx, data_dict):
+        index_generation.indexing(data_dict.get("id"))
+        suggest.remove_dataset(data_dict.get("id"))
 
     def before_dataset_index(self, pkg_dict: dict[str, Any]) -> dict[str, Any]:
+        # Called just before the dataset is sent to Solr; the generation
+        # is bumped again once the write is committed, but derived data
+        # (e.g. facet snapshots) also expires by age in case it isn't.
+        index_generation.indexing(pkg_dict.get("id"))
+        with metrics.INDEX_SECONDS.time():
+            return self._before_dataset_index(pkg_dict)
+
+    def _before_dataset_index(self, pkg_dict: dict[str, Any]) -> dict[str, Any]:
         pkg_dict["notes_with_markup"] = helpers.sanitise_markup(
             pkg_dict["notes"], remove_tags=False
         )
@@ -385,18 +460,18 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
         validated_data_dict["notes"] = pkg_dict["notes"]
         pkg_dict["validated_data_dict"] = json.dumps(validated_data_dict)
 
-        new_format_list = []
-        for file_format in pkg_dict.get("res_format", []):
-            if file_format.lower() in TABLE_FORMATS:
-                new_format_list.append("Tables")
-            elif file_format.lower() in REPORT_FORMATS:
-                new_format_list.append("Reports")
-            elif file_format.lower() in GEOSPATIAL_FORMATS:
-                new_format_list.append("Geospatial")
-            else:
-                continue  # new_format_list.append("Other")
+        pkg_dict["dfl_res_format_group"] = formats.registry().groups(
+            pkg_dict.get("res_format", [])
+        )
+        pkg_dict.update(highlight_fields.index_fields(pkg_dict))
+        pkg_dict.update(ranges.index_fields(validated_data_dict))
+
+        suggest.index_dataset(pkg_dict)
 
-        pkg_dict["dfl_res_format_group"] = new_format_list
+        # Keep the click popularity across full reindexes
+        popularity_score = popularity.score(pkg_dict["name"])
+        if popularity_score is not None:
+            pkg_dict[popularity.FIELD] = popularity_score
 
         return pkg_dict
 
@@ -423,12 +498,28 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
     def get_blueprint(self):
         return views.get_blueprints()
 
+    # IMiddleware
+    def make_middleware(self, app, config):
+        # Only the Flask app renders templates
+        if hasattr(app, "jinja_env"):
+            app.jinja_env.add_extension(fragment_cache.FragmentCacheExtension)
+        return app
+
+    # IClick
+    def get_commands(self):
+        return cli.get_commands()
+
     # IActions
     def get_actions(self):
         return {
+            "bulk_update_boost": boost.bulk_update_boost,
             "debug_dataset_search": search.debug,
+            "debug_slow_search": search.debug_slow_search,
             "log_chosen_search_result": search.log_selected_result,
             "package_search": action.package_search,
+            "package_search_cursor": export.package_search_cursor,
+            "package_show_many": action.package_show_many,
+            "search_suggest": suggest.search_suggest,
             "user_create": user.user_create,
             "user_list": user.user_list,
             "migrate_organization": organization.migrate     
@@ -521,25 +612,32 @@ class GlaPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetForm, DefaultPerm
         if not ("login" in identity and "password" in identity):
             return None
 
-        login = identity["login"]
+        with metrics.LOGIN_SECONDS.time():
+            return self._authenticate(identity)
 
-        # Force username and email to be lowercase
-        user_obj = User.by_name(login.lower())
+    def _authenticate(self, identity: Mapping[str, Any]) -> Optional["User"]:
+        login = identity["login"]
 
-        if not user_obj:
-            user_obj = User.by_email(login.lower())
+        # Usernames and emails are matched case-insensitively in a
+        # single query
+        user_obj = auth.get_user_by_login(login)
 
         if user_obj is None:
             log.debug("Login failed - username or email %r not found", login)
+            metrics.LOGINS.labels(outcome="not_found").inc()
         elif not user_obj.is_active:
             log.debug("Login as %r failed - user isn't active", login)
+            metrics.LOGINS.labels(outcome="inactive").inc()
         elif not user_obj.validate_password(identity["password"]):
             log.debug("Login as %r failed - password not valid", login)
+            metrics.LOGINS.labels(outcome="bad_password").inc()
         elif not auth.is_email_verified(user_obj):
             send_email_verification_link(user_obj)
             log.debug("Login as %r failed - email not verified", login)
+            metrics.LOGINS.labels(outcome="email_not_verified").inc()
             toolkit.abort(403, _("Email not verified"))
         else:
+            metrics.LOGINS.labels(outcome="success").inc()
             return user_obj
 
         signals.failed_login.send(login)
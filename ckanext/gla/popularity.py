@@ -0,0 +1,194 @@
+"""
+Dataset popularity from clicks on search results.
+
+``fold`` reads only the rows added to the search click log
+(``search.logfile``) since its last run, and adds each click to the
+clicked dataset's exponentially decayed popularity, with a half-life
+of ``dfl.popularity.half-life-days``. Scores are kept in log space
+relative to a fixed reference time::
+
+    score = ln(sum(exp((click_time - reference_time) / tau)))
+
+so a new click is a single ``logaddexp`` and the scores of datasets
+nobody clicked never need rewriting as time passes; the decay is
+applied at query time instead. The state (log offset, reference time
+and scores) is a small JSON file, ``dfl.popularity.state-file``.
+
+The click log is written by an anonymous action, so clicks on anything
+that isn't a dataset name are ignored, names not found in the index
+are dropped, and scores that have decayed to less than ``PRUNE_BELOW``
+clicks are forgotten, keeping the state small.
+
+``update_index`` writes the changed scores to the ``dfl_popularity``
+field with atomic updates; the field is docValues only, so Solr
+updates it in place. ``boost_function`` is the optional ``bf`` term
+using it, weighted by ``dfl.popularity.boost``.
+"""
+import csv
+import io
+import json
+import math
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Iterable, Optional
+
+from ckan.common import config
+
+from . import index_generation, index_updates, search
+
+FIELD = "dfl_popularity"
+
+# Solr's terms query handles this many ids comfortably
+BATCH_SIZE = 500
+
+# Scores worth fewer clicks than this are forgotten
+PRUNE_BELOW = 0.01
+
+# Dataset names, as allowed by CKAN
+_NAME = re.compile(r"^[a-z0-9_-]{2,100}$")
+
+
+@dataclass
+class State:
+    offset: int = 0
+    reference_time: float = field(default_factory=time.time)
+    scores: dict[str, float] = field(default_factory=dict)
+    # Datasets whose score changed but hasn't been indexed yet
+    pending: list[str] = field(default_factory=list)
+
+
+def _state_file() -> str:
+    return config.get("dfl.popularity.state-file")
+
+
+def _tau() -> float:
+    """The decay time constant, in seconds."""
+    return config.get("dfl.popularity.half-life-days") * 86400 / math.log(2)
+
+
+def load_state(path: Optional[str] = None) -> State:
+    try:
+        with open(path or _state_file()) as f:
+            return State(**json.load(f))
+    except FileNotFoundError:
+        return State()
+
+
+def save_state(state: State, path: Optional[str] = None) -> None:
+    path = path or _state_file()
+    with open(path + ".tmp", "w") as f:
+        json.dump(asdict(state), f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+_cached: tuple[float, Optional[State]] = (0.0, None)
+
+
+def cached_state() -> Optional[State]:
+    """The saved state, reloaded only when the file changes, or None if
+    the job hasn't run yet."""
+    global _cached
+    try:
+        mtime = os.stat(_state_file()).st_mtime
+    except FileNotFoundError:
+        return None
+    if mtime != _cached[0]:
+        _cached = (mtime, load_state())
+    return _cached[1]
+
+
+def fold(state: State, log_path: Optional[str] = None) -> set[str]:
+    """Add the clicks logged since the last fold to the scores, returning
+    the names of the datasets whose score changed."""
+    try:
+        with open(log_path or search.logfile, "rb") as f:
+            if os.fstat(f.fileno()).st_size < state.offset:
+                # The log was rotated or truncated
+                state.offset = 0
+            f.seek(state.offset)
+            data = f.read()
+    except FileNotFoundError:
+        return set()
+
+    # Leave a partly written last row for next time
+    data = data[: data.rfind(b"\n") + 1]
+    state.offset += len(data)
+
+    tau = _tau()
+    changed = set()
+    for row in csv.reader(io.StringIO(data.decode("utf-8"))):
+        if row == search.log_headers or len(row) != len(search.log_headers):
+            continue
+        click = dict(zip(search.log_headers, row))
+        name = click["package-id"]
+        if not _NAME.match(name):
+            continue
+        try:
+            clicked_at = datetime.strptime(click["time"], "%Y-%m-%d %H:%M:%S.%f").timestamp()
+        except ValueError:
+            continue
+        x = (clicked_at - state.reference_time) / tau
+        previous = state.scores.get(name)
+        state.scores[name] = x if previous is None else float(
+            max(previous, x) + math.log1p(math.exp(-abs(previous - x)))
+        )
+        changed.add(name)
+    return changed
+
+
+def prune(state: State, now: Optional[float] = None) -> set[str]:
+    """Forget the scores that have decayed to nearly nothing, returning
+    the names forgotten."""
+    threshold = ((now or time.time()) - state.reference_time) / _tau() + math.log(PRUNE_BELOW)
+    pruned = {name for name, score in state.scores.items() if score < threshold}
+    for name in pruned:
+        del state.scores[name]
+    return pruned
+
+
+def update_index(state: State, names: Iterable[str]) -> int:
+    """Write the scores of the given datasets to the index, returning
+    how many were indexed. Names that aren't in the index are dropped
+    from the scores."""
+    names = [name for name in names if name in state.scores]
+    updated = 0
+    for i in range(0, len(names), BATCH_SIZE):
+        batch = names[i : i + BATCH_SIZE]
+        docs = index_updates.fetch(batch, fl="index_id id name", field="name")
+        for name in batch:
+            if name not in docs:
+                state.scores.pop(name, None)
+        index_updates.atomic_set(
+            [
+                {"index_id": doc["index_id"], FIELD: state.scores[name]}
+                for name, doc in docs.items()
+                if name in state.scores
+            ]
+        )
+        for doc in docs.values():
+            index_generation.bump(doc["id"])
+        updated += len(docs)
+    return updated
+
+
+def score(name: str) -> Optional[float]:
+    """The saved score of a dataset, for indexing."""
+    state = cached_state()
+    return state.scores.get(name) if state else None
+
+
+def boost_function() -> Optional[str]:
+    """The bf term boosting popular datasets, or None if disabled.
+
+    This is ``boost * ln(1 + popularity)``, where popularity is the
+    score decayed to now; datasets never clicked count as 0.
+    """
+    boost = float(config.get("dfl.popularity.boost") or 0)
+    state = cached_state()
+    if not boost or state is None:
+        return None
+    now = (time.time() - state.reference_time) / _tau()
+    return f"product({boost},ln(sum(1,exp(sub(def({FIELD},-1000),{now:.4f})))))"
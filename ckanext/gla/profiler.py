@@ -0,0 +1,181 @@
+"""
+On-demand sampling profiler for single requests.
+
+A sysadmin gets a signed profiling token from ``/profiles/token`` and
+sends it with the request to profile, in the ``X-Gla-Profile`` header
+(never the URL, which ends up in access logs and Referer headers).
+The token is checked and the request is profiled by a thread sampling
+the stack of the thread handling it every ``dfl.profiler.interval-ms`` milliseconds. This costs
+the request very little, unlike a deterministic profiler.
+
+The samples are saved in ``dfl.profiler.dir`` in the folded stack
+format read by flamegraph.pl, speedscope and similar tools. The file
+name is returned in the ``X-Gla-Profile-Id`` response header, and
+sysadmins can download it from ``/profiles/<name>``.
+
+Only one request is profiled every ``dfl.profiler.min-interval``
+seconds across all workers, using a Redis lock, so tokens can't be
+used to slow the site down.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from types import FrameType
+from typing import Optional
+
+from ckan.common import config, g, request
+from ckan.lib.redis import connect_to_redis
+from itsdangerous.exc import BadData
+
+from . import auth
+
+log = logging.getLogger(__name__)
+
+HEADER = "X-Gla-Profile"
+RESPONSE_HEADER = "X-Gla-Profile-Id"
+RATE_LIMIT_REDIS_KEY = "gla:profiler:last"
+TOKEN_MAX_AGE = 3600
+# Stop sampling requests that run for longer than this
+MAX_SECONDS = 120
+
+PROFILE_NAME = re.compile(r"^[\w.-]+\.folded$")
+
+
+def enabled() -> bool:
+    return bool(config.get("dfl.profiler.dir"))
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}"
+
+
+class Sampler:
+    """Samples the stack of one thread, from another."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.started = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gla-profiler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        if names:
+            self.stacks[";".join(reversed(names))] += 1
+
+    def _run(self) -> None:
+        deadline = self.started + MAX_SECONDS
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            self._sample()
+
+    def stop(self) -> float:
+        """Stop sampling, returning the seconds sampled for."""
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self.started
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _requested_by_sysadmin() -> bool:
+    token = request.headers.get(HEADER)
+    if not token:
+        return False
+    try:
+        user_name = auth.read_profiling_token(token, max_age=TOKEN_MAX_AGE)
+    except BadData:
+        log.warning("Invalid profiling token for %s", request.path)
+        return False
+    return auth.is_sysadmin(user_name)
+
+
+def _acquire_rate_limit() -> bool:
+    try:
+        return bool(
+            connect_to_redis().set(
+                RATE_LIMIT_REDIS_KEY, time.time(), nx=True, ex=config.get("dfl.profiler.min-interval")
+            )
+        )
+    except Exception:
+        log.warning("Could not check the profiler rate limit", exc_info=True)
+        return False
+
+
+def start() -> None:
+    """Start profiling this request if a valid token was sent with it.
+    Run before each request."""
+    if not enabled() or not _requested_by_sysadmin():
+        return
+    if not _acquire_rate_limit():
+        log.info("Not profiling %s, another profile was taken recently", request.path)
+        return
+    g._gla_profiler = Sampler(
+        threading.get_ident(), config.get("dfl.profiler.interval-ms") / 1000
+    ).start()
+
+
+def finish(response):
+    """Save the profile of this request, if it was profiled. Run after
+    each request."""
+    sampler: Optional[Sampler] = getattr(g, "_gla_profiler", None)
+    if sampler is None:
+        return response
+    g._gla_profiler = None
+    seconds = sampler.stop()
+
+    endpoint = re.sub(r"[^\w.-]", "_", request.endpoint or "unknown")
+    name = f"{datetime.now():%Y%m%dT%H%M%S}-{endpoint}-{os.getpid()}.folded"
+    directory = config.get("dfl.profiler.dir")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(sampler.folded())
+    except OSError:
+        log.exception("Could not save profile")
+        return response
+
+    log.info("Profiled %s for %.2fs in %s", request.path, seconds, name)
+    response.headers[RESPONSE_HEADER] = name
+    return response
+
+
+def discard(exception: Optional[BaseException] = None) -> None:
+    """Stop the sampler of a request that failed before it was saved."""
+    sampler: Optional[Sampler] = getattr(g, "_gla_profiler", None)
+    if sampler is not None:
+        g._gla_profiler = None
+        sampler.stop()
+
+
+def profiles() -> list[str]:
+    """The saved profiles, newest first."""
+    try:
+        names = os.listdir(config.get("dfl.profiler.dir"))
+    except FileNotFoundError:
+        return []
+    return sorted((n for n in names if PROFILE_NAME.match(n)), reverse=True)
+
+
+def profile_path(name: str) -> Optional[str]:
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(config.get("dfl.profiler.dir"), name)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,116 @@
+"""
+Temporal coverage and file size, indexed for range filters and sorting.
+
+The coverage of a dataset spans from the earliest
+``temporal_coverage_from`` to the latest ``temporal_coverage_to`` of its
+resources, and is indexed as two dates, ``dfl_temporal_coverage_from``
+and ``dfl_temporal_coverage_to``. Its total size is the sum of its
+resources' sizes, ``dfl_total_size``. All three have docValues, so they
+can be sorted on.
+
+Searches filter on them with ``ext_`` parameters, which CKAN passes
+through to ``before_dataset_search`` rather than adding to ``fq``:
+
+- ``ext_coverage_from`` / ``ext_coverage_to``: datasets whose coverage
+  overlaps the period from the start of one to the end of the other.
+  Both take a year, year and month, or date, so ``ext_coverage_from=2019``
+  and ``ext_coverage_to=2021`` find data covering 2019 to 2021.
+- ``ext_size_min`` / ``ext_size_max``: total size in bytes.
+"""
+import calendar
+import re
+from datetime import date
+from typing import Any, Optional
+
+from ckan.lib.search.common import SearchQueryError
+
+COVERAGE_FROM = "dfl_temporal_coverage_from"
+COVERAGE_TO = "dfl_temporal_coverage_to"
+TOTAL_SIZE = "dfl_total_size"
+
+PARAMS = ("ext_coverage_from", "ext_coverage_to", "ext_size_min", "ext_size_max")
+
+# Searches filtered on any of the ranges are tagged with this, like
+# the multi-select facets
+TAG = "ranges"
+
+_PERIOD = re.compile(r"^(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?$")
+
+
+def _date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _solr_date(day: date, end: bool = False) -> str:
+    return day.isoformat() + ("T23:59:59Z" if end else "T00:00:00Z")
+
+
+def index_fields(data_dict: dict[str, Any]) -> dict[str, Any]:
+    """The range fields of a dataset."""
+    starts, ends, size = [], [], 0
+    for resource in data_dict.get("resources", []):
+        start = _date(resource.get("temporal_coverage_from"))
+        end = _date(resource.get("temporal_coverage_to")) or start
+        if start:
+            starts.append(start)
+        if end:
+            ends.append(end)
+        try:
+            size += int(resource.get("size") or 0)
+        except (TypeError, ValueError):
+            pass
+
+    fields: dict[str, Any] = {TOTAL_SIZE: size}
+    if starts or ends:
+        fields[COVERAGE_FROM] = _solr_date(min(starts or ends))
+        fields[COVERAGE_TO] = _solr_date(max(ends or starts), end=True)
+    return fields
+
+
+def _period(name: str, value: str, end: bool) -> str:
+    """The start, or end, of a year, month or day as a Solr date."""
+    match = _PERIOD.match(value.strip())
+    try:
+        if not match:
+            raise ValueError
+        year, month, day = (int(part) if part else None for part in match.groups())
+        if month is None:
+            day_ = date(year, 12, 31) if end else date(year, 1, 1)
+        elif day is None:
+            day_ = date(year, month, calendar.monthrange(year, month)[1] if end else 1)
+        else:
+            day_ = date(year, month, day)
+    except ValueError:
+        raise SearchQueryError(f"{name} must be a year, month (YYYY-MM) or date (YYYY-MM-DD)")
+    return _solr_date(day_, end)
+
+
+def _size(name: str, value: str) -> str:
+    try:
+        return str(max(int(value), 0))
+    except ValueError:
+        raise SearchQueryError(f"{name} must be a whole number of bytes")
+
+
+def filters(extras: dict[str, Any]) -> list[str]:
+    """The fq clauses of the range parameters of a search."""
+    values = {name: extras[name] for name in PARAMS if extras.get(name)}
+    clauses = []
+    if "ext_coverage_from" in values:
+        # Overlapping coverage ends after the period starts...
+        start = _period("ext_coverage_from", values["ext_coverage_from"], end=False)
+        clauses.append(f"+{COVERAGE_TO}:[{start} TO *]")
+    if "ext_coverage_to" in values:
+        # ...and starts before it ends
+        end = _period("ext_coverage_to", values["ext_coverage_to"], end=True)
+        clauses.append(f"+{COVERAGE_FROM}:[* TO {end}]")
+    if "ext_size_min" in values or "ext_size_max" in values:
+        low = _size("ext_size_min", values["ext_size_min"]) if "ext_size_min" in values else "*"
+        high = _size("ext_size_max", values["ext_size_max"]) if "ext_size_max" in values else "*"
+        clauses.append(f"+{TOTAL_SIZE}:[{low} TO {high}]")
+    if not clauses:
+        return []
+    return [f"{{!tag={TAG}}}" + " ".join(clauses)]
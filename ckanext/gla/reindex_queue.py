@@ -0,0 +1,123 @@
+"""
+A debounced, coalescing queue of datasets to reindex.
+
+A single edit can index a dataset several times: once when the
+package is committed, again after resources change, while
+timestamps.py rewrites ``metadata_modified`` with raw SQL that the
+indexer never sees. With ``dfl.search.reindex-queue`` enabled (and
+CKAN's own ``ckan.search.automatic_indexing`` disabled) writes only
+add the dataset to a Redis sorted set, scored with the time it should
+be indexed: ``dfl.search.reindex-delay`` seconds after its last
+write. A background thread in each worker indexes datasets once they
+are due, so every burst of writes to a dataset results in a single
+index operation of its final, settled state.
+
+``flush()`` (``ckan gla reindex-flush``) indexes everything queued
+straight away, e.g. in tests.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from ckan import logic, model
+from ckan.common import config
+from ckan.lib import search
+from ckan.lib.redis import connect_to_redis
+from flask import Flask, current_app
+
+from . import index_generation
+from .metrics import REINDEXES, count_outcome
+
+log = logging.getLogger(__name__)
+
+REDIS_KEY = "gla:reindex_queue"
+POLL_INTERVAL = 1.0
+RETRY_DELAY = 60
+
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return config.get("dfl.search.reindex-queue")
+
+
+def enqueue(package_id: str) -> None:
+    """Index the dataset once it has had no writes for the delay.
+    Writing again before then postpones it."""
+    due = time.time() + config.get("dfl.search.reindex-delay")
+    connect_to_redis().zadd(REDIS_KEY, {package_id: due})
+
+
+def reindex(package_id: str) -> None:
+    with count_outcome(REINDEXES):
+        try:
+            search.rebuild(package_id)
+        except logic.NotFound:
+            # Purged since it was queued
+            search.index_for(model.Package).remove_dict({"id": package_id})
+            index_generation.indexing(package_id)
+        index_generation.committed()
+    log.debug("Reindexed dataset %s", package_id)
+
+
+def _claim(until: float) -> list[str]:
+    """Take the datasets due by ``until`` off the queue. A dataset is
+    only claimed by the worker whose ZREM removed it."""
+    redis = connect_to_redis()
+    due = redis.zrangebyscore(REDIS_KEY, "-inf", until)
+    return [
+        package_id.decode() if isinstance(package_id, bytes) else package_id
+        for package_id in due
+        if redis.zrem(REDIS_KEY, package_id)
+    ]
+
+
+def process(until: Optional[float] = None) -> int:
+    """Reindex every dataset due by ``until`` (default: now), returning
+    how many were reindexed. Failures are retried later."""
+    done = 0
+    for package_id in _claim(time.time() if until is None else until):
+        try:
+            reindex(package_id)
+            done += 1
+        except Exception:
+            log.exception("Could not reindex dataset %s, retrying later", package_id)
+            connect_to_redis().zadd(REDIS_KEY, {package_id: time.time() + RETRY_DELAY}, nx=True)
+        finally:
+            model.Session.remove()
+    return done
+
+
+def flush() -> int:
+    """Reindex everything in the queue now."""
+    return process(until=float("inf"))
+
+
+def _run(app: Flask) -> None:
+    while True:
+        try:
+            with app.test_request_context():
+                process()
+        except Exception:
+            log.exception("Reindex queue worker failed")
+        time.sleep(POLL_INTERVAL)
+
+
+def start_worker() -> None:
+    """Start this process's worker thread, if the queue is enabled and
+    it isn't running yet. Called before each request, so workers forked
+    after the app was created get their own thread."""
+    global _worker
+    if _worker is not None or not enabled():
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(
+                target=_run,
+                args=(current_app._get_current_object(),),
+                name="gla-reindex-queue",
+                daemon=True,
+            )
+            _worker.start()
@@ -0,0 +1,64 @@
+"""
+Request scoped memoisation.
+
+Values are stored on flask's ``g`` object so they live for exactly one
+request and are never shared between users. Outside of a request (CLI
+commands, background jobs, the python action API) nothing is cached
+and the supplied function is simply called.
+"""
+from typing import Any, Callable, Hashable
+
+from flask import g, has_request_context
+
+from .metrics import CACHE_REQUESTS
+
+_MISSING = object()
+
+
+def _store() -> dict[Hashable, Any]:
+    store = getattr(g, "_gla_request_cache", None)
+    if store is None:
+        store = {}
+        g._gla_request_cache = store
+    return store
+
+
+def memoise(
+    namespace: str,
+    key: Hashable,
+    compute: Callable[[], Any],
+    cache_none: bool = False,
+) -> Any:
+    """Return the value cached under ``(namespace, key)`` for this
+    request, calling ``compute`` to populate it on a miss.
+
+    ``None`` results are not cached unless ``cache_none`` is set, so a
+    lookup that fails before e.g. a user is created will be retried.
+    """
+    if not has_request_context():
+        return compute()
+
+    store = _store()
+    value = store.get((namespace, key), _MISSING)
+    CACHE_REQUESTS.labels(
+        cache=f"request:{namespace}", result="miss" if value is _MISSING else "hit"
+    ).inc()
+    if value is _MISSING:
+        value = compute()
+        if value is not None or cache_none:
+            store[(namespace, key)] = value
+    return value
+
+
+def forget(namespace: str, key: Hashable = _MISSING) -> None:
+    """Drop a single cached value, or a whole namespace when no key is
+    given."""
+    if not has_request_context():
+        return
+
+    store = _store()
+    if key is not _MISSING:
+        store.pop((namespace, key), None)
+    else:
+        for cached_key in [k for k in store if k[0] == namespace]:
+            del store[cached_key]
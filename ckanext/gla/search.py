@@ -7,7 +7,9 @@ from urllib.parse import quote
 import ckan.lib.search.common as common
 import ckan.plugins.toolkit as toolkit
 from ckan import authz
-from ckan.common import current_user
+from ckan.common import asbool, current_user
+
+from . import popularity, slow_log, timing
 
 # Set the amount by which the data quality field boosts a result
 data_quality_boost_factor = 0.1
@@ -48,7 +50,7 @@ def query_fields(search_params):
         return "title^4 search_description^2 notes" # limit matching of text queries to agreed fields
 
 def add_quality_to_search(search_params):
-    return {**search_params
+    params = {**search_params
             # NOTE the bf parameter adds these additional boosts into
             # the query/results. There are two numeric fields stored
             # in our dataset records which admins can adjust to
@@ -81,24 +83,80 @@ def add_quality_to_search(search_params):
             ,"qf":query_fields(search_params) # limit matching of text queries to agreed fields
             }
 
-@toolkit.side_effect_free
-def debug(context, data_dict={}):
+    # Optionally also boost datasets by how often they're picked from
+    # search results (see popularity.py)
+    popularity_boost = popularity.boost_function()
+    if popularity_boost:
+        params["bf"] += " " + popularity_boost
+    return params
+
+def _timed_package_search(context, data_dict):
+    """Run the query through package_search, as the search page would,
+    and return how long each stage of the pipeline took."""
+    search_context = {
+        "user": context.get("user"),
+        "auth_user_obj": context.get("auth_user_obj"),
+        "for_view": True,
+    }
+    with timing.collect() as spans:
+        toolkit.get_action("package_search")(search_context, dict(data_dict))
+    return {"stages": timing.summarise(spans), "histograms": timing.histograms()}
+
+def _require_sysadmin():
     if not current_user.is_authenticated:
         raise toolkit.NotAuthorized()
     if not authz.is_sysadmin(current_user.name):
         raise toolkit.NotAuthorized()
-    else:
-        params = add_quality_to_search(data_dict)
-        params.setdefault("df", "text")
-        params.setdefault("q.op", "AND")
-        params["debugQuery"] = "true"
-        conn = common.make_connection()
-        try:
-            return conn.search(**params).__dict__
-        except Exception as e:
-            raise common.SearchError(e.args)
+
+@toolkit.side_effect_free
+def debug(context, data_dict={}):
+    """Run a query directly against SOLR with debugQuery enabled.
+
+    Pass ``timings=true`` to also run the query through package_search
+    and include a per-stage timing breakdown under the ``timings`` key,
+    along with this worker's timing histograms.
+    """
+    _require_sysadmin()
+    data_dict = dict(data_dict)
+    include_timings = asbool(data_dict.pop("timings", False))
+    params = add_quality_to_search(data_dict)
+    params.setdefault("df", "text")
+    params.setdefault("q.op", "AND")
+    params["debugQuery"] = "true"
+    conn = common.make_connection()
+    try:
+        result = conn.search(**params).__dict__
+    except Exception as e:
+        raise common.SearchError(e.args)
+    if include_timings:
+        result["timings"] = _timed_package_search(context, data_dict)
+    return result
+
+@toolkit.side_effect_free
+def debug_slow_search(context, data_dict={}):
+    """Re-run a search from the slow search log (see slow_log.py) with
+    debugQuery enabled, to get Solr's explain of it.
+
+    :param id: the ``id`` of the slow search log entry
+
+    Returns the result of ``debug_dataset_search`` with the log entry
+    under ``slow_search``.
+    """
+    _require_sysadmin()
+    entry_id = toolkit.get_or_bust(data_dict, "id")
+    entry = slow_log.find(entry_id)
+    if entry is None:
+        raise toolkit.ObjectNotFound(toolkit._("Slow search not found"))
+    result = debug(context, entry["params"])
+    result["slow_search"] = entry
+    return result
 
 logfile = "/logs/search_logs.csv"
+log_headers = ["time", "query", "sort", "org", "tags", "format", "licence", "package-id", "index"]
+
+# Maps the columns of the search log to the request parameters of the
+# search that produced the logged click
+logged_filters = {"org": "organization", "tags": "tags", "format": "res_format", "licence": "license_id"}
 
 def _result_index(page, index_in_page):
     page_idx = 0 if _empty_or_none(page) else int(page) - 1
@@ -110,9 +168,32 @@ def log_selected_result(context, data_dict={}):
     data_to_log = {k: v for k, v in data_dict.items() if k not in ["page", "index", "is_search_result"]}
     data_to_log["index"] = _result_index(data_dict["page"], data_dict["index"])
     data_to_log["time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-    headers = ["time", "query", "sort", "org", "tags", "format", "licence", "package-id", "index"]
     if not exists(logfile.strip()):
         with open(logfile, "w") as f:
-            csv.writer(f).writerow(headers)
+            csv.writer(f).writerow(log_headers)
     with open(logfile, "a") as f:
-        csv.writer(f).writerow([data_to_log[k] for k in headers])
+        csv.writer(f).writerow([data_to_log[k] for k in log_headers])
+
+def _logged_value(value):
+    # Parameters missing from the search are logged as empty strings
+    # (or "None" by older versions of the templates)
+    return "" if _empty_or_none(value) or value == "None" else value
+
+def logged_search_args(row):
+    """Rebuild the request parameters of the search that produced a row
+    of the search log."""
+    args = {}
+    if _logged_value(row.get("query")):
+        args["q"] = row["query"]
+    if _logged_value(row.get("sort")):
+        args["sort"] = row["sort"]
+    for column, param in logged_filters.items():
+        if _logged_value(row.get(column)):
+            args[param] = row[column]
+    return args
+
+def read_logged_searches(path=logfile):
+    """Yield the request parameters of each search in the search log."""
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield logged_search_args(row)
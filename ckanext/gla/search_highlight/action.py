@@ -1,6 +1,7 @@
 import json
 import logging
-from typing import Any, cast
+import re
+from typing import Any, Optional, cast
 
 import ckan
 import ckan.authz as authz
@@ -14,9 +15,12 @@ from ckan.lib import search
 from ckan.logic.action.get import ValidationError, _check_access, _validate
 from ckan.types import ActionResult, Context, DataDict
 from collections import OrderedDict
+from time import perf_counter
 
 from flask import has_request_context
 
+from .. import metrics, slow_log, timing
+
 log = logging.getLogger(__name__)
 
 GLA_DATASET_FACETS = OrderedDict(
@@ -69,18 +73,38 @@ def filtered_facets(all_facets):
     return non_zero_or_selected_facets
 
 
+def permission_labels(context: Context) -> Optional[list[str]]:
+    """The permission labels a search should be filtered by, or None
+    if the user can see everything."""
+    user = context.get("user")
+    # enforce permission filter based on user
+    if context.get("ignore_auth") or (user and authz.is_sysadmin(user)):
+        return None
+    return lib_plugins.get_permission_labels().get_user_dataset_labels(
+        context.get("auth_user_obj")
+    )
+
+
 def package_search(context: Context, data_dict: DataDict) -> ActionResult.PackageSearch:
     """
     This is a copy of the original package_search function from ckan.logic.action.get
     with the following changes:
     - Add highlighting to return value
+    - Time each stage of the search (see ckanext.gla.timing)
+    - Log slow searches (see ckanext.gla.slow_log)
 
     Please update with upstream method when upgrading CKAN.
     TODO: Submit a PR to upstream CKAN to allow for this to be done in a cleaner way.
     """
+    with metrics.count_outcome(metrics.PACKAGE_SEARCHES), timing.span("package_search"), slow_log.watch(context):
+        return _package_search(context, data_dict)
+
+
+def _package_search(context: Context, data_dict: DataDict) -> ActionResult.PackageSearch:
     # sometimes context['schema'] is None
     schema = context.get("schema") or ckan.logic.schema.default_package_search_schema()
-    data_dict, errors = _validate(data_dict, schema, context)
+    with timing.span("validate"):
+        data_dict, errors = _validate(data_dict, schema, context)
 
     # put the extras back into the data_dict so that the search can
     # report needless parameters
@@ -105,8 +129,9 @@ def package_search(context: Context, data_dict: DataDict) -> ActionResult.Packag
     data_dict["df"] = "text"
 
     # check if some extension needs to modify the search params
-    for item in plugins.PluginImplementations(plugins.IPackageController):
-        data_dict = item.before_dataset_search(data_dict)
+    with timing.span("before_dataset_search"):
+        for item in plugins.PluginImplementations(plugins.IPackageController):
+            data_dict = item.before_dataset_search(data_dict)
 
     # the extension may have decided that it is not necessary to perform
     # the query
@@ -119,6 +144,7 @@ def package_search(context: Context, data_dict: DataDict) -> ActionResult.Packag
     facets: dict[str, Any] = {}
     count = 0
     highlighting: dict[str, Any] = {}
+    stale = False
 
     if not abort:
         if asbool(data_dict.get("use_default_schema")):
@@ -154,13 +180,7 @@ def package_search(context: Context, data_dict: DataDict) -> ActionResult.Packag
         # Pop these ones as Solr does not need them
         extras = data_dict.pop("extras", None)
 
-        # enforce permission filter based on user
-        if context.get("ignore_auth") or (user and authz.is_sysadmin(user)):
-            labels = None
-        else:
-            labels = lib_plugins.get_permission_labels().get_user_dataset_labels(
-                context["auth_user_obj"]
-            )
+        labels = permission_labels(context)
 
         query = search.query_for(model.Package)
         query.run(data_dict, permission_labels=labels)
@@ -176,32 +196,44 @@ def package_search(context: Context, data_dict: DataDict) -> ActionResult.Packag
                 package.update(extras)
                 results.append(package)
         else:
+            # Decoding and before_dataset_view are timed per row but
+            # recorded once per query
+            decode_seconds = 0.0
+            view_seconds = 0.0
             for package in query.results:
                 # get the package object
                 package_dict = package.get(data_source)
                 ## use data in search index if there
                 if package_dict:
                     # the package_dict still needs translating when being viewed
+                    start = perf_counter()
                     package_dict = json.loads(package_dict)
+                    decode_seconds += perf_counter() - start
 
                     if package.get("index_id", False):
                         package_dict["index_id"] = package["index_id"]
 
                     if context.get("for_view"):
+                        start = perf_counter()
                         for item in plugins.PluginImplementations(
                             plugins.IPackageController
                         ):
                             package_dict = item.before_dataset_view(package_dict)
+                        view_seconds += perf_counter() - start
                     results.append(package_dict)
                 else:
                     log.error(
                         "No package_dict is coming from solr for package " "id %s",
                         package["id"],
                     )
+            timing.record("decode_results", decode_seconds)
+            if context.get("for_view"):
+                timing.record("before_dataset_view", view_seconds)
 
         count = query.count
         facets = query.facets
         highlighting = query.highlighting
+        stale = query.stale
 
     search_results: dict[str, Any] = {
         "count": count,
@@ -210,7 +242,12 @@ def package_search(context: Context, data_dict: DataDict) -> ActionResult.Packag
         "sort": data_dict["sort"],
         "highlighting": highlighting,
     }
+    if stale:
+        # Solr is unavailable and these are the last results it returned
+        # for this search
+        search_results["stale"] = True
 
+    facets_start = perf_counter()
     facets = filtered_facets(search_results['facets'])
     search_results['facets'] = facets
     
@@ -253,10 +290,12 @@ def package_search(context: Context, data_dict: DataDict) -> ActionResult.Packag
             new_facet_dict["count"] = value_
             restructured_facets[key]["items"].append(new_facet_dict)
     search_results["search_facets"] = restructured_facets
+    timing.record("restructure_facets", perf_counter() - facets_start)
 
     # check if some extension needs to modify the search results
-    for item in plugins.PluginImplementations(plugins.IPackageController):
-        search_results = item.after_dataset_search(search_results, data_dict)
+    with timing.span("after_dataset_search"):
+        for item in plugins.PluginImplementations(plugins.IPackageController):
+            search_results = item.after_dataset_search(search_results, data_dict)
 
     # After extensions have had a chance to modify the facets, sort them by
     # display name.
@@ -268,3 +307,57 @@ def package_search(context: Context, data_dict: DataDict) -> ActionResult.Packag
         )
 
     return search_results
+
+
+# Dataset ids are uuids and names are restricted to these characters,
+# so anything else can't match and would break the terms query.
+_REFERENCE_PATTERN = re.compile(r"^[\w-]+$")
+
+
+@toolkit.side_effect_free
+def package_show_many(context: Context, data_dict: DataDict) -> list[dict[str, Any]]:
+    """
+    Return several datasets from the search index in one query, rather
+    than one package_show call per dataset.
+
+    :param ids: dataset ids or names, at most ``dfl.package-show-many.max-ids``
+    :type ids: list of strings
+
+    Returns one entry per requested id, in the order requested, with
+    ``id``, ``success`` and either ``result`` (the dataset) or
+    ``error``. Only active datasets the user can see are returned.
+    """
+    ids = data_dict.get("ids")
+    if isinstance(ids, str):
+        ids = [i for i in ids.split(",") if i]
+    if not ids or not isinstance(ids, list):
+        raise ValidationError({"ids": [toolkit._("Missing value")]})
+    if not all(isinstance(i, str) for i in ids):
+        raise ValidationError({"ids": [toolkit._("Must be a list of strings")]})
+
+    max_ids = config.get("dfl.package-show-many.max-ids")
+    if len(ids) > max_ids:
+        raise ValidationError({"ids": [toolkit._("At most {} ids can be requested").format(max_ids)]})
+
+    _check_access("package_search", context, data_dict)
+
+    references = [i for i in dict.fromkeys(ids) if _REFERENCE_PATTERN.match(i)]
+    found = {}
+    if references:
+        query = search.query_for(context["model"].Package)
+        found = query.get_many(references, permission_labels=permission_labels(context))
+
+    results = []
+    for reference in ids:
+        doc = found.get(reference)
+        if doc is None:
+            results.append({"id": reference, "success": False, "error": toolkit._("Not found")})
+            continue
+
+        package_dict = json.loads(doc["validated_data_dict"])
+        if context.get("for_view"):
+            for item in plugins.PluginImplementations(plugins.IPackageController):
+                package_dict = item.before_dataset_view(package_dict)
+        results.append({"id": reference, "success": True, "result": package_dict})
+
+    return results
@@ -0,0 +1,80 @@
+"""
+Bounded copies of the long text fields, for highlighting.
+
+Highlighting ``notes`` and ``search_description`` directly means Solr
+re-analyses up to ``hl.maxAnalyzedChars`` of every matching document,
+so a few very long descriptions dominate the time of any search that
+returns them. Instead, ``before_dataset_index`` stores a copy of each
+field trimmed to ``dfl.search.highlight-max-chars`` at a sentence
+boundary, in fields that keep their offsets in the postings so the
+unified highlighter doesn't need to re-analyse them at all.
+
+Each source field has two copies, analysed like the field itself and
+like its ``_phrase`` twin, so both the stemmed and the phrase parts of
+a query are highlighted. The query matches the original fields, so
+field matching is not required when highlighting the copies.
+
+Titles are short and highlighted from ``title`` itself, but the
+``title_phrase`` field matched by quoted searches is a copy field that
+isn't stored (see custom_fields.py), so titles get a stored phrase copy
+too.
+"""
+import re
+from typing import Any
+
+from ckan.common import config
+
+# The highlight copies of each field: stemmed, then phrase
+FIELDS = {
+    "title": ("title_phrase_hl",),
+    "notes": ("notes_hl", "notes_phrase_hl"),
+    "search_description": ("search_description_hl", "search_description_phrase_hl"),
+}
+
+_SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+
+
+def field_type(copy: str) -> str:
+    """The Solr field type of a highlight copy."""
+    return "text_phrase_query" if copy.endswith("_phrase_hl") else "text"
+
+
+def max_chars() -> int:
+    return config.get("dfl.search.highlight-max-chars")
+
+
+def trim(text: str, limit: int) -> str:
+    """The sentences of ``text`` that fit within ``limit`` characters,
+    or if even the first doesn't, the words that do."""
+    if len(text) <= limit:
+        return text
+    head = text[: limit + 1]
+    ends = [m.end() for m in _SENTENCE_END.finditer(head)]
+    if ends:
+        return head[: ends[-1]].rstrip()
+    words = head.rsplit(None, 1)
+    return words[0] if len(words) > 1 else head[:limit]
+
+
+def index_fields(pkg_dict: dict[str, Any]) -> dict[str, str]:
+    """The highlight copies of a dataset's indexed fields."""
+    limit = max_chars()
+    copies = {}
+    for source, fields in FIELDS.items():
+        text = pkg_dict.get(source)
+        if text:
+            trimmed = trim(text, limit)
+            copies.update((field, trimmed) for field in fields)
+    return copies
+
+
+def search_params() -> dict[str, str]:
+    """The highlighting parameters of a dataset search."""
+    params = {
+        "hl.fl": ",".join(["title", *(f for fields in FIELDS.values() for f in fields)]),
+        "hl.maxAnalyzedChars": str(max_chars()),
+    }
+    for fields in FIELDS.values():
+        for field in fields:
+            params[f"f.{field}.hl.requireFieldMatch"] = "false"
+    return params
@@ -1,6 +1,7 @@
 import json
 import logging
 import re
+from time import perf_counter
 from typing import Any, Optional, cast
 
 import pysolr
@@ -12,6 +13,10 @@ from ckan.lib.search.query import (QUERY_FIELDS, VALID_SOLR_PARAMETERS,
                                    PackageSearchQuery, solr_literal)
 from werkzeug.datastructures import MultiDict
 
+from .. import circuit_breaker, facet_snapshot, metrics, singleflight, slow_log, timing
+from ..cache import BoundedCache
+from . import fields as highlight_fields
+
 log = logging.getLogger(__name__)
 
 VALID_SOLR_PARAMETERS.update(
@@ -28,15 +33,110 @@ VALID_SOLR_PARAMETERS.update(
         "hl.snippets",
         "hl.maxAnalyzedChars",
         "hl.fragAlignRatio",
-        'fq_init_list'
+        'fq_init_list',
+        "cursorMark",
+    ]
+    + [
+        f"f.{field}.hl.requireFieldMatch"
+        for copies in highlight_fields.FIELDS.values()
+        for field in copies
     ]
 )
 
+_last_known_good: Optional[BoundedCache] = None
+
+# Only first pages of at most this many rows are kept as last known
+# good responses: they are what visitors search for, and big API pages
+# would cost a json.dumps on every search to rarely be reused
+STALE_MAX_ROWS = 100
+
+
+def last_known_good() -> BoundedCache:
+    """Recent Solr responses by query, served when Solr is unavailable."""
+    global _last_known_good
+    if _last_known_good is None:
+        _last_known_good = BoundedCache(
+            "solr_last_known_good",
+            max_entries=10000,
+            max_bytes=config.get("dfl.search.stale-results-max-bytes"),
+            sizeof=len,
+        )
+    return _last_known_good
+
+
+def _reusable(query: dict[str, Any]) -> bool:
+    """Whether a response is worth keeping to serve while Solr is
+    unavailable: the first page of an ordinary search."""
+    if "cursorMark" in query:
+        return False
+    try:
+        # rows includes the extra row asked for in run
+        return int(query.get("start") or 0) == 0 and int(query.get("rows", 10)) <= STALE_MAX_ROWS + 1
+    except (TypeError, ValueError):
+        return False
+
+
+def _fail_fast_if_unavailable() -> None:
+    # package_show falls back to the database on a SearchError, so the
+    # dataset pages keep working while the circuit is open.
+    if circuit_breaker.solr.rejecting():
+        raise SearchError("Search is temporarily unavailable")
+
 
 class PatchedPackageSearchQuery(PackageSearchQuery):
+    stale = False
+
     def get_index(self, reference: str) -> dict[str, Any]:
+        _fail_fast_if_unavailable()
         result = super().get_index(reference)
+        return self._fix_up_index_result(result)
+
+    def get_many(
+        self, references: list[str], permission_labels: Optional[list[str]] = None
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Fetch the index documents of several active datasets in a single
+        query, applying the same fix ups as get_index.
+
+        :param references: dataset ids or names; these must only contain
+            characters valid in a dataset name or id.
+        :param permission_labels: as for run
 
+        :returns: the documents found, keyed by both id and name (where
+            an id and a name clash, the id wins, as in package_show)
+        """
+        terms = ",".join(references)
+        fq = [
+            '_query_:"{!terms f=id}%s" OR _query_:"{!terms f=name}%s"' % (terms, terms),
+            "+site_id:%s" % solr_literal(config.get("ckan.site_id")),
+            "+state:active",
+        ]
+        if permission_labels is not None:
+            fq.append(
+                "+permission_labels:(%s)"
+                % " OR ".join(solr_literal(p) for p in permission_labels)
+            )
+
+        _fail_fast_if_unavailable()
+        conn = make_connection(decode_dates=False)
+        try:
+            solr_response = conn.search(
+                q="*:*",
+                fq=fq,
+                # a reference can match one dataset by id and another by name
+                rows=2 * len(references),
+                fl="id name validated_data_dict notes_with_markup metadata_modified",
+                wt="json",
+            )
+        except pysolr.SolrError as e:
+            raise SearchError("SOLR returned an error running query: %r" % e)
+
+        docs = [self._fix_up_index_result(doc) for doc in solr_response.docs]
+        results = {doc["name"]: doc for doc in docs}
+        results.update((doc["id"], doc) for doc in docs)
+        return results
+
+    def _fix_up_index_result(self, result: dict[str, Any]) -> dict[str, Any]:
         # package_show extracts validated_data_dict and ignores everything else from the index,
         # therefore we need to manually add notes_with_markup to validated_data_dict
         # TODO: Investigate storing notes_with_markup in database (package table) during harvest
@@ -72,6 +172,8 @@ class PatchedPackageSearchQuery(PackageSearchQuery):
 
         May raise SearchQueryError or SearchError.
         """
+        build_start = perf_counter()
+        self.stale = False
         assert isinstance(query, (dict, MultiDict))
         # check that query keys are valid
         if not set(query.keys()) <= VALID_SOLR_PARAMETERS:
@@ -87,7 +189,9 @@ class PatchedPackageSearchQuery(PackageSearchQuery):
         rows_to_return = int(query.get("rows", 10))
         # query['rows'] should be a defaulted int, due to schema, but make
         # certain, for legacy tests
-        if rows_to_return > 0:
+        # Deep paging with a cursor needs the exact page size, or the
+        # extra row is silently skipped by the next page.
+        if rows_to_return > 0 and "cursorMark" not in query:
             # #1683 Work around problem of last result being out of order
             #       in SOLR 1.4
             rows_to_query = rows_to_return + 1
@@ -149,10 +253,21 @@ class PatchedPackageSearchQuery(PackageSearchQuery):
         except KeyError:
             pass
 
+        # Anonymous landing pages take their facet counts from a
+        # snapshot, so Solr only has to find the page of results
+        snapshot = facet_snapshot.lookup(query, permission_labels)
+        if snapshot is not None and snapshot.facets is not None:
+            query["facet"] = "false"
+
+        timing.record("build_solr_request", perf_counter() - build_start)
+
         conn = make_connection(decode_dates=False)
         log.debug("Package query: %r" % query)
+        # Before the query, so searches that fail are logged too
+        slow_log.record_params(query)
+        solr_start = perf_counter()
         try:
-            solr_response = conn.search(**query)
+            solr_response = self._search(conn, query)
         except pysolr.SolrError as e:
             # Error with the sort parameter.  You see slightly different
             # error messages depending on whether the SOLR JSON comes back
@@ -168,8 +283,20 @@ class PatchedPackageSearchQuery(PackageSearchQuery):
             raise SearchError(
                 "SOLR returned an error running query: %r Error: %r" % (query, e)
             )
+        finally:
+            solr_seconds = perf_counter() - solr_start
+            timing.record("solr", solr_seconds)
+
+        # Split the round trip into the time Solr spent on the query
+        # and everything else (network, response encoding/decoding)
+        if solr_response.qtime is not None:
+            qtime_seconds = solr_response.qtime / 1000
+            timing.record("solr_qtime", qtime_seconds)
+            timing.record("solr_network", max(solr_seconds - qtime_seconds, 0.0))
+
         self.count = solr_response.hits
         self.results = cast("list[Any]", solr_response.docs)
+        self.next_cursor_mark = solr_response.nextCursorMark
 
         # #1683 Filter out the last row that is sometimes out of order
         self.results = self.results[:rows_to_return]
@@ -189,14 +316,53 @@ class PatchedPackageSearchQuery(PackageSearchQuery):
             self.results = [r.get(query["fl"]) for r in self.results]
 
         # get facets and convert facets list to a dict
-        self.facets = solr_response.facets.get("facet_fields", {})
-        for field, values in self.facets.items():
-            self.facets[field] = dict(zip(values[0::2], values[1::2]))
+        if snapshot is not None and snapshot.facets is not None:
+            self.facets = snapshot.facets
+        else:
+            self.facets = solr_response.facets.get("facet_fields", {})
+            for field, values in self.facets.items():
+                self.facets[field] = dict(zip(values[0::2], values[1::2]))
+            if snapshot is not None:
+                snapshot.store(self.facets)
 
         # Get Solr highlighting
         self.highlighting = solr_response.highlighting
 
+        slow_log.record_query(
+            query, solr_response.qtime, self.count, len(self.results), self.facets, stale=self.stale
+        )
+
         return {"results": self.results, "count": self.count}
 
+    def _search(self, conn: pysolr.Solr, query: dict[str, Any]) -> pysolr.Results:
+        # Identical concurrent queries share one Solr request
+        def _query_solr():
+            with metrics.count_outcome(metrics.SOLR_QUERIES):
+                return circuit_breaker.call(
+                    conn, query, lambda params: conn.search(**params).raw_response
+                )
+
+        store = last_known_good()
+        key = singleflight.query_key(query)
+        try:
+            raw_response = singleflight.coalesce(query, _query_solr)
+        except pysolr.SolrError as e:
+            stale = store.get(key) if circuit_breaker.is_failure(e) else None
+            if stale is None:
+                raise
+            log.warning("Solr is unavailable, serving stale results: %s", e)
+            metrics.STALE_SEARCHES.inc()
+            self.stale = True
+            return pysolr.Results(json.loads(stale))
+
+        # Responses cut short by timeAllowed aren't worth keeping
+        if (
+            store.max_bytes
+            and _reusable(query)
+            and not raw_response.get("responseHeader", {}).get("partialResults")
+        ):
+            store.set(key, json.dumps(raw_response))
+        return pysolr.Results(raw_response)
+
 
 _QUERIES["package"] = PatchedPackageSearchQuery
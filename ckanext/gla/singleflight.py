@@ -0,0 +1,145 @@
+"""
+Single-flight coalescing of identical Solr queries.
+
+When many identical searches arrive at once (e.g. a dataset linked from
+the London Datastore homepage) only the first one is sent to Solr; the
+others wait for it and share its response.
+
+Within a worker this always applies when ``dfl.search.coalesce`` is
+enabled. With ``dfl.search.coalesce-across-workers`` the first worker
+also takes a short lived lock in Redis and publishes the response
+there, so the other workers wait for it too instead of each sending
+their own query.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from ckan.common import config
+from ckan.lib.redis import connect_to_redis
+
+from .metrics import COALESCED_QUERIES
+
+log = logging.getLogger(__name__)
+
+# How long a response stays in Redis for workers that were waiting on
+# it. Anything arriving later starts a new flight.
+SHARED_RESULT_TTL_MS = 1000
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Call ``fn``, unless a call with the same key is already in
+        flight, in which case wait for it and return a copy of its
+        result (or raise its error).
+
+        Every caller gets its own copy, so results can be modified
+        freely.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.followers += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            COALESCED_QUERIES.labels(scope="worker").inc()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.value)
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                followers = call.followers
+            call.done.set()
+
+        # Nobody else can join once the call is removed, so without
+        # followers the result is ours alone.
+        return copy.deepcopy(call.value) if followers else call.value
+
+
+_flights = SingleFlight()
+
+
+def _shared_do(key: str, fn: Callable[[], Any]) -> Any:
+    redis = connect_to_redis()
+    lock_key = f"gla:singleflight:{key}:lock"
+    result_key = f"gla:singleflight:{key}:result"
+    wait = config.get("dfl.search.coalesce-wait")
+
+    try:
+        leader = redis.set(lock_key, os.getpid(), nx=True, px=int(wait * 1000))
+    except Exception:
+        log.warning("Could not coalesce search across workers", exc_info=True)
+        return fn()
+
+    if leader:
+        try:
+            value = fn()
+            redis.set(result_key, json.dumps(value), px=SHARED_RESULT_TTL_MS)
+            return value
+        finally:
+            redis.delete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        result = redis.get(result_key)
+        if result is not None:
+            COALESCED_QUERIES.labels(scope="shared").inc()
+            return json.loads(result)
+        if not redis.exists(lock_key):
+            # The leader failed, or its result has already expired
+            break
+        time.sleep(0.01)
+    return fn()
+
+
+def query_key(params: dict[str, Any]) -> str:
+    return hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def coalesce(params: dict[str, Any], fn: Callable[[], Any]) -> Any:
+    """Run ``fn``, which sends the query ``params`` to Solr and returns
+    a JSON serialisable response, sharing the response between
+    concurrent callers with identical parameters.
+
+    ``params`` must be the final parameters sent to Solr, including the
+    permission label filter, so responses are only shared between
+    users who are allowed to see the same results.
+    """
+    if not config.get("dfl.search.coalesce"):
+        return fn()
+
+    key = query_key(params)
+    if config.get("dfl.search.coalesce-across-workers"):
+        return _flights.do(key, lambda: _shared_do(key, fn))
+    return _flights.do(key, fn)
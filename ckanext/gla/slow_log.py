@@ -0,0 +1,164 @@
+"""
+A log of slow searches, with what's needed to reproduce them.
+
+Searches through package_search taking at least
+``dfl.search.slow-log-threshold`` milliseconds are written as JSON
+lines to ``dfl.search.slow-log``, with the final Solr parameters (after
+the multi-select and permission label filters are added), Solr's
+QTime, the total wall time, the number of results and facet values,
+and the permission class of the user (see auth.permission_class).
+Searches that fail, e.g. on the search deadline or a Solr error, are
+logged with the exception as ``error``, and those answered with stale
+results while Solr is unavailable are flagged as ``stale``.
+
+Entries are handed to a background thread through a queue, so the
+search never waits on the disk. The file is rotated at
+``dfl.search.slow-log-max-bytes``, keeping ``BACKUP_COUNT`` old files.
+
+The ``debug_slow_search`` action re-runs a logged search, by its
+``id``, through ``debug_dataset_search`` to get Solr's explain.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any, Iterator, Optional
+
+from ckan.common import config
+
+from . import auth
+
+log = logging.getLogger(__name__)
+
+BACKUP_COUNT = 5
+
+_search: ContextVar[Optional[dict[str, Any]]] = ContextVar("gla_slow_log_search", default=None)
+
+_logger: Optional[logging.Logger] = None
+_logger_lock = threading.Lock()
+
+
+def _slow_logger() -> logging.Logger:
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                handler = logging.handlers.RotatingFileHandler(
+                    config.get("dfl.search.slow-log"),
+                    maxBytes=config.get("dfl.search.slow-log-max-bytes"),
+                    backupCount=BACKUP_COUNT,
+                    encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                records: queue.SimpleQueue = queue.SimpleQueue()
+                listener = logging.handlers.QueueListener(records, handler)
+                listener.start()
+                atexit.register(listener.stop)
+
+                logger = logging.getLogger("ckanext.gla.slow_searches")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(logging.handlers.QueueHandler(records))
+                _logger = logger
+    return _logger
+
+
+def enabled() -> bool:
+    return bool(config.get("dfl.search.slow-log"))
+
+
+def record_params(params: dict[str, Any]) -> None:
+    """Note the Solr parameters of the search being watched, if any,
+    before they are sent."""
+    search = _search.get()
+    if search is not None:
+        search.update(params=dict(params), qtime_ms=None, hits=None, rows=None, facet_values=None)
+
+
+def record_query(
+    params: dict[str, Any],
+    qtime: Optional[int],
+    hits: int,
+    rows: int,
+    facets: dict[str, Any],
+    stale: bool = False,
+) -> None:
+    """Note the Solr query of the search being watched, if any, and its
+    results."""
+    search = _search.get()
+    if search is not None:
+        search.update(
+            params=dict(params),
+            qtime_ms=qtime,
+            hits=hits,
+            rows=rows,
+            facet_values=sum(len(values) for values in facets.values()),
+        )
+        if stale:
+            search["stale"] = True
+
+
+@contextmanager
+def watch(context: dict[str, Any]) -> Iterator[None]:
+    """Log the search run in this block if it turns out to be slow."""
+    if not enabled():
+        yield
+        return
+    search: dict[str, Any] = {}
+    token = _search.set(search)
+    start = perf_counter()
+    try:
+        yield
+    except Exception as e:
+        search["error"] = repr(e)
+        raise
+    finally:
+        _search.reset(token)
+        wall_ms = (perf_counter() - start) * 1000
+        if "params" in search and wall_ms >= config.get("dfl.search.slow-log-threshold"):
+            _write(search, wall_ms, context)
+
+
+def _write(search: dict[str, Any], wall_ms: float, context: dict[str, Any]) -> None:
+    entry = {
+        "id": uuid.uuid4().hex[:16],
+        "time": datetime.now(timezone.utc).isoformat(),
+        "wall_ms": round(wall_ms, 1),
+        "qtime_ms": search["qtime_ms"],
+        "rows": search["rows"],
+        "hits": search["hits"],
+        "facet_values": search["facet_values"],
+        "permission_class": auth.permission_class(context.get("user")),
+        "params": search["params"],
+    }
+    for flag in ("error", "stale"):
+        if flag in search:
+            entry[flag] = search[flag]
+    try:
+        _slow_logger().info(json.dumps(entry, default=str))
+    except Exception:
+        log.warning("Could not log slow search", exc_info=True)
+
+
+def find(entry_id: str) -> Optional[dict[str, Any]]:
+    """The logged search with the given id, from the current or rotated
+    log files."""
+    path = config.get("dfl.search.slow-log")
+    for suffix in [""] + [f".{i}" for i in range(1, BACKUP_COUNT + 1)]:
+        try:
+            with open(path + suffix, encoding="utf-8") as f:
+                for line in f:
+                    if entry_id in line:
+                        entry = json.loads(line)
+                        if entry.get("id") == entry_id:
+                            return entry
+        except FileNotFoundError:
+            continue
+    return None
@@ -0,0 +1,365 @@
+"""
+Type-ahead suggestions for the search box.
+
+Dataset titles, organisation titles and project names are kept in an
+in-memory prefix index in each worker: a sorted array of the
+normalised text from the start of each word, searched with bisect, so
+a suggestion never touches Solr or the database.
+
+The index is built from Solr (and the organisation table) in a
+background thread when the worker starts. It is then kept current
+incrementally: ``before_dataset_index`` updates the datasets indexed by
+this worker straight away, and datasets indexed by other workers are
+fetched in the background once the index generation (see
+index_generation.py) moves on. A worker that hasn't caught up for
+longer than the index times are kept rebuilds its index instead.
+
+Datasets keep their permission labels, and a project is labelled with
+the union of its datasets' labels, so users are only suggested what
+their searches could find.
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Any, Iterable, NamedTuple, Optional
+
+import ckan.plugins.toolkit as toolkit
+from ckan import model
+from ckan.common import config
+from ckan.lib.plugins import get_permission_labels
+from ckan.lib.search.common import make_connection
+from ckan.lib.search.query import solr_literal
+from ckan.types import Context, DataDict
+from flask import Flask, current_app
+
+from . import index_generation, index_updates
+from .search_highlight.action import permission_labels
+
+log = logging.getLogger(__name__)
+
+DATASET_FIELDS = "id,name,title,state,organization,extras_project_name,permission_labels"
+
+# Suggestions match from the start of any of the first few words of
+# the text, up to this many characters
+MAX_WORDS = 8
+MAX_KEY_LENGTH = 64
+
+# How often a worker checks whether other workers have indexed
+# anything, and at most how long it goes without a full check
+SYNC_INTERVAL = 1.0
+MAX_SYNC_AGE = 60.0
+# Datasets are counted as indexed a little before Solr has them
+SETTLE_SECONDS = 10.0
+
+MAX_LIMIT = 20
+KINDS = ("dataset", "organization", "project")
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+class Suggestion(NamedTuple):
+    kind: str
+    name: str
+    title: str
+
+
+class _Entry(NamedTuple):
+    suggestion: Suggestion
+    # None if everyone can see it
+    labels: Optional[frozenset[str]]
+    normalised: str
+    keys: tuple[str, ...]
+
+
+def normalise(text: str) -> str:
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _keys(normalised: str) -> tuple[str, ...]:
+    words = normalised.split()
+    return tuple(
+        dict.fromkeys(" ".join(words[i:])[:MAX_KEY_LENGTH] for i in range(min(len(words), MAX_WORDS)))
+    )
+
+
+class PrefixIndex:
+    def __init__(self) -> None:
+        self._keys: list[tuple[str, str]] = []
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, ref: str, suggestion: Suggestion, labels: Optional[Iterable[str]] = None) -> None:
+        normalised = normalise(suggestion.title)
+        entry = _Entry(
+            suggestion,
+            None if labels is None else frozenset(labels),
+            normalised,
+            _keys(normalised),
+        )
+        with self._lock:
+            self._remove(ref)
+            self._entries[ref] = entry
+            for key in entry.keys:
+                insort(self._keys, (key, ref))
+
+    def remove(self, ref: str) -> None:
+        with self._lock:
+            self._remove(ref)
+
+    def _remove(self, ref: str) -> None:
+        entry = self._entries.pop(ref, None)
+        if entry is None:
+            return
+        for key in entry.keys:
+            i = bisect_left(self._keys, (key, ref))
+            if i < len(self._keys) and self._keys[i] == (key, ref):
+                del self._keys[i]
+
+    def search(self, prefix: str, labels: Optional[set[str]], limit: int) -> list[Suggestion]:
+        """Suggestions with a word starting with ``prefix``, those whose
+        text starts with it first, that can be seen with ``labels``
+        (None for everything)."""
+        prefix = normalise(prefix)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        # Enough candidates to rank, without scanning the whole index
+        # for a one letter prefix
+        wanted = limit * 5
+        found: dict[str, _Entry] = {}
+        # The sync thread and indexing change the keys in place
+        with self._lock:
+            keys, entries = self._keys, self._entries
+            i = bisect_left(keys, (prefix, ""))
+            while i < len(keys) and len(found) < wanted:
+                key, ref = keys[i]
+                if not key.startswith(prefix):
+                    break
+                entry = entries.get(ref)
+                if entry is not None and ref not in found and (
+                    labels is None or entry.labels is None or not entry.labels.isdisjoint(labels)
+                ):
+                    found[ref] = entry
+                i += 1
+        ranked = sorted(
+            found.values(),
+            key=lambda e: (not e.normalised.startswith(prefix), KINDS.index(e.suggestion.kind), len(e.normalised)),
+        )
+        return [e.suggestion for e in ranked[:limit]]
+
+
+class SuggestIndex:
+    """The suggestions of one worker."""
+
+    def __init__(self) -> None:
+        self.prefixes = PrefixIndex()
+        # Each dataset's project, and each project's datasets' labels
+        self._projects_of: dict[str, str] = {}
+        self._project_labels: dict[str, dict[str, frozenset[str]]] = {}
+        self._organizations: set[str] = set()
+        self._lock = threading.Lock()
+
+    def put_dataset(self, doc: dict[str, Any], labels: Iterable[str]) -> None:
+        if doc.get("state", "active") != "active":
+            self.remove_dataset(doc["id"])
+            return
+        labels = frozenset(labels)
+        self.prefixes.put(
+            f"dataset:{doc['id']}", Suggestion("dataset", doc["name"], doc.get("title") or doc["name"]), labels
+        )
+        self._set_project(doc["id"], doc.get("extras_project_name") or None, labels)
+
+    def remove_dataset(self, dataset_id: str) -> None:
+        self.prefixes.remove(f"dataset:{dataset_id}")
+        self._set_project(dataset_id, None, frozenset())
+
+    def _set_project(self, dataset_id: str, project: Optional[str], labels: frozenset[str]) -> None:
+        with self._lock:
+            changed = set()
+            previous = self._projects_of.pop(dataset_id, None)
+            if previous is not None:
+                self._project_labels.get(previous, {}).pop(dataset_id, None)
+                changed.add(previous)
+            if project:
+                self._projects_of[dataset_id] = project
+                self._project_labels.setdefault(project, {})[dataset_id] = labels
+                changed.add(project)
+            for name in changed:
+                members = self._project_labels.get(name)
+                if members:
+                    self.prefixes.put(
+                        f"project:{name}",
+                        Suggestion("project", name, name),
+                        frozenset().union(*members.values()),
+                    )
+                else:
+                    self._project_labels.pop(name, None)
+                    self.prefixes.remove(f"project:{name}")
+
+    def put_organizations(self) -> None:
+        organizations = (
+            model.Session.query(model.Group.name, model.Group.title)
+            .filter(model.Group.is_organization == True, model.Group.state == "active")  # noqa: E712
+            .all()
+        )
+        for name, title in organizations:
+            self.prefixes.put(f"organization:{name}", Suggestion("organization", name, title or name))
+        names = {name for name, _title in organizations}
+        for name in self._organizations - names:
+            self.prefixes.remove(f"organization:{name}")
+        self._organizations = names
+
+
+_index: Optional[SuggestIndex] = None
+_synced_generation: Optional[int] = None
+_synced_at = 0.0
+_checked_at = 0.0
+_sync_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+
+
+def _iter_documents() -> Iterable[dict[str, Any]]:
+    """Every active dataset in the search index."""
+    conn = make_connection(decode_dates=False)
+    cursor = "*"
+    while True:
+        response = conn.search(
+            q="*:*",
+            fq=["+site_id:%s" % solr_literal(config.get("ckan.site_id")), "+state:active"],
+            fl=DATASET_FIELDS,
+            sort="id asc",
+            rows=1000,
+            cursorMark=cursor,
+            wt="json",
+        )
+        yield from response.docs
+        if response.nextCursorMark == cursor:
+            return
+        cursor = response.nextCursorMark
+
+
+def _build() -> None:
+    global _index, _synced_generation, _synced_at
+    started, generation = time.time(), index_generation.current()
+    index = SuggestIndex()
+    for doc in _iter_documents():
+        index.put_dataset(doc, doc.get("permission_labels", []))
+    index.put_organizations()
+    _index, _synced_generation, _synced_at = index, generation, started
+    log.info("Built the suggest index of %d entries in %.1fs", len(index.prefixes), time.time() - started)
+
+
+def _sync() -> None:
+    """Catch up with datasets indexed by other workers."""
+    global _synced_generation, _synced_at
+    assert _index is not None
+    started, generation = time.time(), index_generation.current()
+    changed = index_generation.changed_since(_synced_at - SETTLE_SECONDS)
+    if changed is None:
+        # Too long ago to know what changed
+        _build()
+        return
+    docs = index_updates.fetch(changed, fl=DATASET_FIELDS)
+    for dataset_id in changed:
+        doc = docs.get(dataset_id)
+        if doc is None:
+            _index.remove_dataset(dataset_id)
+        else:
+            _index.put_dataset(doc, doc.get("permission_labels", []))
+    _index.put_organizations()
+    _synced_generation, _synced_at = generation, started
+
+
+def _run(app: Flask, work) -> None:
+    global _worker
+    try:
+        with app.test_request_context():
+            work()
+    except Exception:
+        log.exception("Could not update the suggest index")
+    finally:
+        model.Session.remove()
+        _worker = None
+
+
+def _start(work) -> None:
+    global _worker
+    with _sync_lock:
+        if _worker is None:
+            _worker = threading.Thread(
+                target=_run,
+                args=(current_app._get_current_object(), work),
+                name="gla-suggest",
+                daemon=True,
+            )
+            _worker.start()
+
+
+def start() -> None:
+    """Build this worker's index, or bring it up to date, in the
+    background. Called before each request, so it costs one Redis read
+    a second at most."""
+    global _checked_at
+    now = time.time()
+    if now - _checked_at < SYNC_INTERVAL or _worker is not None:
+        return
+    _checked_at = now
+    if _index is None:
+        _start(_build)
+    elif now - _synced_at > MAX_SYNC_AGE or index_generation.current() != _synced_generation:
+        _start(_sync)
+
+
+def index_dataset(pkg_dict: dict[str, Any]) -> None:
+    """Update the suggestions of a dataset being indexed by this worker."""
+    if _index is None:
+        return
+    package = model.Package.get(pkg_dict["id"])
+    labels = get_permission_labels().get_dataset_labels(package) if package else []
+    _index.put_dataset(pkg_dict, labels)
+
+
+def remove_dataset(reference: str) -> None:
+    """Drop the suggestions of a deleted dataset, by id or name."""
+    if _index is not None:
+        package = model.Package.get(reference)
+        _index.remove_dataset(package.id if package else reference)
+
+
+def suggest(q: str, labels: Optional[Iterable[str]], limit: int = 10) -> list[dict[str, str]]:
+    """Suggestions for the search box text ``q``, that can be seen with
+    the permission ``labels`` (None for everything). Empty until the
+    index has been built."""
+    if _index is None:
+        return []
+    suggestions = _index.prefixes.search(
+        q, None if labels is None else set(labels), max(1, min(limit, MAX_LIMIT))
+    )
+    return [s._asdict() for s in suggestions]
+
+
+@toolkit.side_effect_free
+def search_suggest(context: Context, data_dict: DataDict) -> list[dict[str, str]]:
+    """
+    Suggest datasets, organisations and projects for text typed into
+    the search box, without searching Solr.
+
+    :param q: the text typed so far; each suggestion has a word starting
+        with it
+    :type q: string
+    :param limit: the number of suggestions, at most 20 (default 10)
+    :type limit: int
+
+    Returns suggestions with their ``kind`` (``dataset``,
+    ``organization`` or ``project``), ``name`` and ``title``, best
+    first.
+    """
+    try:
+        limit = int(data_dict.get("limit", 10))
+    except (TypeError, ValueError):
+        raise toolkit.ValidationError({"limit": [toolkit._("Must be a whole number")]})
+    return suggest(str(data_dict.get("q") or ""), permission_labels(context), limit)
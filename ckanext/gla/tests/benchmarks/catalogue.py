@@ -0,0 +1,172 @@
+"""
+Synthetic catalogue generator for the benchmarks.
+
+Produces dataset dicts shaped like ``package_show`` output, plus the
+matching Solr documents, with realistic long HTML descriptions. The
+output is deterministic for a given seed so benchmark runs on
+different commits are comparable.
+"""
+import json
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+WORDS = (
+    "london borough population housing transport employment health "
+    "education crime air quality emissions planning census ward "
+    "income deprivation tenure rent earnings travel cycling bus "
+    "underground schools pupils hospital admissions licensing waste "
+    "recycling energy consumption greenspace trees flooding noise "
+    "survey estimates projections annual quarterly monthly mayor "
+    "assembly budget spending contracts procurement economy business"
+).split()
+
+FORMATS = ["CSV", "XLSX", "XLS", "spreadsheet", "PDF", "DOCX", "GeoJSON", "SHP", "JSON", "ZIP"]
+FREQUENCIES = ["Daily", "Weekly", "Monthly", "Quarterly", "Annually", "Ad hoc"]
+GEOGRAPHIES = ["Borough", "Ward", "MSOA", "LSOA", "Output area", "Postcode"]
+
+
+@dataclass
+class CatalogueSpec:
+    datasets: int = 200
+    resources_per_dataset: int = 5
+    organisations: int = 30
+    notes_paragraphs: int = 12
+    seed: int = 1
+
+
+def _sentence(rng: random.Random, min_words: int = 8, max_words: int = 24) -> str:
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return " ".join(words).capitalize() + "."
+
+
+def _html_notes(rng: random.Random, paragraphs: int) -> str:
+    parts = []
+    for i in range(paragraphs):
+        sentences = " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+        if i % 4 == 1:
+            parts.append(
+                f'<p>{sentences} See <a href="https://data.london.gov.uk/{rng.choice(WORDS)}">'
+                f"the {rng.choice(WORDS)} release</a>.</p>"
+            )
+        elif i % 4 == 2:
+            items = "".join(f"<li><strong>{rng.choice(WORDS)}</strong> {_sentence(rng)}</li>" for _ in range(4))
+            parts.append(f"<ul>{items}</ul>")
+        elif i % 4 == 3:
+            parts.append(f'<p style="color: red">{sentences}<br/>{_sentence(rng)}</p>')
+        else:
+            parts.append(f"<p>{sentences}</p>")
+    # Harvested descriptions occasionally include markup we strip
+    parts.append("<script>console.log('tracking')</script>")
+    return "\n".join(parts)
+
+
+def _resource(rng: random.Random, package_id: str, position: int, created: datetime) -> dict[str, Any]:
+    file_format = rng.choice(FORMATS)
+    coverage_from = datetime(2010, 1, 1) + timedelta(days=rng.randint(0, 3000))
+    coverage_to = coverage_from + timedelta(days=rng.randint(30, 1500))
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "package_id": package_id,
+        "position": position,
+        "name": f"{rng.choice(WORDS)}-{rng.choice(WORDS)}_{2010 + position}.{file_format.lower()}",
+        "description": _sentence(rng),
+        "format": file_format,
+        "mimetype": None,
+        "size": rng.choice([None, rng.randint(1_000, 500_000_000)]),
+        "url": f"https://data.london.gov.uk/download/{package_id}/{position}",
+        "created": created.isoformat(),
+        "last_modified": (created + timedelta(days=position)).isoformat(),
+        "metadata_modified": (created + timedelta(days=position)).isoformat(),
+        "temporal_coverage_from": coverage_from.strftime("%Y-%m-%d"),
+        "temporal_coverage_to": coverage_to.strftime("%Y-%m-%d"),
+    }
+
+
+def generate(spec: CatalogueSpec) -> list[dict[str, Any]]:
+    """Return ``spec.datasets`` dataset dicts."""
+    rng = random.Random(spec.seed)
+    organisations = [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": f"org-{i}",
+            "title": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}",
+            "type": "organization",
+            "is_organization": True,
+        }
+        for i in range(spec.organisations)
+    ]
+
+    datasets = []
+    for i in range(spec.datasets):
+        package_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        created = datetime(2018, 1, 1) + timedelta(days=rng.randint(0, 2000))
+        title = " ".join(rng.choices(WORDS, k=rng.randint(3, 8))).title()
+        organisation = rng.choice(organisations)
+        extras = [
+            {"key": "update_frequency", "value": rng.choice(FREQUENCIES)},
+            {"key": "london_smallest_geography", "value": rng.choice(GEOGRAPHIES)},
+            {"key": "project_name", "value": f"{rng.choice(WORDS).title()} programme"},
+            {"key": "dataset_boost", "value": str(round(rng.random(), 4))},
+            {"key": "data_quality", "value": str(rng.randint(1, 5))},
+        ]
+        datasets.append(
+            {
+                "id": package_id,
+                "name": f"dataset-{i}-{title.lower().replace(' ', '-')}"[:100],
+                "title": title,
+                "type": "dataset",
+                "state": "active",
+                "private": i % 10 == 0,
+                "notes": _html_notes(rng, spec.notes_paragraphs),
+                "search_description": _sentence(rng, 20, 40),
+                "license_id": "OGL-UK-3.0",
+                "license_title": "UK Open Government Licence (OGL v3)",
+                "owner_org": organisation["id"],
+                "organization": organisation,
+                "metadata_created": created.isoformat(),
+                "metadata_modified": (created + timedelta(days=30)).isoformat(),
+                "extras": extras,
+                "tags": [{"name": rng.choice(WORDS)} for _ in range(rng.randint(1, 6))],
+                "resources": [
+                    _resource(rng, package_id, position, created)
+                    for position in range(spec.resources_per_dataset)
+                ],
+                "num_resources": spec.resources_per_dataset,
+            }
+        )
+    return datasets
+
+
+def index_document(dataset: dict[str, Any]) -> dict[str, Any]:
+    """The pkg_dict CKAN passes to ``before_dataset_index`` for a
+    dataset."""
+    document = {
+        "id": dataset["id"],
+        "index_id": f"bench-{dataset['id']}",
+        "site_id": "default",
+        "name": dataset["name"],
+        "title": dataset["title"],
+        "notes": dataset["notes"],
+        "state": dataset["state"],
+        "capacity": "private" if dataset["private"] else "public",
+        "organization": dataset["organization"]["name"],
+        "owner_org": dataset["owner_org"],
+        "res_format": [r["format"] for r in dataset["resources"]],
+        "res_name": [r["name"] for r in dataset["resources"]],
+        "metadata_modified": dataset["metadata_modified"] + "Z",
+        "validated_data_dict": json.dumps(dataset),
+        "data_dict": json.dumps(dataset),
+    }
+    for extra in dataset["extras"]:
+        document[f"extras_{extra['key']}"] = extra["value"]
+    return document
+
+
+def solr_document(dataset: dict[str, Any]) -> dict[str, Any]:
+    """A stored Solr document, as returned by a search."""
+    document = index_document(dataset)
+    document["notes_with_markup"] = dataset["notes"]
+    return document
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from ckan.lib.search.common import SolrSettings
+
+from . import catalogue
+from .fake_solr import FakeSolr
+
+BENCHMARKS_DIR = os.path.dirname(__file__)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: a benchmark, only run with -m benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Mark the benchmarks, and skip them unless they were selected with
+    ``-m benchmark``, so they stay out of the ordinary test run."""
+    selected = "benchmark" in (config.getoption("markexpr") or "")
+    skip = pytest.mark.skip(reason="benchmarks only run with -m benchmark")
+    for item in items:
+        if str(item.fspath).startswith(BENCHMARKS_DIR):
+            item.add_marker(pytest.mark.benchmark)
+            if not selected:
+                item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def catalogue_spec():
+    """The size of the synthetic catalogue can be changed with the
+    GLA_BENCH_DATASETS, GLA_BENCH_RESOURCES, GLA_BENCH_ORGANISATIONS and
+    GLA_BENCH_NOTES_PARAGRAPHS environment variables."""
+    return catalogue.CatalogueSpec(
+        datasets=int(os.environ.get("GLA_BENCH_DATASETS", 200)),
+        resources_per_dataset=int(os.environ.get("GLA_BENCH_RESOURCES", 5)),
+        organisations=int(os.environ.get("GLA_BENCH_ORGANISATIONS", 30)),
+        notes_paragraphs=int(os.environ.get("GLA_BENCH_NOTES_PARAGRAPHS", 12)),
+    )
+
+
+@pytest.fixture(scope="session")
+def datasets(catalogue_spec):
+    return catalogue.generate(catalogue_spec)
+
+
+@pytest.fixture(scope="session")
+def fake_solr_server(datasets):
+    server = FakeSolr([catalogue.solr_document(d) for d in datasets]).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fake_solr(fake_solr_server):
+    """Point CKAN's Solr connections at the fake server for the
+    duration of a test."""
+    original = SolrSettings.get()
+    SolrSettings.init(fake_solr_server.url)
+    yield fake_solr_server
+    SolrSettings.init(*original)
@@ -0,0 +1,111 @@
+"""
+An in-process HTTP server that answers Solr ``/select`` requests with
+canned documents, facet counts and highlighting, so the search
+pipeline can be benchmarked without a network or a real Solr.
+"""
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeSolr:
+    def __init__(self, documents: list[dict[str, Any]], qtime: int = 3):
+        self.documents = documents
+        self.qtime = qtime
+        self.requests: list[dict[str, list[str]]] = []
+        self.facet_counts = self._facet_counts(documents)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/solr/ckan"
+
+    def start(self) -> "FakeSolr":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _facet_counts(documents: list[dict[str, Any]]) -> dict[str, Counter]:
+        counts: dict[str, Counter] = {}
+        for document in documents:
+            for field in ("organization", "res_format", "extras_update_frequency", "extras_london_smallest_geography", "extras_project_name"):
+                values = document.get(field)
+                if values is None:
+                    continue
+                if not isinstance(values, list):
+                    values = [values]
+                counts.setdefault(field.removeprefix("extras_"), Counter()).update(values)
+        return counts
+
+    def _highlighting(self, documents: list[dict[str, Any]], q: str) -> dict[str, Any]:
+        term = q.split()[0].strip('"') if q and q != "*:*" else None
+        if not term:
+            return {}
+        highlighting = {}
+        for document in documents:
+            snippet = document["notes"][:200].replace(term, f"[[{term}]]")
+            highlighting[document["index_id"]] = {
+                "title": [document["title"].replace(term.title(), f"[[{term.title()}]]")],
+                "notes_hl": [snippet],
+            }
+        return highlighting
+
+    def response(self, params: dict[str, list[str]]) -> dict[str, Any]:
+        self.requests.append(params)
+        rows = int(params.get("rows", ["10"])[0])
+        start = int(params.get("start", ["0"])[0])
+        q = params.get("q", ["*:*"])[0]
+        documents = self.documents[start:start + rows]
+
+        facet_fields = {}
+        for field in params.get("facet.field", []):
+            name = field.split("}")[-1]
+            values = []
+            for value, count in self.facet_counts.get(name, Counter()).most_common():
+                values.extend([value, count])
+            facet_fields[name] = values
+
+        response = {
+            "responseHeader": {"status": 0, "QTime": self.qtime, "params": {}},
+            "response": {"numFound": len(self.documents), "start": start, "docs": documents},
+            "facet_counts": {"facet_queries": {}, "facet_fields": facet_fields},
+        }
+        if params.get("hl", ["off"])[0] in ("on", "true"):
+            response["highlighting"] = self._highlighting(documents, q)
+        return response
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, params):
+                if not urlparse(self.path).path.endswith("/select"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(fake.response(params)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._respond(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,96 @@
+"""
+Solr query time with highlighting off, highlighting the full text
+fields, and highlighting their bounded copies (see
+search_highlight/fields.py), over the datasets with the longest
+descriptions.
+
+Unlike the other benchmarks this needs a real, populated Solr core,
+so it only runs when GLA_BENCH_SOLR_URL is set, e.g.:
+
+    GLA_BENCH_SOLR_URL=http://localhost:8983/solr/ckan \\
+        pytest --ckan-ini=test.ini ckanext/gla/tests/benchmarks/test_highlight_qtime.py
+
+Solr's median QTime for each mode is saved in the benchmark's
+``extra_info``, alongside the round trip time pytest-benchmark
+measures.
+"""
+import os
+import statistics
+
+import pysolr
+import pytest
+
+from ckanext.gla.search import query_fields
+from ckanext.gla.search_highlight import fields as highlight_fields
+
+SOLR_URL = os.environ.get("GLA_BENCH_SOLR_URL")
+LARGEST = int(os.environ.get("GLA_BENCH_LARGEST_DOCUMENTS", 20))
+
+pytestmark = pytest.mark.skipif(not SOLR_URL, reason="GLA_BENCH_SOLR_URL is not set")
+
+HIGHLIGHTING = {
+    "hl": "on",
+    "hl.method": "unified",
+    "hl.fragsizeIsMinimum": "false",
+    "hl.requireFieldMatch": "true",
+    "hl.snippets": "1",
+    "hl.fragsize": "200",
+    "hl.bs.type": "SENTENCE",
+    "hl.simple.pre": "[[",
+    "hl.simple.post": "]]",
+}
+
+MODES = {
+    "off": {"hl": "false"},
+    "full": {
+        **HIGHLIGHTING,
+        "hl.fl": "title,title_phrase,notes,notes_phrase,search_description,search_description_phrase",
+        "hl.maxAnalyzedChars": "250000",
+    },
+    # Plus search_highlight.fields.search_params(), which needs the config
+    "bounded": HIGHLIGHTING,
+}
+
+
+@pytest.fixture(scope="module")
+def solr():
+    return pysolr.Solr(SOLR_URL, timeout=30)
+
+
+@pytest.fixture(scope="module")
+def queries(solr):
+    """A query for a word near the end of each of the longest
+    descriptions, so the highlighter has to reach it."""
+    docs = solr.search("*:*", fl="index_id,notes", rows=5000, wt="json").docs
+    docs = sorted(docs, key=lambda d: len(d.get("notes") or ""), reverse=True)[:LARGEST]
+    queries = []
+    for doc in docs:
+        words = [w for w in (doc.get("notes") or "").split() if w.isalpha() and len(w) > 4]
+        if words:
+            queries.append(words[-1].lower())
+    if not queries:
+        pytest.skip("No datasets with descriptions in the index")
+    return queries
+
+
+@pytest.mark.usefixtures("with_plugins")
+@pytest.mark.parametrize("mode", MODES)
+def test_highlight_qtime(benchmark, solr, queries, mode):
+    params = dict(MODES[mode])
+    if mode == "bounded":
+        params.update(highlight_fields.search_params())
+
+    qtimes = []
+
+    def run():
+        for q in queries:
+            response = solr.search(
+                q, defType="edismax", qf=query_fields({"q": q}), rows=20, wt="json", **params
+            )
+            qtimes.append(response.qtime)
+
+    benchmark.pedantic(run, rounds=10, warmup_rounds=1)
+
+    benchmark.extra_info["queries"] = len(queries)
+    benchmark.extra_info["median_qtime_ms"] = statistics.median(qtimes)
+    benchmark.extra_info["max_qtime_ms"] = max(qtimes)
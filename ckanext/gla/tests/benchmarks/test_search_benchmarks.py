@@ -0,0 +1,104 @@
+"""
+Benchmarks for the search and indexing hot paths.
+
+These use pytest-benchmark and a fake Solr server (see fake_solr.py),
+so no network or search index is needed. To keep a history of results
+and compare against the previous run, do:
+
+    pytest --ckan-ini=test.ini ckanext/gla/tests/benchmarks \
+        --benchmark-autosave --benchmark-compare
+
+Results are stored under .benchmarks/, named after the current commit.
+"""
+import copy
+import json
+
+import pytest
+
+import ckan.plugins as plugins
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.gla.search_highlight.action import filtered_facets
+
+from . import catalogue
+
+
+@pytest.fixture
+def gla_plugin():
+    return plugins.get_plugin("gla")
+
+
+@pytest.fixture
+def large_dataset(datasets):
+    return max(datasets, key=lambda d: len(d["notes"]))
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+def test_package_search(benchmark, fake_solr, test_request_context):
+    data_dict = {
+        "q": "housing",
+        "rows": 20,
+        "facet.field": json.dumps(["dfl_res_format_group", "res_format", "organization", "project_name"]),
+    }
+
+    def search():
+        with test_request_context("/dataset?q=housing"):
+            return toolkit.get_action("package_search")({"for_view": True}, dict(data_dict))
+
+    result = benchmark(search)
+
+    assert result["count"] == len(fake_solr.documents)
+    assert len(result["results"]) == 20
+
+
+@pytest.mark.usefixtures("with_plugins")
+def test_before_dataset_index(benchmark, gla_plugin, large_dataset):
+    document = catalogue.index_document(large_dataset)
+
+    result = benchmark(lambda: gla_plugin.before_dataset_index(dict(document)))
+
+    assert "<script>" not in result["notes"]
+
+
+@pytest.mark.usefixtures("with_plugins")
+def test_after_dataset_search(benchmark, gla_plugin, datasets, fake_solr_server, test_request_context):
+    page = [dict(d, index_id=f"bench-{d['id']}") for d in datasets[:20]]
+    solr_response = fake_solr_server.response({"q": ["housing"], "rows": ["20"], "hl": ["on"]})
+    search_results = {
+        "count": len(datasets),
+        "results": page,
+        "highlighting": solr_response["highlighting"],
+        "search_facets": {
+            "private": {"title": "private", "items": [{"name": "true", "display_name": "true", "count": 3}]}
+        },
+    }
+
+    def setup():
+        return (copy.deepcopy(search_results), {"q": "housing"}), {}
+
+    with test_request_context("/dataset?q=housing"):
+        result = benchmark.pedantic(gla_plugin.after_dataset_search, setup=setup, rounds=100)
+
+    assert result["search_facets"]["private"]["items"][0]["display_name"] == "Private"
+
+
+@pytest.mark.usefixtures("with_plugins")
+def test_before_dataset_view(benchmark, gla_plugin, large_dataset, test_request_context):
+    def setup():
+        return (copy.deepcopy(large_dataset),), {}
+
+    with test_request_context("/dataset"):
+        result = benchmark.pedantic(gla_plugin.before_dataset_view, setup=setup, rounds=100)
+
+    assert result["gla_result_summary"]
+
+
+def test_filtered_facets(benchmark, fake_solr_server, test_request_context):
+    facets = {field: dict(counts) for field, counts in fake_solr_server.facet_counts.items()}
+    for counts in facets.values():
+        counts.update({f"empty-{i}": 0 for i in range(200)})
+
+    with test_request_context("/dataset?organization=org-1&res_format=CSV"):
+        result = benchmark(filtered_facets, facets)
+
+    assert all(count > 0 for count in result["update_frequency"].values())
@@ -0,0 +1,72 @@
+import pytest
+from ckan import authz, model
+from ckan.tests import factories
+
+from ckanext.gla import auth
+
+pytestmark = pytest.mark.usefixtures("clean_db")
+
+
+def test_get_user_by_login_matches_the_name_or_email_ignoring_case():
+    user = factories.User(name="jane", email="Jane.Doe@example.com")
+    assert auth.get_user_by_login("JANE").id == user["id"]
+    assert auth.get_user_by_login("jane.doe@EXAMPLE.com").id == user["id"]
+
+
+def test_get_user_by_login_without_a_match():
+    factories.User(name="jane", email="jane@example.com")
+    assert auth.get_user_by_login("john@example.com") is None
+    assert auth.get_user_by_login("") is None
+
+
+def test_get_user_by_login_prefers_a_name_match_over_an_email_match():
+    by_email = factories.User(name="someone")
+    by_name = factories.User(name="shared")
+    # The model doesn't validate emails, so one can equal another's name
+    user = model.User.get(by_email["id"])
+    user.email = "Shared"
+    model.Session.commit()
+
+    assert auth.get_user_by_login("shared").id == by_name["id"]
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_sysadmin_checks_are_memoised_for_the_request(monkeypatch):
+    checked = []
+
+    def is_sysadmin(user_name):
+        checked.append(user_name)
+        return user_name == "admin"
+
+    monkeypatch.setattr(authz, "is_sysadmin", is_sysadmin)
+    assert auth.is_sysadmin("admin")
+    assert auth.is_sysadmin("admin")
+    assert not auth.is_sysadmin("jane")
+    assert not auth.is_sysadmin("jane")
+    assert checked == ["admin", "jane"]
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_user_show_is_limited_to_the_users_own_profile():
+    jane = factories.User()
+    john = factories.User()
+    sysadmin = factories.Sysadmin()
+
+    assert auth.user_show({"user": jane["name"]}, {"id": jane["id"]})["success"]
+    assert auth.user_show({"user": jane["name"]}, {"id": jane["name"]})["success"]
+    assert not auth.user_show({"user": jane["name"]}, {"id": john["id"]})["success"]
+    assert not auth.user_show({"user": jane["name"]}, {"id": "missing"})["success"]
+    assert auth.user_show({"user": sysadmin["name"]}, {"id": john["id"]})["success"]
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_user_list_is_limited_to_sysadmins_and_organisation_admins():
+    user = factories.User()
+    admin = factories.User()
+    factories.Organization(users=[{"name": admin["name"], "capacity": "admin"}])
+    sysadmin = factories.Sysadmin()
+
+    assert not auth.user_list({"user": user["name"]})["success"]
+    assert not auth.user_list({"user": None})["success"]
+    assert auth.user_list({"user": admin["name"]})["success"]
+    assert auth.user_list({"user": sysadmin["name"]})["success"]
@@ -0,0 +1,51 @@
+from ckanext.gla.cache import BoundedCache, caches
+
+
+def test_get_and_set():
+    cache = BoundedCache("test_get_and_set", max_entries=2)
+    assert cache.get("a") is None
+    assert cache.get("a", "default") == "default"
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+
+def test_evicts_least_recently_used_entries():
+    cache = BoundedCache("test_evicts", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert len(cache) == 2
+
+
+def test_bounded_by_bytes():
+    cache = BoundedCache("test_bytes", max_entries=100, max_bytes=10, sizeof=len)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.set("c", "123")
+    assert cache.get("a") is None
+    assert cache.bytes == 8
+    # Values bigger than the whole cache aren't kept
+    cache.set("d", "12345678901")
+    assert cache.get("d") is None
+    assert cache.stats() == {"entries": 2, "max_entries": 100, "bytes": 8, "max_bytes": 10}
+
+
+def test_replacing_and_deleting_keep_the_size():
+    cache = BoundedCache("test_replace", max_entries=10, max_bytes=100, sizeof=len)
+    cache.set("a", "12345")
+    cache.set("a", "12")
+    assert cache.bytes == 2
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.bytes == 0
+    cache.set("b", "1")
+    cache.clear()
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+def test_registered_by_name():
+    cache = BoundedCache("test_registered", max_entries=1)
+    assert caches()["test_registered"] is cache
@@ -0,0 +1,73 @@
+import pytest
+from ckan import model
+from ckan.tests import factories, helpers
+
+from ckanext.gla import index_generation
+
+pytestmark = [
+    pytest.mark.ckan_config("ckan.plugins", "gla"),
+    pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index", "clean_redis"),
+]
+
+
+def test_dataset_pages_answer_304_until_the_dataset_is_reindexed(app):
+    dataset = factories.Dataset()
+    url = f"/dataset/{dataset['name']}"
+
+    etag = app.get(url, status=200).headers["ETag"]
+    app.get(url, headers={"If-None-Match": etag}, status=304)
+
+    helpers.call_action("package_patch", id=dataset["id"], notes="Edited")
+    response = app.get(url, headers={"If-None-Match": etag}, status=200)
+    assert response.headers["ETag"] != etag
+
+
+def test_anonymous_dataset_pages_honour_if_modified_since(app):
+    dataset = factories.Dataset()
+    url = f"/dataset/{dataset['name']}"
+
+    last_modified = app.get(url, status=200).headers["Last-Modified"]
+    app.get(url, headers={"If-Modified-Since": last_modified}, status=304)
+
+
+def test_package_search_answers_304_until_the_index_changes(app):
+    factories.Dataset()
+    url = "/api/action/package_search"
+
+    etag = app.get(url, status=200).headers["ETag"]
+    app.get(url, headers={"If-None-Match": etag}, status=304)
+
+    factories.Dataset()
+    response = app.get(url, headers={"If-None-Match": etag}, status=200)
+    assert response.headers["ETag"] != etag
+    assert response.json["result"]["count"] == 2
+
+
+def test_etags_depend_on_the_user(app):
+    user = factories.User()
+    token = factories.APIToken(user=user["name"])["token"]
+    url = "/api/action/package_search"
+
+    anonymous = app.get(url, status=200).headers["ETag"]
+    app.get(url, headers={"If-None-Match": anonymous, "Authorization": token}, status=200)
+
+
+def test_the_generation_is_bumped_before_and_after_an_index_write():
+    start = index_generation.current()
+
+    index_generation.indexing("dataset-id")
+    assert index_generation.current() == start + 1
+    assert index_generation.dataset_indexed_at("dataset-id") > 0
+
+    index_generation.committed()
+    assert index_generation.current() == start + 2
+    # Only datasets written since the last commit are bumped again
+    index_generation.committed()
+    assert index_generation.current() == start + 2
+
+
+def test_database_commits_bump_the_datasets_being_indexed():
+    start = index_generation.current()
+    index_generation.indexing("dataset-id")
+    model.Session.commit()
+    assert index_generation.current() == start + 2
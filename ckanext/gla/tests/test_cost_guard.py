@@ -0,0 +1,65 @@
+import pytest
+
+from ckanext.gla import cost_guard
+
+pytestmark = pytest.mark.ckan_config("search.facets.limit", 50)
+
+
+def test_score_counts_rows_and_highlighting():
+    assert cost_guard.score({"rows": 10}) == pytest.approx(1)
+    assert cost_guard.score({"rows": 10, "hl": "on"}) == pytest.approx(3)
+
+
+def test_score_counts_the_offset():
+    assert cost_guard.score({"rows": 0, "start": 5000}) == pytest.approx(50)
+
+
+@pytest.mark.parametrize(
+    "params, cost",
+    [
+        # dismax ignores wildcards in an unfielded query
+        ({"q": "hous*"}, 0),
+        ({"q": "*:*"}, 0),
+        ({"q": "title:hous*"}, cost_guard.WILDCARD_COST),
+        ({"q": "title:*ousing"}, cost_guard.LEADING_WILDCARD_COST),
+        ({"q": "hous*", "defType": "edismax"}, cost_guard.WILDCARD_COST),
+        ({"fq": "name:ab* tags:*x"}, cost_guard.WILDCARD_COST + cost_guard.LEADING_WILDCARD_COST),
+        # Unbounded ranges and local parameters aren't wildcards
+        ({"fq": "{!tag=ranges}dfl_total_size:[* TO 100]"}, 0),
+    ],
+)
+def test_score_counts_wildcards(params, cost):
+    assert cost_guard.score(dict(params, rows=0)) == pytest.approx(cost)
+
+
+def test_score_counts_facets():
+    params = {"rows": 0, "facet.field": ["tags", "organization"], "facet.limit": 100}
+    assert cost_guard.score(params) == pytest.approx(2 * (1 + 1))
+    params["facet.limit"] = -1
+    assert cost_guard.score(params) == pytest.approx(2 * (1 + 100))
+    params["facet"] = "false"
+    assert cost_guard.score(params) == 0
+
+
+def test_make_cheaper_drops_highlighting_first():
+    params = {"rows": 1000, "hl": "on", "hl.fl": "title", "f.notes_hl.hl.requireFieldMatch": "false"}
+    assert cost_guard.make_cheaper(params, 150) == ["highlighting dropped"]
+    assert params == {"rows": 1000}
+
+
+def test_make_cheaper_caps_facets():
+    params = {"rows": 10, "hl": "on", "facet.field": ["tags"], "facet.limit": -1}
+    assert cost_guard.make_cheaper(params, 5) == ["highlighting dropped", "facet.limit capped to 50"]
+    assert params["facet.limit"] == 50
+
+
+def test_make_cheaper_never_changes_rows():
+    params = {"rows": 1000, "start": 0}
+    assert cost_guard.make_cheaper(params, 10) == []
+    assert params == {"rows": 1000, "start": 0}
+
+
+def test_make_cheaper_leaves_cheap_searches_alone():
+    params = {"rows": 10, "hl": "on"}
+    assert cost_guard.make_cheaper(params, 150) == []
+    assert params["hl"] == "on"
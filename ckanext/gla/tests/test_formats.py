@@ -0,0 +1,50 @@
+import pytest
+
+from ckanext.gla import formats
+
+
+@pytest.fixture
+def registry():
+    return formats.FormatRegistry(
+        {"Tables": ["CSV", "xlsx"], "Reports": ["PDF", "csv"], "Geospatial": []}
+    )
+
+
+@pytest.mark.parametrize(
+    "raw, name",
+    [
+        ("CSV", "csv"),
+        (".csv", "csv"),
+        ("text/csv; charset=utf-8", "csv"),
+        ("Spreadsheet", "xls"),
+        (" JPEG ", "jpg"),
+        ("shapefile", "shapefile"),
+    ],
+)
+def test_normalise(raw, name):
+    assert formats.normalise(raw) == name
+
+
+def test_lookup_groups_normalised_formats(registry):
+    assert registry.lookup("text/csv") == formats.Format("csv", "Tables")
+    assert registry.lookup("application/pdf") == formats.Format("pdf", "Reports")
+    assert registry.lookup("shp") == formats.Format("shp", None)
+
+
+def test_first_group_listing_a_format_wins(registry):
+    assert registry.lookup("csv").group == "Tables"
+
+
+def test_groups_are_unique_in_order_of_appearance(registry):
+    assert registry.groups(["pdf", "", "csv", "PDF", "shp"]) == ["Reports", "Tables"]
+
+
+# As normalised by CKAN from the declared list options
+@pytest.mark.ckan_config("ckan.harvesters.table_formats", ["csv", "xlsx"])
+@pytest.mark.ckan_config("ckan.harvesters.report_formats", ["pdf"])
+def test_registry_reads_the_declared_list_options(ckan_config):
+    formats.registry.cache_clear()
+    try:
+        assert formats.registry().groups(["XLSX", "pdf"]) == ["Tables", "Reports"]
+    finally:
+        formats.registry.cache_clear()
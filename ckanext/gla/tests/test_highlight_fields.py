@@ -0,0 +1,59 @@
+import pytest
+
+from ckanext.gla.search_highlight import fields
+
+
+@pytest.mark.parametrize(
+    "text, limit, trimmed",
+    [
+        ("Short enough.", 20, "Short enough."),
+        ("First sentence. Second sentence. Third.", 20, "First sentence."),
+        ("First sentence. Second sentence. Third.", 33, "First sentence. Second sentence."),
+        ("Hi there. Next", 9, "Hi there."),
+        ("Line one\nLine two", 12, "Line one"),
+        # Without a sentence end, whole words, then characters
+        ("one two three four", 10, "one two"),
+        ("abcdefghijkl", 5, "abcde"),
+        # Dots inside a sentence don't end it
+        ("Version 2.5 is out. More", 16, "Version 2.5 is"),
+    ],
+)
+def test_trim(text, limit, trimmed):
+    assert fields.trim(text, limit) == trimmed
+
+
+@pytest.mark.ckan_config("dfl.search.highlight-max-chars", 20)
+def test_index_fields_copies_each_field_trimmed():
+    copies = fields.index_fields(
+        {
+            "title": "London Housing",
+            "notes": "Rents by borough. Prices by ward.",
+            "search_description": "",
+        }
+    )
+    assert copies == {
+        "title_phrase_hl": "London Housing",
+        "notes_hl": "Rents by borough.",
+        "notes_phrase_hl": "Rents by borough.",
+    }
+
+
+@pytest.mark.ckan_config("dfl.search.highlight-max-chars", 20)
+def test_search_params_highlight_the_copies():
+    params = fields.search_params()
+    assert params["hl.fl"].split(",") == [
+        "title",
+        "title_phrase_hl",
+        "notes_hl",
+        "notes_phrase_hl",
+        "search_description_hl",
+        "search_description_phrase_hl",
+    ]
+    assert params["hl.maxAnalyzedChars"] == "20"
+    assert params["f.notes_hl.hl.requireFieldMatch"] == "false"
+    assert "f.title.hl.requireFieldMatch" not in params
+
+
+def test_field_types():
+    assert fields.field_type("notes_hl") == "text"
+    assert fields.field_type("notes_phrase_hl") == "text_phrase_query"
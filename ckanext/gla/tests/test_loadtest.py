@@ -0,0 +1,81 @@
+import pytest
+from ckan.cli.cli import ckan
+
+from ckanext.gla import loadtest, search
+from ckanext.gla.search_highlight.action import GLA_DATASET_FACETS
+
+
+@pytest.mark.parametrize(
+    "args, name",
+    [
+        ({}, "browse"),
+        ({"organization": "gla"}, "browse+filters"),
+        ({"q": "housing"}, "keyword"),
+        ({"q": "housing", "sort": "score desc"}, "keyword"),
+        ({"q": "housing", "tags": "rent"}, "keyword+filters"),
+        ({"q": '"house prices"'}, "phrase"),
+        ({"q": '"house prices"', "res_format": "CSV"}, "phrase+filters"),
+    ],
+)
+def test_query_class(args, name):
+    assert loadtest.query_class(args) == name
+
+
+def test_percentiles():
+    stats = loadtest.ClassStats(latencies=[float(i) for i in range(100, 0, -1)])
+    assert stats.percentile(50) == 50
+    assert stats.percentile(99) == 99
+    assert stats.percentile(100) == 100
+    assert loadtest.ClassStats().percentile(50) is None
+
+
+def test_report_per_query_class(monkeypatch):
+    def search_in_process(app, args):
+        if args.get("q") == "broken":
+            raise RuntimeError("Solr error")
+
+    monkeypatch.setattr(loadtest, "search_in_process", search_in_process)
+    test = loadtest.LoadTest(
+        [{"q": "housing"}, {"q": "broken"}, {}], rate=1000, concurrency=2, total=6
+    )
+    test.run()
+
+    rows = {row["class"]: row for row in test.report()}
+    assert rows["keyword"]["requests"] == 4
+    assert rows["keyword"]["error_rate"] == 0.5
+    assert rows["browse"]["requests"] == 2
+    assert rows["browse"]["error_rate"] == 0
+    assert rows["all"]["requests"] == 6
+    assert rows["all"]["error_rate"] == pytest.approx(2 / 6)
+
+
+def test_nothing_to_replay():
+    with pytest.raises(ValueError):
+        loadtest.LoadTest([], rate=1, concurrency=1, total=1)
+
+
+def test_logged_search_args():
+    row = {"query": "housing", "sort": "None", "org": "gla", "tags": "", "format": "CSV", "licence": "None"}
+    assert search.logged_search_args(row) == {"q": "housing", "organization": "gla", "res_format": "CSV"}
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins", "with_request_context")
+def test_package_search_data_dict_follows_the_search_page():
+    data_dict = loadtest.package_search_data_dict(
+        {"q": "housing", "organization": "gla", "tags": "", "ext_size_min": "10", "_hidden": "1", "page": "3"}
+    )
+    assert data_dict["q"] == "housing"
+    assert data_dict["fq"] == 'organization:"gla" +dataset_type:dataset'
+    assert data_dict["extras"] == {"ext_size_min": "10"}
+    assert data_dict["start"] == 2 * data_dict["rows"]
+    assert data_dict["facet.field"] == list(GLA_DATASET_FACETS)
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins")
+def test_loadtest_command_reports_a_missing_log(cli, tmp_path):
+    result = cli.invoke(ckan, ["gla", "loadtest", "--log-file", str(tmp_path / "missing.csv")])
+    assert result.exit_code == 1
+    assert "not found" in result.output
+    assert "Traceback" not in result.output
@@ -0,0 +1,94 @@
+import json
+import sys
+import time
+import tracemalloc
+
+import pytest
+from ckan.common import config
+from ckan.lib.redis import connect_to_redis
+from ckan.tests import factories
+
+from ckanext.gla import memory
+
+
+def test_deep_sizeof_follows_references_once():
+    shared = ["x" * 1000]
+    nested = {"a": shared, "b": shared}
+
+    assert memory.deep_sizeof(shared) >= sys.getsizeof(shared) + sys.getsizeof(shared[0])
+    assert memory.deep_sizeof(nested) == sys.getsizeof(nested) + memory.deep_sizeof(shared)
+
+
+def test_deep_sizeof_skips_shared_objects():
+    assert memory.deep_sizeof([memory, memory.deep_sizeof, dict]) == sys.getsizeof(
+        [memory, memory.deep_sizeof, dict]
+    )
+
+
+def test_caches_are_only_measured_on_request():
+    sizes = memory.cache_sizes()
+    assert all("entries" in stats for stats in sizes.values())
+    assert not any("deep_bytes" in stats for stats in sizes.values())
+
+    measured = memory.cache_sizes(measure=True)
+    assert all("deep_bytes" in stats for name, stats in measured.items() if name != "format_lookups")
+
+
+@pytest.mark.parametrize(
+    "name, valid",
+    [
+        ("20260101T120000000000-12.snapshot", True),
+        ("../20260101T120000000000-12.snapshot", False),
+        ("profile.folded", False),
+    ],
+)
+def test_snapshot_names(tmp_path, monkeypatch, name, valid):
+    monkeypatch.setitem(config, "dfl.memory.snapshot-dir", str(tmp_path))
+    (tmp_path / "20260101T120000000000-12.snapshot").write_text("")
+    assert (memory.snapshot_path(name) is not None) is valid
+
+
+def test_snapshots_are_compared(tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "dfl.memory.snapshot-dir", str(tmp_path))
+    assert memory.take_snapshot() is None
+
+    tracemalloc.start(1)
+    try:
+        first = memory.take_snapshot()
+        allocated = [bytearray(1024) for _ in range(100)]
+        second = memory.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    assert memory.snapshots() == sorted([first, second], reverse=True)
+    difference = memory.diff(memory.snapshot_path(first), memory.snapshot_path(second))
+    assert difference["size_diff_bytes"] >= 100 * 1024
+    assert difference["top_differences"][0]["traceback"][0].startswith(__file__)
+    del allocated
+
+
+@pytest.mark.usefixtures("clean_redis")
+def test_workers_that_stopped_reporting_are_forgotten():
+    redis = connect_to_redis()
+    redis.hset(memory.WORKERS_REDIS_KEY, "1", json.dumps({"pid": 1, "time": time.time()}))
+    redis.hset(memory.WORKERS_REDIS_KEY, "2", json.dumps({"pid": 2, "time": 0}))
+
+    assert [worker["pid"] for worker in memory.workers()] == [1]
+    assert redis.hkeys(memory.WORKERS_REDIS_KEY) == [b"1"]
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_redis")
+def test_memory_is_only_measured_with_measure(app):
+    user_token = factories.APIToken(user=factories.User()["name"])["token"]
+    token = factories.APIToken(user=factories.Sysadmin()["name"])["token"]
+
+    app.get("/memory", headers={"Authorization": user_token}, status=403)
+
+    caches = app.get("/memory", headers={"Authorization": token}).json["worker"]["caches"]
+    assert not any("deep_bytes" in stats for stats in caches.values())
+
+    caches = app.get(
+        "/memory", query_string={"measure": "1"}, headers={"Authorization": token}
+    ).json["worker"]["caches"]
+    assert "deep_bytes" in caches["suggest_index"]
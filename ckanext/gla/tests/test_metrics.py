@@ -0,0 +1,50 @@
+import pytest
+from ckan.tests import factories, helpers
+from prometheus_client import REGISTRY
+
+from ckanext.gla import metrics
+
+
+def _searches(outcome):
+    return REGISTRY.get_sample_value("gla_package_search_total", {"outcome": outcome}) or 0
+
+
+def test_count_outcome_counts_successes_and_errors():
+    ok, error = _searches("ok"), _searches("error")
+
+    with metrics.count_outcome(metrics.PACKAGE_SEARCHES):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.count_outcome(metrics.PACKAGE_SEARCHES):
+            raise ValueError("solr is down")
+
+    assert _searches("ok") == ok + 1
+    assert _searches("error") == error + 1
+
+
+def test_exposition_is_in_the_prometheus_text_format():
+    body, content_type = metrics.exposition()
+    assert content_type.startswith("text/plain")
+    assert b"# TYPE gla_package_search_total counter" in body
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+def test_package_search_is_counted():
+    ok = _searches("ok")
+    helpers.call_action("package_search", q="housing")
+    assert _searches("ok") == ok + 1
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+def test_metrics_are_only_shown_to_sysadmins(app):
+    user = factories.User()
+    sysadmin = factories.Sysadmin()
+    user_token = factories.APIToken(user=user["name"])["token"]
+    sysadmin_token = factories.APIToken(user=sysadmin["name"])["token"]
+
+    app.get("/metrics", status=403)
+    app.get("/metrics", headers={"Authorization": user_token}, status=403)
+    response = app.get("/metrics", headers={"Authorization": sysadmin_token}, status=200)
+    assert "gla_package_search_total" in response.body
@@ -0,0 +1,62 @@
+import pytest
+from ckan.logic import ValidationError
+from ckan.tests import factories, helpers
+
+pytestmark = [
+    pytest.mark.ckan_config("ckan.plugins", "gla"),
+    pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index"),
+]
+
+
+def _show_many(ids, user=None):
+    context = {"user": user["name"], "ignore_auth": False} if user else {"ignore_auth": False}
+    return helpers.call_action("package_show_many", context, ids=ids)
+
+
+def test_results_follow_the_requested_order():
+    first = factories.Dataset()
+    second = factories.Dataset()
+
+    results = _show_many([second["name"], "missing", first["id"], second["id"]])
+
+    assert [r["id"] for r in results] == [second["name"], "missing", first["id"], second["id"]]
+    assert [r["success"] for r in results] == [True, False, True, True]
+    assert results[0]["result"]["id"] == second["id"]
+    assert results[1]["error"] == "Not found"
+    assert results[2]["result"]["name"] == first["name"]
+
+
+def test_ids_can_be_comma_separated():
+    dataset = factories.Dataset()
+    results = _show_many(f"{dataset['name']},,missing")
+    assert [r["success"] for r in results] == [True, False]
+
+
+def test_deleted_and_invisible_datasets_are_not_found():
+    member = factories.User()
+    org = factories.Organization(users=[{"name": member["name"], "capacity": "member"}])
+    private = factories.Dataset(owner_org=org["id"], private=True)
+    deleted = factories.Dataset()
+    helpers.call_action("package_delete", id=deleted["id"])
+
+    assert [r["success"] for r in _show_many([private["id"], deleted["id"]])] == [False, False]
+    assert [r["success"] for r in _show_many([private["id"]], user=member)] == [True]
+
+
+def test_invalid_references_are_not_found():
+    assert _show_many(['bad"id', "a b"]) == [
+        {"id": 'bad"id', "success": False, "error": "Not found"},
+        {"id": "a b", "success": False, "error": "Not found"},
+    ]
+
+
+@pytest.mark.parametrize("ids", [None, [], "", {"id": "a"}, ["a", 1], [["a"]]])
+def test_ids_must_be_a_list_of_strings(ids):
+    with pytest.raises(ValidationError):
+        _show_many(ids)
+
+
+@pytest.mark.ckan_config("dfl.package-show-many.max-ids", 2)
+def test_the_number_of_ids_is_limited():
+    with pytest.raises(ValidationError):
+        _show_many(["a", "b", "c"])
@@ -0,0 +1,67 @@
+import csv
+import math
+from datetime import datetime
+
+import pytest
+
+from ckanext.gla import popularity, search
+
+pytestmark = pytest.mark.ckan_config("dfl.popularity.half-life-days", 1)
+
+DAY = 86400
+START = datetime(2024, 1, 1).timestamp()
+
+
+def _write_clicks(path, clicks, header=True):
+    with open(path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(search.log_headers)
+        for name, at in clicks:
+            row = dict.fromkeys(search.log_headers, "")
+            row.update({"package-id": name, "time": datetime.fromtimestamp(at).strftime("%Y-%m-%d %H:%M:%S.%f")})
+            writer.writerow([row[h] for h in search.log_headers])
+
+
+def test_fold_adds_decayed_clicks(tmp_path):
+    log = tmp_path / "clicks.csv"
+    _write_clicks(log, [("housing", START), ("housing", START + DAY), ("transport", START)])
+    state = popularity.State(reference_time=START)
+
+    assert popularity.fold(state, str(log)) == {"housing", "transport"}
+    tau = DAY / math.log(2)
+    # Decayed to the second click, the first is worth half a click
+    assert state.scores["housing"] == pytest.approx(DAY / tau + math.log(1.5))
+    assert state.scores["transport"] == pytest.approx(0)
+
+
+def test_fold_only_reads_new_rows(tmp_path):
+    log = tmp_path / "clicks.csv"
+    _write_clicks(log, [("housing", START)])
+    state = popularity.State(reference_time=START)
+    popularity.fold(state, str(log))
+
+    _write_clicks(log, [("transport", START)], header=False)
+    assert popularity.fold(state, str(log)) == {"transport"}
+    assert popularity.fold(state, str(log)) == set()
+
+
+def test_fold_ignores_clicks_on_anything_but_dataset_names(tmp_path):
+    log = tmp_path / "clicks.csv"
+    _write_clicks(log, [("a,b", START), ("<script>", START), ("x" * 101, START), ("housing", START)])
+    state = popularity.State(reference_time=START)
+
+    assert popularity.fold(state, str(log)) == {"housing"}
+    assert list(state.scores) == ["housing"]
+
+
+def test_fold_without_a_log(tmp_path):
+    state = popularity.State()
+    assert popularity.fold(state, str(tmp_path / "missing.csv")) == set()
+
+
+def test_prune_forgets_scores_decayed_to_nothing():
+    state = popularity.State(reference_time=START, scores={"old": 0.0, "recent": 10.0})
+    # Seven half-lives later, one click is worth less than 1%
+    assert popularity.prune(state, now=START + 7 * DAY) == {"old"}
+    assert list(state.scores) == ["recent"]
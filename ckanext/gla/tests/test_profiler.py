@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+from ckan.common import config
+from ckan.tests import factories
+
+from ckanext.gla import auth, profiler
+
+
+def _busy(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+def test_sampler_folds_the_stacks_of_another_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=_busy, args=(stop,))
+    thread.start()
+    try:
+        sampler = profiler.Sampler(thread.ident, 0.001).start()
+        time.sleep(0.05)
+        assert sampler.stop() > 0
+    finally:
+        stop.set()
+        thread.join()
+
+    folded = sampler.folded().splitlines()
+    assert folded
+    for line in folded:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert f"{__name__}:_busy" in stack.split(";")
+
+
+@pytest.mark.parametrize(
+    "name, valid",
+    [
+        ("20260101T120000-dataset.search-12.folded", True),
+        ("../secrets.folded", False),
+        ("profile.txt", False),
+    ],
+)
+def test_profile_names(tmp_path, monkeypatch, name, valid):
+    monkeypatch.setitem(config, "dfl.profiler.dir", str(tmp_path))
+    if valid:
+        (tmp_path / name).write_text("")
+    assert (profiler.profile_path(name) is not None) is valid
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "dfl.profiler.dir", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def token():
+    sysadmin = factories.Sysadmin()
+    return auth.generate_profiling_token(sysadmin["name"])
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_redis")
+class TestProfiledRequests:
+    def test_requests_with_a_sysadmin_token_are_profiled(self, app, profiles, token):
+        response = app.get("/dataset/", headers={profiler.HEADER: token})
+        name = response.headers[profiler.RESPONSE_HEADER]
+        assert (profiles / name).exists()
+        assert profiler.profiles() == [name]
+
+    def test_tokens_are_only_read_from_the_header(self, app, profiles, token):
+        response = app.get("/dataset/", query_string={"_profile": token})
+        assert profiler.RESPONSE_HEADER not in response.headers
+
+    def test_tokens_of_other_users_are_ignored(self, app, profiles):
+        user = factories.User()
+        for token in (auth.generate_profiling_token(user["name"]), "not-a-token"):
+            response = app.get("/dataset/", headers={profiler.HEADER: token})
+            assert profiler.RESPONSE_HEADER not in response.headers
+
+    def test_only_one_request_is_profiled_per_interval(self, app, profiles, token):
+        first = app.get("/dataset/", headers={profiler.HEADER: token})
+        second = app.get("/dataset/", headers={profiler.HEADER: token})
+        assert profiler.RESPONSE_HEADER in first.headers
+        assert profiler.RESPONSE_HEADER not in second.headers
+
+    def test_nothing_is_profiled_when_disabled(self, app, token):
+        response = app.get("/dataset/", headers={profiler.HEADER: token})
+        assert profiler.RESPONSE_HEADER not in response.headers
@@ -0,0 +1,71 @@
+import pytest
+from ckan.lib.search.common import SearchQueryError
+
+from ckanext.gla import ranges
+
+
+@pytest.mark.parametrize(
+    "value, end, expected",
+    [
+        ("2019", False, "2019-01-01T00:00:00Z"),
+        ("2019", True, "2019-12-31T23:59:59Z"),
+        ("2024-02", True, "2024-02-29T23:59:59Z"),
+        ("2023-02", True, "2023-02-28T23:59:59Z"),
+        ("2021-06", False, "2021-06-01T00:00:00Z"),
+        (" 2020-03-15 ", True, "2020-03-15T23:59:59Z"),
+    ],
+)
+def test_period(value, end, expected):
+    assert ranges._period("ext_coverage_from", value, end) == expected
+
+
+@pytest.mark.parametrize("value", ["19", "2019-13", "2019-02-30", "last year", "2019-1"])
+def test_period_rejects_other_values(value):
+    with pytest.raises(SearchQueryError):
+        ranges._period("ext_coverage_from", value, end=False)
+
+
+def test_filters_find_overlapping_coverage():
+    assert ranges.filters({"ext_coverage_from": "2019", "ext_coverage_to": "2021"}) == [
+        "{!tag=ranges}"
+        "+dfl_temporal_coverage_to:[2019-01-01T00:00:00Z TO *] "
+        "+dfl_temporal_coverage_from:[* TO 2021-12-31T23:59:59Z]"
+    ]
+
+
+def test_filters_on_size():
+    assert ranges.filters({"ext_size_min": "1000"}) == ["{!tag=ranges}+dfl_total_size:[1000 TO *]"]
+    assert ranges.filters({"ext_size_min": "-5", "ext_size_max": "10"}) == [
+        "{!tag=ranges}+dfl_total_size:[0 TO 10]"
+    ]
+
+
+def test_filters_ignore_empty_and_other_parameters():
+    assert ranges.filters({"ext_coverage_from": "", "ext_bbox": "1,2,3,4"}) == []
+
+
+def test_filters_reject_invalid_sizes():
+    with pytest.raises(SearchQueryError):
+        ranges.filters({"ext_size_max": "1GB"})
+
+
+def test_index_fields():
+    fields = ranges.index_fields(
+        {
+            "resources": [
+                {"temporal_coverage_from": "2019-04-01", "temporal_coverage_to": "2020-03-31", "size": 100},
+                {"temporal_coverage_from": "2018-01-01", "size": "50"},
+                {"size": None},
+                {"size": "unknown"},
+            ]
+        }
+    )
+    assert fields == {
+        ranges.TOTAL_SIZE: 150,
+        ranges.COVERAGE_FROM: "2018-01-01T00:00:00Z",
+        ranges.COVERAGE_TO: "2020-03-31T23:59:59Z",
+    }
+
+
+def test_index_fields_without_coverage():
+    assert ranges.index_fields({"resources": []}) == {ranges.TOTAL_SIZE: 0}
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+from ckan import logic
+from ckan.lib.redis import connect_to_redis
+from ckan.tests import factories
+
+from ckanext.gla import reindex_queue
+
+pytestmark = [
+    pytest.mark.ckan_config("dfl.search.reindex-queue", True),
+    pytest.mark.ckan_config("dfl.search.reindex-delay", 5),
+    pytest.mark.usefixtures("clean_redis"),
+]
+
+
+@pytest.fixture
+def reindexed(monkeypatch):
+    package_ids = []
+    monkeypatch.setattr(reindex_queue.search, "rebuild", package_ids.append)
+    return package_ids
+
+
+def test_datasets_are_reindexed_once_they_are_due(reindexed):
+    now = time.time()
+    reindex_queue.enqueue("dataset-a")
+
+    assert reindex_queue.process(until=now) == 0
+    assert reindex_queue.process(until=now + 10) == 1
+    assert reindexed == ["dataset-a"]
+    assert reindex_queue.flush() == 0
+
+
+def test_a_burst_of_writes_is_reindexed_once(reindexed):
+    for _ in range(3):
+        reindex_queue.enqueue("dataset-a")
+    reindex_queue.enqueue("dataset-b")
+
+    assert reindex_queue.flush() == 2
+    assert sorted(reindexed) == ["dataset-a", "dataset-b"]
+
+
+def test_writes_postpone_the_reindex(reindexed):
+    reindex_queue.enqueue("dataset-a")
+    first_due = connect_to_redis().zscore(reindex_queue.REDIS_KEY, "dataset-a")
+    time.sleep(0.01)
+    reindex_queue.enqueue("dataset-a")
+    assert connect_to_redis().zscore(reindex_queue.REDIS_KEY, "dataset-a") > first_due
+
+
+def test_failures_are_retried_later(monkeypatch):
+    def rebuild(package_id):
+        raise RuntimeError("Solr is down")
+
+    monkeypatch.setattr(reindex_queue.search, "rebuild", rebuild)
+    reindex_queue.enqueue("dataset-a")
+
+    assert reindex_queue.flush() == 0
+    due = connect_to_redis().zscore(reindex_queue.REDIS_KEY, "dataset-a")
+    assert due > time.time() + reindex_queue.RETRY_DELAY - 10
+
+
+def test_purged_datasets_are_removed_from_the_index(monkeypatch):
+    removed = []
+
+    def rebuild(package_id):
+        raise logic.NotFound()
+
+    class Index:
+        def remove_dict(self, pkg_dict):
+            removed.append(pkg_dict["id"])
+
+    monkeypatch.setattr(reindex_queue.search, "rebuild", rebuild)
+    monkeypatch.setattr(reindex_queue.search, "index_for", lambda model_class: Index())
+    reindex_queue.enqueue("dataset-a")
+
+    assert reindex_queue.flush() == 1
+    assert removed == ["dataset-a"]
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+def test_dataset_writes_are_queued():
+    dataset = factories.Dataset()
+    assert connect_to_redis().zscore(reindex_queue.REDIS_KEY, dataset["id"]) is not None
@@ -0,0 +1,69 @@
+import pytest
+
+from ckanext.gla import request_cache
+
+
+class Counter:
+    def __init__(self, value="value"):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_values_are_computed_once_per_request():
+    compute = Counter()
+    assert request_cache.memoise("users", "jane", compute) == "value"
+    assert request_cache.memoise("users", "jane", compute) == "value"
+    assert compute.calls == 1
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_keys_and_namespaces_are_separate():
+    assert request_cache.memoise("users", "jane", lambda: 1) == 1
+    assert request_cache.memoise("users", "john", lambda: 2) == 2
+    assert request_cache.memoise("orgs", "jane", lambda: 3) == 3
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_none_is_only_cached_when_asked():
+    missing = Counter(None)
+    request_cache.memoise("users", "jane", missing)
+    request_cache.memoise("users", "jane", missing)
+    assert missing.calls == 2
+
+    request_cache.memoise("sysadmins", "jane", missing, cache_none=True)
+    request_cache.memoise("sysadmins", "jane", missing, cache_none=True)
+    assert missing.calls == 3
+
+
+def test_nothing_is_cached_outside_a_request():
+    compute = Counter()
+    request_cache.memoise("users", "jane", compute)
+    request_cache.memoise("users", "jane", compute)
+    assert compute.calls == 2
+
+
+def test_requests_dont_share_values(test_request_context):
+    with test_request_context():
+        assert request_cache.memoise("users", "jane", lambda: "first") == "first"
+    with test_request_context():
+        assert request_cache.memoise("users", "jane", lambda: "second") == "second"
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_forget_a_key_or_a_namespace():
+    request_cache.memoise("users", "jane", lambda: 1)
+    request_cache.memoise("users", "john", lambda: 2)
+    request_cache.memoise("orgs", "gla", lambda: 3)
+
+    request_cache.forget("users", "jane")
+    assert request_cache.memoise("users", "jane", lambda: 4) == 4
+    assert request_cache.memoise("users", "john", lambda: 5) == 2
+
+    request_cache.forget("users")
+    assert request_cache.memoise("users", "john", lambda: 6) == 6
+    assert request_cache.memoise("orgs", "gla", lambda: 7) == 3
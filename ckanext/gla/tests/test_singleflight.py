@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ckanext.gla.singleflight import SingleFlight, query_key
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"docs": [1, 2]}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flights.do, "key", fn)
+        started.wait(5)
+        followers = [executor.submit(flights.do, "key", fn) for _ in range(3)]
+        # Let the followers join the flight before it lands
+        while flights._calls["key"].followers < 3:
+            pass
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert len(calls) == 1
+    assert all(result == {"docs": [1, 2]} for result in results)
+    # Each caller gets its own copy
+    assert len({id(result) for result in results}) == 4
+
+
+def test_errors_are_shared():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("solr is down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flights.do, "key", fail)
+        started.wait(5)
+        follower = executor.submit(flights.do, "key", fail)
+        while flights._calls["key"].followers < 1:
+            pass
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_later_calls_start_a_new_flight():
+    flights = SingleFlight()
+    assert flights.do("key", lambda: 1) == 1
+    assert flights.do("key", lambda: 2) == 2
+    assert flights._calls == {}
+
+
+
+def test_query_key_ignores_parameter_order():
+    assert query_key({"q": "a", "rows": 10}) == query_key({"rows": 10, "q": "a"})
+    assert query_key({"q": "a"}) != query_key({"q": "b"})
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from ckanext.gla import slow_log
+
+
+@pytest.fixture
+def written(monkeypatch):
+    entries = []
+    monkeypatch.setattr(slow_log, "_write", lambda search, wall_ms, context: entries.append(dict(search)))
+    return entries
+
+
+def _search(params=None, **results):
+    with slow_log.watch({"user": ""}):
+        slow_log.record_params(params or {"q": "housing"})
+        if results:
+            slow_log.record_query(params or {"q": "housing"}, **results)
+
+
+@pytest.mark.ckan_config("dfl.search.slow-log", "")
+def test_nothing_is_logged_when_disabled(written):
+    _search()
+    assert written == []
+
+
+@pytest.mark.ckan_config("dfl.search.slow-log", "slow.log")
+@pytest.mark.ckan_config("dfl.search.slow-log-threshold", 0)
+def test_searches_over_the_threshold_are_logged(written):
+    _search(
+        {"q": "housing", "fq": "+capacity:public"},
+        qtime=12,
+        hits=3,
+        rows=10,
+        facets={"tags": ["a", "b"], "groups": ["c"]},
+    )
+    assert written == [
+        {
+            "params": {"q": "housing", "fq": "+capacity:public"},
+            "qtime_ms": 12,
+            "hits": 3,
+            "rows": 10,
+            "facet_values": 3,
+        }
+    ]
+
+
+@pytest.mark.ckan_config("dfl.search.slow-log", "slow.log")
+@pytest.mark.ckan_config("dfl.search.slow-log-threshold", 60000)
+def test_fast_searches_are_not_logged(written):
+    _search(qtime=1, hits=0, rows=10, facets={})
+    assert written == []
+
+
+@pytest.mark.ckan_config("dfl.search.slow-log", "slow.log")
+@pytest.mark.ckan_config("dfl.search.slow-log-threshold", 0)
+def test_searches_that_never_reach_solr_are_not_logged(written):
+    with slow_log.watch({}):
+        pass
+    assert written == []
+
+
+@pytest.mark.ckan_config("dfl.search.slow-log", "slow.log")
+@pytest.mark.ckan_config("dfl.search.slow-log-threshold", 0)
+def test_failed_and_stale_searches_are_flagged(written):
+    with pytest.raises(TimeoutError):
+        with slow_log.watch({}):
+            slow_log.record_params({"q": "housing"})
+            raise TimeoutError("deadline")
+    _search(qtime=None, hits=1, rows=10, facets={}, stale=True)
+
+    assert written[0]["error"] == "TimeoutError('deadline')"
+    assert written[0]["qtime_ms"] is None
+    assert written[1]["stale"] is True
+
+
+def test_nothing_is_recorded_outside_a_watched_search(written):
+    slow_log.record_params({"q": "housing"})
+    slow_log.record_query({"q": "housing"}, 1, 0, 10, {})
+    assert written == []
+
+
+def test_find_searches_the_rotated_files(tmp_path, monkeypatch):
+    path = tmp_path / "slow.log"
+    path.write_text(json.dumps({"id": "current", "params": {}}) + "\n")
+    (tmp_path / "slow.log.2").write_text(
+        json.dumps({"id": "other", "params": {"q": "current"}}) + "\n"
+        + json.dumps({"id": "rotated", "params": {"q": "housing"}}) + "\n"
+    )
+
+    monkeypatch.setitem(slow_log.config, "dfl.search.slow-log", str(path))
+    assert slow_log.find("rotated")["params"] == {"q": "housing"}
+    assert slow_log.find("current")["id"] == "current"
+    assert slow_log.find("missing") is None
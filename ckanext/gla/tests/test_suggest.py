@@ -0,0 +1,54 @@
+import pytest
+
+from ckanext.gla.suggest import PrefixIndex, Suggestion, normalise
+
+
+@pytest.fixture
+def index():
+    index = PrefixIndex()
+    index.put("dataset:1", Suggestion("dataset", "housing", "London Housing Statistics"), ["public"])
+    index.put("dataset:2", Suggestion("dataset", "house-prices", "House prices by borough"), ["org-a"])
+    index.put("organization:gla", Suggestion("organization", "gla", "Greater London Authority"))
+    return index
+
+
+def _names(suggestions):
+    return [s.name for s in suggestions]
+
+
+def test_normalise():
+    assert normalise("  House-Prices_2024! ") == "house prices 2024"
+
+
+def test_matches_the_start_of_any_word(index):
+    assert _names(index.search("hous", None, 10)) == ["house-prices", "housing"]
+    assert _names(index.search("authority", None, 10)) == ["gla"]
+
+
+def test_text_starting_with_the_prefix_ranks_first(index):
+    # "Greater London..." and "London Housing..." both match
+    assert _names(index.search("lon", None, 10))[0] == "housing"
+
+
+def test_filters_by_labels(index):
+    assert _names(index.search("hous", {"public"}, 10)) == ["housing"]
+    # Entries without labels can be seen by everyone
+    assert _names(index.search("greater", {"public"}, 10)) == ["gla"]
+
+
+def test_limit(index):
+    assert len(index.search("hous", None, 1)) == 1
+
+
+def test_put_replaces_and_remove_forgets(index):
+    index.put("dataset:1", Suggestion("dataset", "housing", "Rents"), ["public"])
+    assert _names(index.search("hous", None, 10)) == ["house-prices"]
+    assert _names(index.search("rents", None, 10)) == ["housing"]
+
+    index.remove("dataset:1")
+    assert index.search("rents", None, 10) == []
+    assert len(index) == 2
+
+
+def test_empty_prefix(index):
+    assert index.search(" - ", None, 10) == []
@@ -0,0 +1,36 @@
+from unittest import mock
+
+import pytest
+
+from ckanext.gla import warm
+from ckanext.gla.search_highlight.query import PatchedPackageSearchQuery
+
+SEARCH = {"q": "housing", "organization": "gla", "res_format": "CSV", "sort": "metadata_modified desc"}
+
+
+@pytest.fixture
+def solr_queries():
+    queries = []
+    search = PatchedPackageSearchQuery._search
+
+    def record(self, conn, query):
+        queries.append(dict(query))
+        return search(self, conn, query)
+
+    with mock.patch.object(PatchedPackageSearchQuery, "_search", record):
+        yield queries
+
+
+@pytest.mark.ckan_config("ckan.plugins", "gla")
+@pytest.mark.usefixtures("with_plugins", "clean_index")
+def test_warmed_searches_send_what_the_search_page_sends(app, solr_queries):
+    app.get("/dataset/", query_string=SEARCH)
+    page_queries = list(solr_queries)
+    del solr_queries[:]
+
+    warm._replay(app.flask_app, SEARCH)
+
+    assert len(solr_queries) == 1
+    assert solr_queries[0] in page_queries
+    # The multi-select filters of the search page
+    assert any(fq.startswith("{!tag=organization}") for fq in solr_queries[0]["fq"])
@@ -0,0 +1,105 @@
+"""
+Lightweight span timing for the search pipeline.
+
+Code wraps interesting stages in ``with timing.span("stage"):``. Every
+span is aggregated into a per-process histogram for that stage, and
+when a caller has opened a ``timing.collect()`` block the individual
+spans are also recorded there, giving a per-query breakdown (this is
+what the ``debug_dataset_search`` action returns when asked for
+timings). Spans are also exported to Prometheus, see metrics.py.
+"""
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Iterator, Optional
+
+from .metrics import BUCKETS, SEARCH_STAGE_SECONDS
+
+_collector: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar(
+    "gla_timing_collector", default=None
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                cumulative += count
+                buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+            return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+_histograms: dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _histogram(stage: str) -> Histogram:
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    return histogram
+
+
+def record(stage: str, seconds: float) -> None:
+    """Record a duration for a stage that was timed elsewhere, e.g.
+    Solr's own QTime."""
+    _histogram(stage).observe(seconds)
+    SEARCH_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    spans = _collector.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, perf_counter() - start)
+
+
+@contextmanager
+def collect() -> Iterator[list[tuple[str, float]]]:
+    """Collect every span recorded inside the block, in order."""
+    spans: list[tuple[str, float]] = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+
+def summarise(spans: list[tuple[str, float]]) -> dict[str, dict[str, Any]]:
+    """Group collected spans by stage, with times in milliseconds."""
+    summary: dict[str, dict[str, Any]] = {}
+    for stage, seconds in spans:
+        stage_summary = summary.setdefault(stage, {"count": 0, "total_ms": 0.0})
+        stage_summary["count"] += 1
+        stage_summary["total_ms"] += seconds * 1000
+    return summary
+
+
+def histograms() -> dict[str, dict[str, Any]]:
+    # New stages may be added by other threads while we iterate
+    with _histograms_lock:
+        stages = sorted(_histograms.items())
+    return {stage: histogram.snapshot() for stage, histogram in stages}
@@ -15,7 +15,7 @@ from ckan.views.user import RegisterView
 import sqlalchemy as sa
 from sqlalchemy.sql import exists
 
-from .auth import is_email_verified
+from .auth import get_user_by_login, is_email_verified, is_sysadmin
 from . import email
 
 
@@ -42,7 +42,7 @@ def clean_up_errors(e: logic.ValidationError):
         e.error_dict[k][0] = '. '.join(deduped_v)
 
 def send_verification_link_to_email(user_email):
-    user_obj = model.User.by_email(user_email)
+    user_obj = get_user_by_login(user_email)
     email.send_email_verification_link(user_obj)
 
 class GlaRegisterView(RegisterView):
@@ -96,7 +96,7 @@ class GlaRegisterView(RegisterView):
                 (data_dict[u'name'],
                  user))
             
-            if authz.is_sysadmin(user):
+            if is_sysadmin(user):
                 # the sysadmin created a new user. We redirect him to the
                 # activity page for the newly created user
                 if "activity" in g.plugins:
@@ -10,17 +10,24 @@ import ckan.logic as logic
 import ckan.model as model
 import ckan.plugins.toolkit as tk
 from ckan import authz
-from ckan.common import _, current_user, g
+from ckan.common import _, asbool, current_user, g
+from ckan.lib.search import SearchError
 from ckan.types import Context
-from flask import Blueprint, send_file
+from flask import Blueprint, Response, request, send_file, stream_with_context
 from itsdangerous.exc import SignatureExpired, BadData
-from . import auth, email
+from . import auth, conditional, email, export, memory, metrics, profiler, reindex_queue, suggest, warm
+from .search_highlight import action as search_highlight_action
 log = logging.getLogger(__name__)
 
 favourites = Blueprint("favourites_blueprint", __name__)
 users = Blueprint("users_blueprint", __name__)
 search_log_download = Blueprint("search_log_download_blueprint", __name__)
+metrics_blueprint = Blueprint("metrics_blueprint", __name__)
+dataset_export = Blueprint("dataset_export_blueprint", __name__)
 undelete = Blueprint("undelete_blueprint", __name__)
+search_suggest = Blueprint("search_suggest_blueprint", __name__)
+profile_download = Blueprint("profile_download_blueprint", __name__)
+memory_blueprint = Blueprint("memory_blueprint", __name__)
 
 # Note this expiry time is measured in seconds
 # Default is 2 days
@@ -74,7 +81,7 @@ def _extra_template_variables(
 ) -> dict[str, Any]:
     is_sysadmin = False
     if current_user.is_authenticated:
-        is_sysadmin = authz.is_sysadmin(current_user.name)
+        is_sysadmin = auth.is_sysadmin(current_user.name)
     try:
         user_dict = tk.get_action("user_show")(context, data_dict)
     # Catch NotAuthorized and NotFound and return 403 for both:
@@ -153,7 +160,7 @@ def verify_user(token, expiration=EMAIL_VERIFICATION_TOKEN_EXPIRY):
     except SignatureExpired as e:
         user_email = auth.read_email_from_token(token,max_age=None)
 
-        user_obj = model.User.by_email(user_email)
+        user_obj = auth.get_user_by_login(user_email)
         if user_obj:
             email.send_email_verification_link(user_obj)
             h.flash_error("Your email verification link has expired. A new verification link has been sent to your email address, please check your inbox, and click it.")
@@ -183,13 +190,19 @@ users.add_url_rule(
 
 ## Download routes:
 
-def get_server_search_logs():
+def _abort_unless_sysadmin():
+    # current_user is also populated from API tokens, so sysadmin
+    # tokens can be used to script access to these routes.
     if not current_user.is_authenticated:
         base.abort(403, _("Not authorized to see this page"))
 
-    if not authz.is_sysadmin(current_user.name):
+    if not auth.is_sysadmin(current_user.name):
         base.abort(403, _("Not authorized to see this page"))
 
+
+def get_server_search_logs():
+    _abort_unless_sysadmin()
+
     if not exists("/srv/app/search_logs.csv"):
         base.abort(404, _("Log file not found"))
     return send_file(
@@ -202,6 +215,160 @@ search_log_download.add_url_rule(
 )
 
 
+def get_metrics():
+    _abort_unless_sysadmin()
+
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
+metrics_blueprint.add_url_rule("/metrics", methods=["GET"], view_func=get_metrics)
+
+
+def _abort_unless_profiling():
+    _abort_unless_sysadmin()
+    if not profiler.enabled():
+        base.abort(404, _("Profiling is not enabled"))
+
+
+def get_profiling_token():
+    _abort_unless_profiling()
+    return {
+        "token": auth.generate_profiling_token(current_user.name),
+        "header": profiler.HEADER,
+        "expires_in": profiler.TOKEN_MAX_AGE,
+    }
+
+
+def list_profiles():
+    _abort_unless_profiling()
+    return {"profiles": profiler.profiles()}
+
+
+def get_profile(name):
+    _abort_unless_profiling()
+    path = profiler.profile_path(name)
+    if path is None:
+        base.abort(404, _("Profile not found"))
+    return send_file(path, mimetype="text/plain", as_attachment=True)
+
+
+profile_download.add_url_rule("/profiles", methods=["GET"], view_func=list_profiles)
+profile_download.add_url_rule("/profiles/token", methods=["GET"], view_func=get_profiling_token)
+profile_download.add_url_rule("/profiles/<name>", methods=["GET"], view_func=get_profile)
+# Samples requests sent with a profiling token
+profile_download.before_app_request(profiler.start)
+profile_download.after_app_request(profiler.finish)
+profile_download.teardown_app_request(profiler.discard)
+
+
+def _limit_arg():
+    try:
+        return max(1, min(int(request.args.get("limit", 25)), 1000))
+    except ValueError:
+        base.abort(400, _("limit must be a whole number"))
+
+
+def get_memory():
+    _abort_unless_sysadmin()
+    # Measuring walks every cached object, so only on request
+    measure = asbool(request.args.get("measure", False))
+    return {
+        "worker": memory.report(measure=measure, limit=_limit_arg()),
+        "workers": memory.workers(),
+    }
+
+
+def _abort_unless_snapshots():
+    _abort_unless_sysadmin()
+    if not memory.snapshots_enabled():
+        base.abort(404, _("Memory snapshots are not enabled"))
+
+
+def list_memory_snapshots():
+    _abort_unless_snapshots()
+    return {"snapshots": memory.snapshots(), "tracing": memory.tracing()}
+
+
+def take_memory_snapshot():
+    _abort_unless_snapshots()
+    name = memory.take_snapshot()
+    if name is None:
+        base.abort(409, _("Memory allocations are not being traced"))
+    return {"snapshot": name, "pid": os.getpid()}
+
+
+def diff_memory_snapshots(first, second):
+    _abort_unless_snapshots()
+    first_path, second_path = memory.snapshot_path(first), memory.snapshot_path(second)
+    if first_path is None or second_path is None:
+        base.abort(404, _("Snapshot not found"))
+    return memory.diff(first_path, second_path, limit=_limit_arg())
+
+
+memory_blueprint.add_url_rule("/memory", methods=["GET"], view_func=get_memory)
+memory_blueprint.add_url_rule("/memory/snapshots", methods=["GET"], view_func=list_memory_snapshots)
+memory_blueprint.add_url_rule("/memory/snapshots", methods=["POST"], view_func=take_memory_snapshot)
+memory_blueprint.add_url_rule(
+    "/memory/snapshots/<first>/diff/<second>", methods=["GET"], view_func=diff_memory_snapshots
+)
+memory_blueprint.before_app_request(memory.start_tracing)
+memory_blueprint.before_app_request(memory.publish)
+
+
+def export_datasets(fmt):
+    """Stream every dataset matching the search that the current user
+    can see, as JSON lines or CSV."""
+    context = cast(
+        Context,
+        {
+            "model": model,
+            "session": model.Session,
+            "user": current_user.name,
+            "auth_user_obj": current_user,
+        },
+    )
+    data_dict = {
+        "q": request.args.get("q", ""),
+        "fq": request.args.get("fq", ""),
+        "sort": request.args.get("sort", ""),
+        "include_private": True,
+    }
+    try:
+        # Run the first page now so access and query errors are
+        # reported before the response starts streaming
+        datasets = export.iter_datasets(context, data_dict)
+        first = next(datasets, None)
+    except logic.NotAuthorized:
+        base.abort(403, _("Not authorized to see this page"))
+    except (logic.ValidationError, SearchError):
+        base.abort(400, _("Invalid search query"))
+
+    def _datasets():
+        if first is not None:
+            yield first
+            yield from datasets
+
+    if fmt == "csv":
+        body, mimetype = export.iter_csv(_datasets()), "text/csv"
+    else:
+        body, mimetype = export.iter_jsonl(_datasets()), "application/x-ndjson"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=datasets.{fmt}"},
+    )
+
+
+dataset_export.add_url_rule(
+    "/export/datasets.<any(jsonl, csv):fmt>",
+    methods=["GET"],
+    view_func=export_datasets,
+    endpoint="export_datasets",
+)
+
+
 def undelete_package(id):
     res = tk.get_action("package_patch")(None, {"id": id, "state": "active"})
     return tk.redirect_to("dataset.read", id=id)
@@ -215,8 +382,50 @@ undelete.add_url_rule(
 )
 
 
+_SUGGESTION_URLS = {
+    "dataset": lambda name: h.url_for("dataset.read", id=name),
+    "organization": lambda name: h.url_for("organization.read", id=name),
+    "project": lambda name: h.url_for("dataset.search", project_name=name),
+}
+
+
+def suggest_search():
+    """Search box suggestions as JSON, with the URL of each. Lighter
+    than the search_suggest action, for calling on every keystroke."""
+    context = cast(Context, {"user": current_user.name, "auth_user_obj": current_user})
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        base.abort(400, _("Invalid limit"))
+    suggestions = suggest.suggest(
+        request.args.get("q", ""), search_highlight_action.permission_labels(context), limit
+    )
+    for suggestion in suggestions:
+        suggestion["url"] = _SUGGESTION_URLS[suggestion["kind"]](suggestion["name"])
+    return {"suggestions": suggestions}
+
+
+search_suggest.add_url_rule("/suggest", methods=["GET"], view_func=suggest_search)
+# Builds, and keeps current, the suggestions of each process
+search_suggest.before_app_request(suggest.start)
+
+
 lang_redirect = Blueprint("lang_redirect", __name__)
 
+# Not Modified responses and cache validators for dataset pages and
+# package_search; this blueprint has no routes of its own
+conditional_requests = Blueprint("conditional_requests", __name__)
+conditional_requests.before_app_request(conditional.check)
+conditional_requests.after_app_request(conditional.add_headers)
+
+# Starts the reindex queue worker of each process, when enabled
+reindex_worker = Blueprint("reindex_worker", __name__)
+reindex_worker.before_app_request(reindex_queue.start_worker)
+
+# Starts the cache warming thread of each process, when enabled
+warm_worker = Blueprint("warm_worker", __name__)
+warm_worker.before_app_request(warm.start_worker)
+
 lang_redirect.add_url_rule(
     "/api/i18n/en-GB",
     view_func=lambda: tk.redirect_to("/api/i18n/en_GB"),
@@ -224,4 +433,4 @@ lang_redirect.add_url_rule(
 )
 
 def get_blueprints():
-    return [favourites, users, search_log_download, undelete, lang_redirect]
+    return [favourites, users, search_log_download, metrics_blueprint, dataset_export, undelete, lang_redirect, conditional_requests, reindex_worker, search_suggest, warm_worker, profile_download, memory_blueprint]
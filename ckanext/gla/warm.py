@@ -0,0 +1,138 @@
+"""
+Warm Solr's caches with our most common searches after index changes.
+
+Each commit opens a new Solr searcher with cold query, filter and
+facet caches, so the first users after a change pay for the
+multi-select ``{!tag=...}``/``{!ex=...}`` facet queries. This replays
+the ``dfl.search.warm-queries`` most frequent searches of the search
+click log (see search.py) through package_search, in a request context
+for the dataset search page, as an anonymous user. Solr therefore
+receives exactly the parameters a visitor's search would produce,
+``fq_init_list`` and permission labels included.
+
+With ``dfl.search.warm-queries`` set, a background thread in each
+worker watches the index generation (see index_generation.py). Once it
+has been unchanged for ``dfl.search.warm-delay`` seconds, so a bulk
+reindex is warmed once at the end, one worker takes a Redis lock and
+replays the searches, at most ``dfl.search.warm-concurrency`` at a
+time. ``ckan gla warm`` does the same on demand.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from ckan.common import config
+from ckan.lib.redis import connect_to_redis
+from flask import Flask, current_app
+
+from . import index_generation, search
+from .loadtest import search_in_process
+from .metrics import WARMED_SEARCHES, count_outcome
+
+log = logging.getLogger(__name__)
+
+# The generation last warmed, and the lock held while warming
+WARMED_REDIS_KEY = "gla:warm:generation"
+LOCK_REDIS_KEY = "gla:warm:lock"
+LOCK_SECONDS = 600
+POLL_INTERVAL = 5.0
+
+_top: tuple[Optional[tuple[float, int, int]], list[dict[str, str]]] = (None, [])
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def top_searches(n: int, path: Optional[str] = None) -> list[dict[str, str]]:
+    """The request parameters of the ``n`` most frequent searches in
+    the search log, most frequent first. The log is only reread when it
+    has changed."""
+    global _top
+    path = path or search.logfile
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return []
+    version = (stat.st_mtime, stat.st_size, n)
+    if _top[0] != version:
+        counts = Counter(tuple(sorted(args.items())) for args in search.read_logged_searches(path))
+        _top = (version, [dict(args) for args, _count in counts.most_common(n)])
+    return _top[1]
+
+
+def _replay(app: Flask, args: dict[str, str]) -> None:
+    with count_outcome(WARMED_SEARCHES):
+        search_in_process(app, args)
+
+
+def warm(app: Flask, n: Optional[int] = None, concurrency: Optional[int] = None) -> int:
+    """Replay the top ``n`` searches, returning how many succeeded."""
+    searches = top_searches(n or config.get("dfl.search.warm-queries"))
+    concurrency = concurrency or config.get("dfl.search.warm-concurrency")
+    started = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="gla-warm") as executor:
+        for future in [executor.submit(_replay, app, args) for args in searches]:
+            try:
+                future.result()
+                done += 1
+            except Exception:
+                log.debug("Warming search failed", exc_info=True)
+    log.info("Warmed %d of %d searches in %.1fs", done, len(searches), time.perf_counter() - started)
+    return done
+
+
+def _warm_if_settled(app: Flask, seen: dict[str, float]) -> None:
+    generation = index_generation.current()
+    if generation is None:
+        return
+    now = time.time()
+    if seen.get("generation") != generation:
+        seen.update(generation=generation, since=now)
+        return
+    if now - seen["since"] < config.get("dfl.search.warm-delay"):
+        return
+
+    redis = connect_to_redis()
+    warmed = redis.get(WARMED_REDIS_KEY)
+    if warmed is not None and int(warmed) == generation:
+        return
+    if not redis.set(LOCK_REDIS_KEY, os.getpid(), nx=True, ex=LOCK_SECONDS):
+        return
+    try:
+        # Marked first, so a failing warm isn't retried in a loop
+        redis.set(WARMED_REDIS_KEY, generation)
+        warm(app)
+    finally:
+        redis.delete(LOCK_REDIS_KEY)
+
+
+def _run(app: Flask) -> None:
+    seen: dict[str, float] = {}
+    while True:
+        try:
+            _warm_if_settled(app, seen)
+        except Exception:
+            log.exception("Cache warming failed")
+        time.sleep(POLL_INTERVAL)
+
+
+def start_worker() -> None:
+    """Start this process's warming thread, if warming is enabled and
+    it isn't running yet. Called before each request, like the reindex
+    queue worker."""
+    global _worker
+    if _worker is not None or not config.get("dfl.search.warm-queries"):
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(
+                target=_run,
+                args=(current_app._get_current_object(),),
+                name="gla-warm",
+                daemon=True,
+            )
+            _worker.start()